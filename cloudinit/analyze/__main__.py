@@ -3,12 +3,15 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import argparse
+import io
+import itertools
 import re
 import sys
 
 from cloudinit.util import json_dumps
 from datetime import datetime
 from . import dump
+from . import history
 from . import show
 
 
@@ -61,6 +64,33 @@ def get_parser(parser=None):
                              dest='outfile', default='-',
                              help='specify where to write output.')
     parser_boot.set_defaults(action=('boot', analyze_boot))
+    parser_history = subparsers.add_parser(
+        'history', help='Record durations and report regressions across'
+                        ' boots')
+    parser_history.add_argument('-i', '--infile', action='store',
+                                dest='infile',
+                                default='/var/log/cloud-init.log',
+                                help='specify where to read input.')
+    parser_history.add_argument('-o', '--outfile', action='store',
+                                dest='outfile', default='-',
+                                help='specify where to write output.')
+    parser_history.add_argument('--history-file', action='store',
+                                dest='history_file',
+                                default=history.HISTORY_FILE,
+                                help='specify where boot history is kept.')
+    parser_history.add_argument('--no-record', action='store_false',
+                                dest='record', default=True,
+                                help='do not add boots from input to the'
+                                     ' history.')
+    parser_history.add_argument('--threshold', action='store', type=float,
+                                default=0.5,
+                                help='fraction over the median duration of'
+                                     ' earlier boots that counts as a'
+                                     ' regression.')
+    parser_history.add_argument('--min-delta', action='store', type=float,
+                                dest='min_delta', default=0.1,
+                                help='ignore regressions of fewer seconds.')
+    parser_history.set_defaults(action=('history', analyze_history))
     return parser
 
 
@@ -201,9 +231,38 @@ def analyze_dump(name, args):
     outfh.write(json_dumps(_get_events(infh)) + '\n')
 
 
+def analyze_history(name, args):
+    """Record per-boot durations and report them across boots.
+
+    Boots found in the input are added to the history file, then the p50
+    and p95 duration of every stage and module across all recorded boots
+    is printed. Those which took notably longer in the latest boot than the
+    median of earlier boots are flagged as regressed.
+    """
+    (infh, outfh) = configure_io(args)
+    boots = history.boot_durations(_get_events(infh))
+    recorded = history.load_history(args.history_file)
+    if args.record:
+        try:
+            history.record_boots(boots, args.history_file)
+        except OSError as e:
+            sys.stderr.write('Cannot update history file %s: %s\n' %
+                             (args.history_file, e))
+    boots = history.merge_boots(recorded, boots)
+    summary = history.summarize(boots, args.threshold, args.min_delta)
+    outfh.write(history.format_summary(boots, summary))
+
+
 def _get_events(infile):
+    # Input is either the json from 'analyze dump' or a cloud-init log.
+    # Logs can be large, so stream them through the parser instead of
+    # reading them into memory.
+    first = infile.readline()
+    if not first.lstrip().startswith(('[', '{')):
+        return list(dump.iter_events(itertools.chain([first], infile)))
     rawdata = None
-    events, rawdata = show.load_events_infile(infile)
+    events, rawdata = show.load_events_infile(
+        io.StringIO(first + infile.read()))
     if not events:
         events, _ = dump.dump_events(rawdata=rawdata)
     return events
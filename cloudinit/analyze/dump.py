@@ -2,7 +2,9 @@
 
 import calendar
 from datetime import datetime
+import re
 import sys
+import time
 
 from cloudinit import subp
 from cloudinit import util
@@ -27,12 +29,75 @@ CLOUD_INIT_JOURNALCTL_FMT = "%b %d %H:%M:%S.%f %Y"
 # other
 DEFAULT_FMT = "%b %d %H:%M:%S %Y"
 
+# rsyslog's RFC 3339 timestamps: 2016-08-30T21:53:25.972325+00:00
+ISO8601_TZ_RE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(\.\d+)?'
+    r'(?:(Z)|([+-])(\d{2}):?(\d{2}))$')
+
+# The timestamps above, parsed without strptime
+SYSLOG_TIMESTAMP_RE = re.compile(
+    r'(\S+) +(\d{1,2}) (\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?$')
+ASCTIME_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2}),(\d{1,6})$')
+
+# Lines that may hold an event, see parse_ci_logline
+CI_EVENT_RE = re.compile(r'start:|finish:|Cloud-init v\.')
+
+# The timestamps of the log formats below, see parse_timestamp
+_TIMESTAMP = (
+    r'(?P<timestamp>'
+    # syslog and journalctl -o short-precise: Aug 29 22:55:26[.074410]
+    r'[A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2}(?:\.\d+)?'
+    # logger's asctime and RFC 3339: 2016-08-30T21:53:25.972325+00:00
+    r'|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?'
+    r'(?:Z|[+-]\d{2}:?\d{2})?)')
+
+# The log line formats parse_ci_logline understands, in order of precedence
+LOG_FORMATS = (
+    # cloud-init.log: 2017-05-22 18:02:01,088 - util.py[DEBUG]: ...
+    re.compile(_TIMESTAMP + r'(?: \S+)? - (?P<event>.*)'),
+    # syslog and journalctl, with an optional program[pid]: tag:
+    # Nov 03 06:51:06.074410 x2 cloud-init[106]: [CLOUDINIT] util.py[DEBUG]:
+    re.compile(_TIMESTAMP + r' \S+(?<!:)(?: \S+:)? \[CLOUDINIT\] '
+               r'(?P<event>.*)'),
+    # Amazon Linux 2, with no hostname:
+    # Apr 30 19:39:11 cloud-init[2673]: handlers.py[DEBUG]: start: ...
+    re.compile(_TIMESTAMP + r' cloud-init\[\d+\]: (?P<event>.*)'),
+)
+
+# Cloud-init v. 0.7.9 running 'init-local' at Mon, 22 May 2017 ...
+STAGE_START_RE = re.compile(r'running\s+(?P<stage>.*?) at ')
+
+# handlers.py[DEBUG]: finish: modules-final: SUCCESS: running modules...
+EVENT_RE = re.compile(
+    r'\S+\s+(\S*[^\s:]):*\s+(\S*[^\s:]):*(?:\s+(.*\S))?\s*$')
+
+# SUCCESS: running modules for final
+FINISH_RESULT_RE = re.compile(r'([^:]*):*\s*(.*)', re.DOTALL)
+
+MONTHS = frozenset(calendar.month_abbr[1:])
+MONTH_NUMBERS = dict(
+    (abbr, number) for (number, abbr) in enumerate(calendar.month_abbr))
+
+
+def _local_timestamp(year, month, day, hour, minute, second, fraction):
+    """Return the epoch time of a local time, as strftime('%s.%f') would."""
+    dt = datetime(int(year), int(month), int(day), int(hour), int(minute),
+                  int(second))
+    return float('%d.%s' % (time.mktime(dt.timetuple()),
+                            (fraction or '').ljust(6, '0')))
+
 
 def parse_timestamp(timestampstr):
     # default syslog time does not include the current year
-    months = [calendar.month_abbr[m] for m in range(1, 13)]
-    if timestampstr.split()[0] in months:
+    if timestampstr.split()[0] in MONTHS:
         # Aug 29 22:55:26
+        match = SYSLOG_TIMESTAMP_RE.match(timestampstr)
+        if match:
+            (month, day, hour, minute, second, fraction) = match.groups()
+            return _local_timestamp(
+                datetime.now().year, MONTH_NUMBERS[month], day, hour, minute,
+                second, fraction)
         FMT = DEFAULT_FMT
         if '.' in timestampstr:
             FMT = CLOUD_INIT_JOURNALCTL_FMT
@@ -42,21 +107,97 @@ def parse_timestamp(timestampstr):
         timestamp = dt.strftime("%s.%f")
     elif "," in timestampstr:
         # 2016-09-12 14:39:20,839
+        match = ASCTIME_RE.match(timestampstr)
+        if match:
+            return _local_timestamp(*match.groups())
         dt = datetime.strptime(timestampstr, CLOUD_INIT_ASCTIME_FMT)
         timestamp = dt.strftime("%s.%f")
     else:
-        # allow date(1) to handle other formats we don't expect
-        timestamp = parse_timestamp_from_date(timestampstr)
+        timestamp = parse_timestamp_iso8601(timestampstr)
+        if timestamp is None:
+            # allow date(1) to handle other formats we don't expect
+            timestamp = parse_timestamp_from_date(timestampstr)
 
     return float(timestamp)
 
 
+def parse_timestamp_iso8601(timestampstr):
+    """Return the epoch time of an ISO 8601 timestamp with a UTC offset.
+
+    Returns None for anything else, including timestamps without an offset
+    which date(1) would interpret in the local timezone.
+    """
+    match = ISO8601_TZ_RE.match(timestampstr.strip())
+    if not match:
+        return None
+    (year, month, day, hour, minute, second, fraction, utc, sign,
+     off_hours, off_minutes) = match.groups()
+    timestamp = calendar.timegm(
+        (int(year), int(month), int(day), int(hour), int(minute),
+         int(second)))
+    if not utc:
+        offset = int(off_hours) * 3600 + int(off_minutes) * 60
+        timestamp -= offset if sign == '+' else -offset
+    return timestamp + float(fraction or 0)
+
+
 def parse_timestamp_from_date(timestampstr):
     out, _ = subp.subp(['date', '+%s.%3N', '-d', timestampstr])
     timestamp = out.strip()
     return float(timestamp)
 
 
+def _match_logline(line, log_format=None):
+    """Return the first of LOG_FORMATS matching line, and its match.
+
+    log_format, the pattern the previous line matched, is tried first.
+    Returns (None, None) when no format matches.
+    """
+    if log_format:
+        match = log_format.match(line)
+        if match:
+            return (log_format, match)
+    for pattern in LOG_FORMATS:
+        if pattern is not log_format:
+            match = pattern.match(line)
+            if match:
+                return (pattern, match)
+    return (None, None)
+
+
+def _parse_log_match(match):
+    """Return the event of a line matched by one of LOG_FORMATS."""
+    eventstr = match.group('event')
+    if 'Cloud-init v.' in eventstr:
+        stage = STAGE_START_RE.search(eventstr)
+        if not stage:
+            # don't generate a start for the 'finished at' banner
+            return None
+        event_type = 'start'
+        event_name = stage.group('stage').replace("'", "").replace(":", "-")
+        if event_name == "init":
+            event_name = "init-network"
+        event_description = stage_to_description[event_name]
+    else:
+        event_match = EVENT_RE.match(eventstr)
+        if not event_match:
+            raise ValueError('Invalid event: %s' % eventstr)
+        (event_type, event_name, event_description) = event_match.groups('')
+
+    event = {
+        'name': event_name,
+        'description': event_description,
+        'timestamp': parse_timestamp(match.group('timestamp')),
+        'origin': 'cloudinit',
+        'event_type': event_type,
+    }
+    if event['event_type'] == "finish":
+        (event['result'], event['description']) = (
+            FINISH_RESULT_RE.match(event_description).groups())
+
+    return event
+
+
 def parse_ci_logline(line):
     # Stage Starts:
     # Cloud-init v. 0.7.7 running 'init-local' at \
@@ -78,76 +219,37 @@ def parse_ci_logline(line):
     #
     # Apr 30 19:39:11 cloud-init[2673]: handlers.py[DEBUG]: start: \
     #          init-local/check-cache: attempting to read from cache [check]
-
-    amazon_linux_2_sep = ' cloud-init['
-    separators = [' - ', ' [CLOUDINIT] ', amazon_linux_2_sep]
-    found = False
-    for sep in separators:
-        if sep in line:
-            found = True
-            break
-
-    if not found:
+    (_log_format, match) = _match_logline(line)
+    if not match:
         return None
+    return _parse_log_match(match)
 
-    (timehost, eventstr) = line.split(sep)
-
-    # journalctl -o short-precise
-    if timehost.endswith(":"):
-        timehost = " ".join(timehost.split()[0:-1])
-
-    if "," in timehost:
-        timestampstr, extra = timehost.split(",")
-        timestampstr += ",%s" % extra.split()[0]
-        if ' ' in extra:
-            hostname = extra.split()[-1]
-    else:
-        hostname = timehost.split()[-1]
-        if sep == amazon_linux_2_sep:
-            # This is an Amazon Linux style line, with no hostname and a PID.
-            # Use the whole of timehost as timestampstr, and strip off the PID
-            # from the start of eventstr.
-            timestampstr = timehost.strip()
-            eventstr = eventstr.split(maxsplit=1)[1]
-        else:
-            timestampstr = timehost.split(hostname)[0].strip()
-    if 'Cloud-init v.' in eventstr:
-        event_type = 'start'
-        if 'running' in eventstr:
-            stage_and_timestamp = eventstr.split('running')[1].lstrip()
-            event_name, _ = stage_and_timestamp.split(' at ')
-            event_name = event_name.replace("'", "").replace(":", "-")
-            if event_name == "init":
-                event_name = "init-network"
-        else:
-            # don't generate a start for the 'finished at' banner
-            return None
-        event_description = stage_to_description[event_name]
-    else:
-        (_pymodloglvl, event_type, event_name) = eventstr.split()[0:3]
-        event_description = eventstr.split(event_name)[1].strip()
 
-    event = {
-        'name': event_name.rstrip(":"),
-        'description': event_description,
-        'timestamp': parse_timestamp(timestampstr),
-        'origin': 'cloudinit',
-        'event_type': event_type.rstrip(":"),
-    }
-    if event['event_type'] == "finish":
-        result = event_description.split(":")[0]
-        desc = event_description.split(result)[1].lstrip(':').strip()
-        event['result'] = result
-        event['description'] = desc.strip()
+def iter_events(lines):
+    """Yield the events parsed from an iterable of log lines.
 
-    return event
+    Lines are consumed lazily, so a log file object can be passed without
+    reading it into memory. The log format of the first event line is
+    tried first on every following line.
+    """
+    log_format = None
+    for line in lines:
+        if not CI_EVENT_RE.search(line):
+            continue
+        (line_format, match) = _match_logline(line, log_format)
+        if not match:
+            continue
+        log_format = line_format
+        try:
+            event = _parse_log_match(match)
+        except ValueError:
+            sys.stderr.write('Skipping invalid entry\n')
+            continue
+        if event:
+            yield event
 
 
 def dump_events(cisource=None, rawdata=None):
-    events = []
-    event = None
-    CI_EVENT_MATCHES = ['start:', 'finish:', 'Cloud-init v.']
-
     if not any([cisource, rawdata]):
         raise ValueError('Either cisource or rawdata parameters are required')
 
@@ -156,17 +258,7 @@ def dump_events(cisource=None, rawdata=None):
     else:
         data = cisource.readlines()
 
-    for line in data:
-        for match in CI_EVENT_MATCHES:
-            if match in line:
-                try:
-                    event = parse_ci_logline(line)
-                except ValueError:
-                    sys.stderr.write('Skipping invalid entry\n')
-                if event:
-                    events.append(event)
-
-    return events, data
+    return list(iter_events(data)), data
 
 
 def main():
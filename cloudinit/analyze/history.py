@@ -0,0 +1,202 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Track cloud-init stage and module durations across boots.
+
+Each boot found in the logs is stored as a single json line holding the
+timestamp at which the boot started and the duration in seconds of every
+paired start/finish event, keyed by event name. For example:
+
+    {"boot": 1567057578.037, "durations": {"init-local": 0.942, ...}}
+
+Boots are identified by their start timestamp, so analyzing the same log
+twice does not record its boots twice. A boot analyzed again once more of
+its events have finished, such as when history runs from runcmd before the
+final stage ends, replaces the earlier partial record.
+"""
+
+import json
+import math
+
+from cloudinit import util
+
+HISTORY_FILE = '/var/lib/cloud/data/analyze-history.json'
+
+
+def boot_durations(events):
+    """Group events into boots and return the durations for each.
+
+    A boot starts at the first event, and a new boot starts whenever a
+    top-level stage that already started in the current boot starts again,
+    whether or not it finished.
+
+    :param events: events as produced by analyze dump
+    :return: list of {'boot': start timestamp, 'durations': {name: secs}}
+    """
+    boots = []
+    boot = None
+    starts = {}
+    started = set()
+    for event in sorted(events, key=lambda e: e['timestamp']):
+        name = event.get('name')
+        etype = event.get('event_type')
+        if etype == 'start':
+            top_level = '/' not in name
+            if boot is None or (top_level and name in started):
+                boot = {'boot': event['timestamp'], 'durations': {}}
+                boots.append(boot)
+                starts = {}
+                started = set()
+            if top_level:
+                started.add(name)
+            starts[name] = event['timestamp']
+        elif etype == 'finish' and name in starts:
+            boot['durations'][name] = round(
+                event['timestamp'] - starts.pop(name), 6)
+    return [b for b in boots if b['durations']]
+
+
+def load_history(path=HISTORY_FILE):
+    """Return the boots recorded in path, oldest first.
+
+    Lines that are not a boot as written by record_boots, such as a
+    truncated write or a manual edit, are skipped.
+    """
+    boots = []
+    for line in util.load_file(path, quiet=True).splitlines():
+        try:
+            boot = json.loads(line)
+        except ValueError:
+            continue
+        if _is_boot(boot):
+            boots.append(boot)
+    return sorted(boots, key=lambda b: b['boot'])
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_boot(boot):
+    """Return whether boot is a {'boot': secs, 'durations': {name: secs}}."""
+    if not isinstance(boot, dict) or not _is_number(boot.get('boot')):
+        return False
+    durations = boot.get('durations')
+    return (isinstance(durations, dict) and
+            all(_is_number(secs) for secs in durations.values()))
+
+
+def _updated_boots(recorded, boots):
+    """Return the boots new to recorded or with more durations than there.
+
+    :return: tuple of (new boots, boots replacing a recorded boot)
+    """
+    by_start = dict((b['boot'], b) for b in recorded)
+    new = []
+    updated = []
+    for boot in boots:
+        old = by_start.get(boot['boot'])
+        if old is None:
+            new.append(boot)
+        elif len(boot['durations']) > len(old['durations']):
+            updated.append(boot)
+        else:
+            continue
+        by_start[boot['boot']] = boot
+    return (new, updated)
+
+
+def merge_boots(recorded, boots):
+    """Return recorded updated with boots, oldest first.
+
+    Boots not in recorded are added and boots with more durations than
+    their recorded counterpart replace it.
+    """
+    (new, updated) = _updated_boots(recorded, boots)
+    replaced = dict((b['boot'], b) for b in updated)
+    merged = [replaced.get(b['boot'], b) for b in recorded] + new
+    return sorted(merged, key=lambda b: b['boot'])
+
+
+def _dump_boots(boots):
+    return ''.join(
+        json.dumps(b, sort_keys=True, separators=(',', ':')) + '\n'
+        for b in boots)
+
+
+def record_boots(boots, path=HISTORY_FILE):
+    """Record the boots not yet recorded in path, or recorded partially.
+
+    New boots are appended. When a boot has more durations than its
+    recorded counterpart the history is rewritten with it replaced.
+
+    :return: the number of boots added or replaced.
+    """
+    recorded = load_history(path)
+    (new, updated) = _updated_boots(recorded, boots)
+    if updated:
+        util.write_file(path, _dump_boots(merge_boots(recorded, boots)))
+    elif new:
+        util.write_file(path, _dump_boots(new), omode='a')
+    return len(new) + len(updated)
+
+
+def percentile(values, pct):
+    """Return the nearest-rank percentile of a non-empty list of values."""
+    ordered = sorted(values)
+    rank = max(int(math.ceil(pct / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def summarize(boots, threshold=0.5, min_delta=0.1):
+    """Summarize per-event durations across boots.
+
+    An event has regressed when its duration in the latest boot exceeds
+    the median of the earlier boots by more than threshold (a fraction of
+    that median) and by more than min_delta seconds.
+
+    :return: list of dicts with name, boots, p50, p95, latest and regressed,
+        sorted by name.
+    """
+    durations = {}
+    for boot in boots:
+        for name, secs in boot['durations'].items():
+            durations.setdefault(name, []).append(secs)
+    latest = boots[-1]['durations'] if boots else {}
+    summary = []
+    for name in sorted(durations):
+        values = durations[name]
+        regressed = False
+        if name in latest and len(values) > 1:
+            baseline = percentile(values[:-1], 50)
+            delta = latest[name] - baseline
+            regressed = delta > min_delta and delta > baseline * threshold
+        summary.append({
+            'name': name,
+            'boots': len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'latest': latest.get(name),
+            'regressed': regressed,
+        })
+    return summary
+
+
+def format_summary(boots, summary):
+    """Return the report printed by analyze history."""
+    lines = ['%d boot records in history' % len(boots),
+             '%10s %10s %10s  %s' % ('p50', 'p95', 'latest', 'name')]
+    for item in summary:
+        latest = '-'
+        if item['latest'] is not None:
+            latest = '%.3fs' % item['latest']
+        line = '%9.3fs %9.3fs %10s  %s' % (
+            item['p50'], item['p95'], latest, item['name'])
+        if item['regressed']:
+            line += '  REGRESSED'
+        lines.append(line)
+    regressed = [item['name'] for item in summary if item['regressed']]
+    lines.append('%d regressions in latest boot%s' % (
+        len(regressed), ': ' + ', '.join(regressed) if regressed else ''))
+    return '\n'.join(lines) + '\n'
+
+# vi: ts=4 expandtab
@@ -4,7 +4,7 @@ from datetime import datetime
 from textwrap import dedent
 
 from cloudinit.analyze.dump import (
-    dump_events, parse_ci_logline, parse_timestamp)
+    LOG_FORMATS, dump_events, iter_events, parse_ci_logline, parse_timestamp)
 from cloudinit.util import write_file
 from cloudinit.subp import which
 from cloudinit.tests.helpers import CiTestCase, mock, skipIf
@@ -43,6 +43,25 @@ class TestParseTimestamp(CiTestCase):
         self.assertEqual(
             float(dt.strftime('%s.%f')), parse_timestamp(journal_stamp))
 
+    @mock.patch("cloudinit.analyze.dump.parse_timestamp_from_date")
+    def test_parse_timestamp_handles_iso8601_with_offset(self, m_from_date):
+        """RFC 3339 timestamps are parsed without calling date(1)."""
+        for stamp in ('2016-08-30T21:53:25.5Z',
+                      '2016-08-30 21:53:25.5+00:00',
+                      '2016-08-30T23:53:25.5+02:00',
+                      '2016-08-30T19:23:25.5-0230'):
+            self.assertEqual(1472594005.5, parse_timestamp(stamp), stamp)
+        self.assertEqual(0, m_from_date.call_count)
+
+    @mock.patch("cloudinit.analyze.dump.parse_timestamp_from_date")
+    def test_parse_timestamp_iso8601_without_offset_uses_date(self,
+                                                              m_from_date):
+        """Timestamps without an offset are left to date(1)."""
+        m_from_date.return_value = 1472594005.0
+        self.assertEqual(
+            1472594005.0, parse_timestamp('2016-08-30 21:53:25.000'))
+        m_from_date.assert_called_once_with('2016-08-30 21:53:25.000')
+
     @skipIf(not which("date"), "'date' command not available.")
     def test_parse_unexpected_timestamp_format_with_date_command(self):
         """Dump sends unexpected timestamp formats to date for processing."""
@@ -101,9 +120,7 @@ class TestParseCILogLine(CiTestCase):
             'timestamp': timestamp}
         self.assertEqual(expected, parse_ci_logline(line))
 
-    @mock.patch("cloudinit.analyze.dump.parse_timestamp_from_date")
-    def test_parse_logline_returns_event_for_finish_events(self,
-                                                           m_parse_from_date):
+    def test_parse_logline_returns_event_for_finish_events(self):
         """parse_ci_logline returns a finish event for a parsed log line."""
         line = ('2016-08-30 21:53:25.972325+00:00 y1 [CLOUDINIT]'
                 ' handlers.py[DEBUG]: finish: modules-final: SUCCESS: running'
@@ -114,11 +131,8 @@ class TestParseCILogLine(CiTestCase):
             'name': 'modules-final',
             'origin': 'cloudinit',
             'result': 'SUCCESS',
-            'timestamp': 1472594005.972}
-        m_parse_from_date.return_value = "1472594005.972"
+            'timestamp': 1472594005.972325}
         self.assertEqual(expected, parse_ci_logline(line))
-        m_parse_from_date.assert_has_calls(
-            [mock.call("2016-08-30 21:53:25.972325+00:00")])
 
     def test_parse_logline_returns_event_for_amazon_linux_2_line(self):
         line = (
@@ -137,6 +151,16 @@ class TestParseCILogLine(CiTestCase):
             'timestamp': timestamp_dt.timestamp()}
         self.assertEqual(expected, parse_ci_logline(line))
 
+    def test_parse_logline_separator_in_syslog_message(self):
+        """A ' - ' in the message does not make a syslog line unparsable."""
+        line = ('2016-08-30 21:53:25.972325+00:00 y1 [CLOUDINIT]'
+                ' handlers.py[DEBUG]: finish: modules-final: SUCCESS: running'
+                ' modules - for final')
+        event = parse_ci_logline(line)
+        self.assertEqual('modules-final', event['name'])
+        self.assertEqual('running modules - for final', event['description'])
+        self.assertEqual(1472594005.972325, event['timestamp'])
+
 
 SAMPLE_LOGS = dedent("""\
 Nov 03 06:51:06.074410 x2 cloud-init[106]: [CLOUDINIT] util.py[DEBUG]:\
@@ -150,15 +174,10 @@ Nov 03 06:51:06.074410 x2 cloud-init[106]: [CLOUDINIT] util.py[DEBUG]:\
 class TestDumpEvents(CiTestCase):
     maxDiff = None
 
-    @mock.patch("cloudinit.analyze.dump.parse_timestamp_from_date")
-    def test_dump_events_with_rawdata(self, m_parse_from_date):
+    def test_dump_events_with_rawdata(self):
         """Rawdata is split and parsed into a tuple of events and data"""
-        m_parse_from_date.return_value = "1472594005.972"
         events, data = dump_events(rawdata=SAMPLE_LOGS)
         expected_data = SAMPLE_LOGS.splitlines()
-        self.assertEqual(
-            [mock.call("2016-08-30 21:53:25.972325+00:00")],
-            m_parse_from_date.call_args_list)
         self.assertEqual(expected_data, data)
         year = datetime.now().year
         dt1 = datetime.strptime(
@@ -175,15 +194,13 @@ class TestDumpEvents(CiTestCase):
             'name': 'modules-final',
             'origin': 'cloudinit',
             'result': 'SUCCESS',
-            'timestamp': 1472594005.972}]
+            'timestamp': 1472594005.972325}]
         self.assertEqual(expected_events, events)
 
-    @mock.patch("cloudinit.analyze.dump.parse_timestamp_from_date")
-    def test_dump_events_with_cisource(self, m_parse_from_date):
+    def test_dump_events_with_cisource(self):
         """Cisource file is read and parsed into a tuple of events and data."""
         tmpfile = self.tmp_path('logfile')
         write_file(tmpfile, SAMPLE_LOGS)
-        m_parse_from_date.return_value = 1472594005.972
 
         events, data = dump_events(cisource=open(tmpfile))
         year = datetime.now().year
@@ -201,8 +218,38 @@ class TestDumpEvents(CiTestCase):
             'name': 'modules-final',
             'origin': 'cloudinit',
             'result': 'SUCCESS',
-            'timestamp': 1472594005.972}]
+            'timestamp': 1472594005.972325}]
         self.assertEqual(expected_events, events)
         self.assertEqual(SAMPLE_LOGS.splitlines(), [d.strip() for d in data])
-        m_parse_from_date.assert_has_calls(
-            [mock.call("2016-08-30 21:53:25.972325+00:00")])
+
+    def test_iter_events_consumes_lines_lazily(self):
+        """iter_events yields each event before reading further lines."""
+        lines = iter(SAMPLE_LOGS.splitlines() + ['not a log line'])
+        events = iter_events(lines)
+        self.assertEqual('init-local', next(events)['name'])
+        self.assertEqual('modules-final', next(events)['name'])
+        self.assertEqual(['not a log line'], list(lines))
+
+    def test_iter_events_tries_previous_line_format_first(self):
+        """Each line is matched first against the previous line's format."""
+        lines = [SAMPLE_LOGS.splitlines()[1]] * 3 + [
+            '2016-08-30 21:53:25,972 - handlers.py[DEBUG]: start: init-local:'
+            ' searching for local datasources']
+        with mock.patch('cloudinit.analyze.dump.LOG_FORMATS',
+                        [mock.Mock(wraps=pattern)
+                         for pattern in LOG_FORMATS]) as m_formats:
+            events = list(iter_events(lines))
+        self.assertEqual(['modules-final'] * 3 + ['init-local'],
+                         [e['name'] for e in events])
+        # The cloud-init.log format is not tried again after the first line
+        self.assertEqual(2, m_formats[0].match.call_count)
+        self.assertEqual(4, m_formats[1].match.call_count)
+
+    def test_iter_events_skips_invalid_entries(self):
+        """Lines that fail to parse are skipped rather than repeated."""
+        lines = ['2016-08-30 21:53:25,972 - handlers.py[DEBUG]: start:',
+                 SAMPLE_LOGS.splitlines()[1]]
+        with mock.patch('sys.stderr') as m_stderr:
+            events = list(iter_events(lines))
+        self.assertEqual(['modules-final'], [e['name'] for e in events])
+        m_stderr.write.assert_called_once_with('Skipping invalid entry\n')
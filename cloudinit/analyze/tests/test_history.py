@@ -0,0 +1,177 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+from cloudinit.analyze import history
+from cloudinit.analyze.__main__ import analyze_history, get_parser
+from cloudinit.tests.helpers import CiTestCase
+from cloudinit.util import load_file, write_file
+
+
+def _events(boot_start, datasource_secs):
+    """Return the events of one boot with the given datasource search."""
+    return [
+        {'name': 'init-local', 'event_type': 'start',
+         'timestamp': boot_start},
+        {'name': 'init-local/search-Ec2', 'event_type': 'start',
+         'timestamp': boot_start + 0.1},
+        {'name': 'init-local/search-Ec2', 'event_type': 'finish',
+         'timestamp': boot_start + 0.1 + datasource_secs},
+        {'name': 'init-local', 'event_type': 'finish',
+         'timestamp': boot_start + 0.2 + datasource_secs},
+    ]
+
+
+LOG_LINES = [
+    "2020-06-01 10:00:00,000 - util.py[DEBUG]: Cloud-init v. 20.2 running"
+    " 'init-local' at Mon, 01 Jun 2020 10:00:00 +0000. Up 2.0 seconds.",
+    "2020-06-01 10:00:00,500 - handlers.py[DEBUG]: finish: init-local:"
+    " SUCCESS: searching for local datasources",
+]
+
+
+class TestBootDurations(CiTestCase):
+
+    def test_events_grouped_per_boot(self):
+        """A top-level stage starting again begins a new boot."""
+        events = _events(100.0, 1.0) + _events(200.0, 2.0)
+        self.assertEqual(
+            [{'boot': 100.0, 'durations': {'init-local': 1.2,
+                                           'init-local/search-Ec2': 1.0}},
+             {'boot': 200.0, 'durations': {'init-local': 2.2,
+                                           'init-local/search-Ec2': 2.0}}],
+            history.boot_durations(events))
+
+    def test_unfinished_stage_ends_boot(self):
+        """A stage that never finished still begins a new boot."""
+        events = _events(100.0, 1.0)[:3] + _events(200.0, 2.0)
+        self.assertEqual(
+            [{'boot': 100.0, 'durations': {'init-local/search-Ec2': 1.0}},
+             {'boot': 200.0, 'durations': {'init-local': 2.2,
+                                           'init-local/search-Ec2': 2.0}}],
+            history.boot_durations(events))
+
+    def test_unfinished_events_ignored(self):
+        """Events without a finish have no duration."""
+        events = _events(100.0, 1.0)[:2]
+        self.assertEqual([], history.boot_durations(events))
+
+
+class TestHistoryStore(CiTestCase):
+
+    def test_record_boots_skips_recorded_boots(self):
+        """Boots are recorded once however often the log is analyzed."""
+        path = self.tmp_path('history.json')
+        boots = history.boot_durations(_events(100.0, 1.0))
+        self.assertEqual(1, history.record_boots(boots, path))
+        self.assertEqual(0, history.record_boots(boots, path))
+        self.assertEqual(1, len(load_file(path).splitlines()))
+        self.assertEqual(boots, history.load_history(path))
+
+    def test_record_boots_replaces_partial_boots(self):
+        """A boot recorded before it completed is replaced once complete."""
+        path = self.tmp_path('history.json')
+        partial = history.boot_durations(_events(100.0, 1.0)[:3])
+        complete = history.boot_durations(_events(100.0, 1.0))
+        later = history.boot_durations(_events(200.0, 2.0))
+        self.assertEqual(1, history.record_boots(partial, path))
+        self.assertEqual(1, history.record_boots(later, path))
+        self.assertEqual(1, history.record_boots(complete, path))
+        self.assertEqual(0, history.record_boots(partial, path))
+        self.assertEqual(2, len(load_file(path).splitlines()))
+        self.assertEqual(complete + later, history.load_history(path))
+
+    def test_merge_boots_prefers_complete_boots(self):
+        """Merging keeps the record of a boot with the most durations."""
+        partial = history.boot_durations(_events(100.0, 1.0)[:3])
+        complete = history.boot_durations(_events(100.0, 1.0))
+        later = history.boot_durations(_events(200.0, 2.0))
+        self.assertEqual(complete + later,
+                         history.merge_boots(partial + later, complete))
+        self.assertEqual(complete + later,
+                         history.merge_boots(complete, partial + later))
+
+    def test_load_history_skips_corrupt_lines(self):
+        """A truncated line does not prevent reading the rest."""
+        path = self.tmp_path('history.json')
+        write_file(path, '{"boot": 1.0, "durations": {}}\n{"boot": 2')
+        self.assertEqual(
+            [{'boot': 1.0, 'durations': {}}], history.load_history(path))
+
+    def test_load_history_skips_lines_that_are_not_boots(self):
+        """Valid json that is not a recorded boot is skipped."""
+        path = self.tmp_path('history.json')
+        write_file(path, '\n'.join([
+            '{"boot": 2.0, "durations": {"init": 1.0}}',
+            '[1, 2]', '"text"', 'null', '{"durations": {}}',
+            '{"boot": "1.0", "durations": {}}', '{"boot": 3.0}',
+            '{"boot": 4.0, "durations": {"init": "1.0"}}',
+            '{"boot": 1.0, "durations": {}}']))
+        self.assertEqual(
+            [{'boot': 1.0, 'durations': {}},
+             {'boot': 2.0, 'durations': {'init': 1.0}}],
+            history.load_history(path))
+
+
+class TestSummarize(CiTestCase):
+
+    def test_percentile_nearest_rank(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(3, history.percentile(values, 50))
+        self.assertEqual(5, history.percentile(values, 95))
+        self.assertEqual(1, history.percentile(values, 0))
+
+    def test_regression_against_median_of_earlier_boots(self):
+        """Only events notably slower in the latest boot are flagged."""
+        events = []
+        for (idx, secs) in enumerate([1.0, 1.1, 0.9, 3.0]):
+            events.extend(_events(100.0 * (idx + 1), secs))
+        boots = history.boot_durations(events)
+        summary = dict(
+            (item['name'], item) for item in history.summarize(boots))
+        search = summary['init-local/search-Ec2']
+        self.assertEqual(4, search['boots'])
+        self.assertEqual(1.0, search['p50'])
+        self.assertEqual(3.0, search['p95'])
+        self.assertEqual(3.0, search['latest'])
+        self.assertTrue(search['regressed'])
+
+    def test_small_deltas_not_regressions(self):
+        """Deltas below min_delta are noise, whatever their ratio."""
+        boots = [{'boot': 1.0, 'durations': {'x': 0.01}},
+                 {'boot': 2.0, 'durations': {'x': 0.05}}]
+        self.assertFalse(history.summarize(boots)[0]['regressed'])
+        self.assertTrue(
+            history.summarize(boots, min_delta=0.01)[0]['regressed'])
+
+
+class TestAnalyzeHistory(CiTestCase):
+
+    def setUp(self):
+        super(TestAnalyzeHistory, self).setUp()
+        self.tmp = self.tmp_dir()
+        self.history_file = self.tmp_path('history.json', self.tmp)
+
+    def _run(self, *extra):
+        infile = self.tmp_path('cloud-init.log', self.tmp)
+        write_file(infile, '\n'.join(LOG_LINES) + '\n')
+        outfile = self.tmp_path('out', self.tmp)
+        args = get_parser().parse_args(
+            ['history', '-i', infile, '-o', outfile,
+             '--history-file', self.history_file] + list(extra))
+        analyze_history('analyze', args)
+        return load_file(outfile)
+
+    def test_history_records_and_reports(self):
+        """Boots from the log are recorded and reported."""
+        out = self._run()
+        self.assertIn('1 boot records in history', out)
+        self.assertIn('    0.500s     0.500s     0.500s  init-local', out)
+        self.assertIn('0 regressions in latest boot', out)
+        self.assertEqual(1, len(history.load_history(self.history_file)))
+
+    def test_history_no_record(self):
+        """--no-record reports without writing the history file."""
+        out = self._run('--no-record')
+        self.assertIn('1 boot records in history', out)
+        self.assertEqual([], history.load_history(self.history_file))
+
+# vi: ts=4 expandtab
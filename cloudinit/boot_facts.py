@@ -0,0 +1,139 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Cache facts about the running boot across cloud-init stages.
+
+Probes like util.is_container() fork helper commands whose answers cannot
+change until the next boot, yet each of the cloud-init stages runs in its
+own process and would run them again. Functions decorated with
+:func:`boot_fact` keep their results in a json file under /run/cloud-init
+once the cache has been loaded, so the first stage to run a probe saves the
+later stages from doing so.
+
+The file records the kernel boot id and is discarded when it was written
+during another boot.
+"""
+
+import functools
+import json
+import os
+
+from cloudinit import log as logging
+
+LOG = logging.getLogger(__name__)
+
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+
+
+def _read_boot_id():
+    try:
+        with open(BOOT_ID_FILE) as stream:
+            return stream.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+class BootFacts(object):
+    """Facts computed during this boot, optionally backed by a file."""
+
+    def __init__(self):
+        self.path = None
+        self.boot_id = None
+        self.facts = {}
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def load(self, path):
+        """Load facts from path and save new facts there from now on.
+
+        Facts in path from another boot are discarded. The cache stays
+        disabled when the boot id cannot be read, as stale facts could not
+        be told apart.
+
+        :return: True if the cache is enabled.
+        """
+        boot_id = _read_boot_id()
+        if not boot_id:
+            LOG.debug("Not caching boot facts, cannot read boot id")
+            self.clear()
+            return False
+        facts = {}
+        try:
+            with open(path) as stream:
+                data = json.load(stream)
+            if data.get('boot_id') == boot_id:
+                facts = data.get('facts', {})
+            else:
+                LOG.debug("Discarding boot facts from previous boot in %s",
+                          path)
+        except (IOError, OSError):
+            pass
+        except (AttributeError, ValueError) as e:
+            LOG.debug("Ignoring invalid boot facts in %s: %s", path, e)
+        self.path = path
+        self.boot_id = boot_id
+        self.facts = facts
+        return True
+
+    def clear(self):
+        """Forget all facts and stop using the cache file."""
+        self.path = None
+        self.boot_id = None
+        self.facts = {}
+
+    def get(self, key, compute):
+        """Return the fact for key, calling compute() when it is unknown."""
+        if not self.enabled:
+            return compute()
+        if key in self.facts:
+            return self.facts[key]
+        value = compute()
+        self.facts[key] = value
+        self._write()
+        return value
+
+    def _write(self):
+        # Write a new file and rename it into place so that a concurrent
+        # reader never sees a partial file.
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as stream:
+                json.dump({'boot_id': self.boot_id, 'facts': self.facts},
+                          stream, sort_keys=True)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError, TypeError, ValueError) as e:
+            LOG.debug("Failed to write boot facts to %s: %s", self.path, e)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+boot_facts = BootFacts()
+
+
+def boot_fact(name, decode=None):
+    """Decorate a function whose result is fixed for the whole boot.
+
+    Results are stored in :data:`boot_facts` under name, plus any positional
+    arguments, and must be json serializable. decode is applied to values
+    read back from the cache, e.g. to turn json lists back into tuples.
+    Calls with non-None keyword arguments are never cached.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not boot_facts.enabled or any(
+                    v is not None for v in kwargs.values()):
+                return func(*args, **kwargs)
+            key = ':'.join([name] + [str(arg) for arg in args])
+            cached = key in boot_facts.facts
+            value = boot_facts.get(key, lambda: func(*args, **kwargs))
+            if cached and decode:
+                value = decode(value)
+            return value
+        return wrapper
+    return decorator
+
+# vi: ts=4 expandtab
@@ -21,11 +21,15 @@ import traceback
 from cloudinit import patcher
 patcher.patch()  # noqa
 
+from cloudinit import boot_facts
+from cloudinit import config_cache
 from cloudinit import log as logging
+from cloudinit import net
 from cloudinit import netinfo
 from cloudinit import signal_handler
 from cloudinit import sources
 from cloudinit import stages
+from cloudinit import templater
 from cloudinit import url_helper
 from cloudinit import util
 from cloudinit import version
@@ -123,6 +127,44 @@ def apply_reporting_cfg(cfg):
         reporting.update_configuration(cfg.get('reporting'))
 
 
+def apply_url_session_cfg(cfg):
+    """Enable or disable the shared keep-alive HTTP session pool."""
+    url_helper.session_pool.enabled = util.get_cfg_option_bool(
+        cfg, 'url_session_pool', default=True)
+
+
+def apply_config_cache():
+    """Reuse config files parsed by other stages and subcommands as root."""
+    if os.getuid() == 0:
+        config_cache.config_cache.load(config_cache.CONFIG_CACHE_FILE)
+    else:
+        config_cache.config_cache.clear()
+
+
+def apply_boot_facts_cfg(cfg, paths):
+    """Share boot-scoped probe results with the other stages of this boot."""
+    if util.get_cfg_option_bool(cfg, 'boot_facts_cache', default=True):
+        boot_facts.boot_facts.load(paths.get_runpath('boot_facts'))
+    else:
+        boot_facts.boot_facts.clear()
+
+
+def apply_net_snapshot_cfg(cfg):
+    """Answer network device queries from one sysfs snapshot per stage."""
+    if util.get_cfg_option_bool(cfg, 'net_device_snapshot', default=False):
+        net.refresh_device_snapshot()
+    else:
+        net.clear_device_snapshot()
+
+
+def apply_jinja_cache_cfg(cfg, paths):
+    """Share compiled jinja templates with the other stages and boots."""
+    if util.get_cfg_option_bool(cfg, 'jinja_bytecode_cache', default=False):
+        templater.set_jinja_bytecode_cache(paths.get_cpath('jinja_cache'))
+    else:
+        templater.set_jinja_bytecode_cache(None)
+
+
 def parse_cmdline_url(cmdline, names=('cloud-config-url', 'url')):
     data = util.keyval_str_to_dict(cmdline)
     for key in names:
@@ -259,6 +301,10 @@ def main_init(name, args):
         logging.resetLogging()
     logging.setupLogging(init.cfg)
     apply_reporting_cfg(init.cfg)
+    apply_url_session_cfg(init.cfg)
+    apply_boot_facts_cfg(init.cfg, init.paths)
+    apply_net_snapshot_cfg(init.cfg)
+    apply_jinja_cache_cfg(init.cfg, init.paths)
 
     # Any log usage prior to setupLogging above did not have local user log
     # config applied.  We send the welcome message now, as stderr/out have
@@ -354,6 +400,7 @@ def main_init(name, args):
               mode, name, iid, init.is_new_instance())
 
     if mode == sources.DSMODE_LOCAL:
+        _maybe_start_early_ssh_host_keys(init)
         # Before network comes up, set any configured hostname to allow
         # dhcp clients to advertize this hostname to any DDNS services
         # LP: #1746455.
@@ -507,6 +554,10 @@ def main_modules(action_name, args):
         logging.resetLogging()
     logging.setupLogging(mods.cfg)
     apply_reporting_cfg(init.cfg)
+    apply_url_session_cfg(init.cfg)
+    apply_boot_facts_cfg(init.cfg, init.paths)
+    apply_net_snapshot_cfg(init.cfg)
+    apply_jinja_cache_cfg(init.cfg, init.paths)
 
     # now that logging is setup and stdout redirected, send welcome
     welcome(name, msg=w_msg)
@@ -566,6 +617,10 @@ def main_single(name, args):
         logging.resetLogging()
     logging.setupLogging(mods.cfg)
     apply_reporting_cfg(init.cfg)
+    apply_url_session_cfg(init.cfg)
+    apply_boot_facts_cfg(init.cfg, init.paths)
+    apply_net_snapshot_cfg(init.cfg)
+    apply_jinja_cache_cfg(init.cfg, init.paths)
 
     # now that logging is setup and stdout redirected, send welcome
     welcome(name, msg=w_msg)
@@ -712,6 +767,25 @@ def _maybe_set_hostname(init, stage, retry_stage):
                 ' retry in %s stage. Error: %s.', stage, retry_stage, str(e))
 
 
+def _maybe_start_early_ssh_host_keys(init):
+    """Start generating ssh host keys for a new instance in init-local.
+
+    Enabled by ssh_genkeys_early in system config. The ssh module installs
+    the keys the final config asks for instead of generating them itself.
+    """
+    if not util.get_cfg_option_bool(init.cfg, 'ssh_genkeys_early', False):
+        return
+    if not init.is_new_instance():
+        return
+    # Only imported when enabled, it is slow to import for every subcommand
+    from cloudinit.config import cc_ssh
+    try:
+        cc_ssh.start_early_host_keys(
+            init.cfg, init.paths, init.datasource.get_instance_id(), LOG)
+    except Exception:
+        util.logexc(LOG, "Failed to start early ssh host key generation")
+
+
 def main_features(name, args):
     sys.stdout.write('\n'.join(sorted(version.FEATURES)) + '\n')
 
@@ -859,6 +933,7 @@ def main(sysv_args=None):
 
     # Setup signal handlers before running
     signal_handler.attach_handlers()
+    apply_config_cache()
 
     if name in ("modules", "init"):
         functor = status_wrapper
@@ -890,8 +965,13 @@ def main(sysv_args=None):
         retval = util.log_time(
             logfunc=LOG.debug, msg="cloud-init mode '%s'" % name,
             get_uptime=True, func=functor, args=(name, args))
-        reporting.flush_events()
-        return retval
+    # Flush after the stage's finish event so handlers publishing from a
+    # background thread deliver it before the process exits.
+    reporting.flush_events()
+    if url_helper.session_pool.enabled:
+        LOG.debug("HTTP session pool usage: %s",
+                  url_helper.session_pool.stats())
+    return retval
 
 
 if __name__ == '__main__':
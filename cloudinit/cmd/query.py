@@ -15,6 +15,8 @@ output; if this fails, they are treated as binary.
 
 import argparse
 from errno import EACCES
+import functools
+import json
 import os
 import sys
 
@@ -23,7 +25,8 @@ from cloudinit.handlers.jinja_template import (
 from cloudinit.cmd.devel import addLogHandlerCLI, read_cfg_paths
 from cloudinit import log
 from cloudinit.sources import (
-    INSTANCE_JSON_FILE, INSTANCE_JSON_SENSITIVE_FILE, REDACT_SENSITIVE_VALUE)
+    INSTANCE_JSON_FILE, INSTANCE_JSON_SENSITIVE_FILE, REDACT_SENSITIVE_VALUE,
+    load_instance_data_index)
 from cloudinit import util
 
 NAME = 'query'
@@ -93,6 +96,72 @@ def load_userdata(ud_file_path):
         return util.decomp_gzip(bdata, quiet=False, decode=True)
 
 
+def _redacted_userdata(ud_file_path):
+    """Return the user-data placeholder shown to non-root users."""
+    return '<%s> file:%s' % (REDACT_SENSITIVE_VALUE, ud_file_path)
+
+
+def _read_indexed_value(instance_file, offset, length):
+    """Read and convert one value of the instance-data file at offset."""
+    instance_file.seek(offset)
+    value = json.loads(instance_file.read(length).decode('utf-8'))
+    if isinstance(value, dict):
+        return convert_jinja_instance_data(value)
+    return value
+
+
+def _index_loaders(index, instance_file):
+    """Return index with each [offset, length] replaced by its loader."""
+    if isinstance(index, dict):
+        return dict((key, _index_loaders(value, instance_file))
+                    for key, value in index.items())
+    return functools.partial(_read_indexed_value, instance_file, *index)
+
+
+def _load_indexed(value):
+    """Return value with the loaders of an index replaced by their values."""
+    if isinstance(value, dict):
+        return dict((key, _load_indexed(val)) for key, val in value.items())
+    if callable(value):
+        return value()
+    return value
+
+
+def _query_index(args, index, instance_file, userdata, vendordata):
+    """Answer varname and --list-keys queries from the instance-data index.
+
+    Only the values needed to answer the query are read from instance_file.
+    The index is converted like the instance-data itself so that its keys
+    are those of convert_jinja_instance_data, including the v1 aliases.
+    """
+    index = _index_loaders(index, instance_file)
+    index['userdata'] = userdata
+    index['vendordata'] = vendordata
+    response = convert_jinja_instance_data(index)
+    if args.varname:
+        try:
+            for var in args.varname.split('.'):
+                if callable(response):
+                    response = response()
+                response = response[var]
+        except KeyError:
+            LOG.error('Undefined instance-data key %s', args.varname)
+            return 1
+    if args.list_keys:
+        if callable(response):
+            response = response()
+        if not isinstance(response, dict):
+            LOG.error("--list-keys provided but '%s' is not a dict", var)
+            return 1
+        response = '\n'.join(sorted(response.keys()))
+    else:
+        response = _load_indexed(response)
+    if not isinstance(response, str):
+        response = util.json_dumps(response)
+    print(response)
+    return 0
+
+
 def handle_args(name, args):
     """Handle calls to 'cloud-init query' as a subcommand."""
     paths = None
@@ -133,24 +202,36 @@ def handle_args(name, args):
     else:
         vendor_data_fn = os.path.join(paths.instance_link, 'vendor-data.txt')
 
+    if uid != 0:
+        userdata = functools.partial(_redacted_userdata, user_data_fn)
+        vendordata = functools.partial(_redacted_userdata, vendor_data_fn)
+    else:
+        userdata = functools.partial(load_userdata, user_data_fn)
+        vendordata = functools.partial(load_userdata, vendor_data_fn)
+
+    index = None
+    if not any([args.format, args.dump_all]):
+        # Read only the values asked for when instance-data is indexed
+        index = load_instance_data_index(instance_data_fn)
     try:
-        instance_json = util.load_file(instance_data_fn)
+        if index is None:
+            instance_json = util.load_file(instance_data_fn)
+        else:
+            instance_file = open(instance_data_fn, 'rb')
     except (IOError, OSError) as e:
         if e.errno == EACCES:
             LOG.error("No read permission on '%s'. Try sudo", instance_data_fn)
         else:
             LOG.error('Missing instance-data file: %s', instance_data_fn)
         return 1
+    if index is not None:
+        with instance_file:
+            return _query_index(
+                args, index, instance_file, userdata, vendordata)
 
     instance_data = util.load_json(instance_json)
-    if uid != 0:
-        instance_data['userdata'] = (
-            '<%s> file:%s' % (REDACT_SENSITIVE_VALUE, user_data_fn))
-        instance_data['vendordata'] = (
-            '<%s> file:%s' % (REDACT_SENSITIVE_VALUE, vendor_data_fn))
-    else:
-        instance_data['userdata'] = load_userdata(user_data_fn)
-        instance_data['vendordata'] = load_userdata(vendor_data_fn)
+    instance_data['userdata'] = userdata()
+    instance_data['vendordata'] = vendordata()
     if args.format:
         payload = '## template: jinja\n{fmt}'.format(fmt=args.format)
         rendered_payload = render_jinja_payload(
@@ -12,7 +12,8 @@ from collections import namedtuple
 from cloudinit.cmd import query
 from cloudinit.helpers import Paths
 from cloudinit.sources import (
-    REDACT_SENSITIVE_VALUE, INSTANCE_JSON_FILE, INSTANCE_JSON_SENSITIVE_FILE)
+    REDACT_SENSITIVE_VALUE, INSTANCE_JSON_FILE, INSTANCE_JSON_SENSITIVE_FILE,
+    write_instance_data)
 from cloudinit.tests.helpers import mock
 
 from cloudinit.util import b64e, write_file
@@ -338,4 +339,75 @@ class TestQuery:
             assert 1 == query.handle_args('anyname', args)
         assert expected_error in caplog.text
 
+    def test_handle_args_indexed_varname_reads_only_its_value(
+        self, capsys, tmpdir
+    ):
+        """With an index only the value queried is loaded.
+
+        Neither the whole instance-data nor unreferenced user-data is read.
+        """
+        instance_data = tmpdir.join('instance-data')
+        write_instance_data(
+            instance_data.strpath,
+            {'v1': {'region': 'us-east-1'},
+             'ds': {'meta_data': {'instance-id': 'i-1', 'big': {'a': 1}}}})
+        args = self.args(
+            debug=False, dump_all=False, format=None,
+            instance_data=instance_data.strpath, list_keys=False,
+            user_data=tmpdir.join('missing').strpath,
+            vendor_data=tmpdir.join('missing').strpath,
+            varname='ds.meta_data.instance_id')
+        with mock.patch('os.getuid') as m_getuid:
+            m_getuid.return_value = 0
+            with mock.patch('cloudinit.cmd.query.util.load_json') as m_load:
+                assert 0 == query.handle_args('anyname', args)
+                assert 0 == query.handle_args(
+                    'anyname', args._replace(varname='region'))
+        assert 0 == m_load.call_count
+        out, _err = capsys.readouterr()
+        assert 'i-1\nus-east-1\n' == out
+
+    @pytest.mark.parametrize(
+        'varname,list_keys', (
+            (None, True), ('v1', True), ('ds', False), ('ds.meta_data', True),
+            ('ds.meta_data.x_y', False), ('ds.meta_data.x_y.v1_1', False),
+            ('v1_1', False), ('userdata', False), ('ds.missing', False)))
+    def test_handle_args_indexed_matches_unindexed(
+        self, varname, list_keys, capsys, tmpdir
+    ):
+        """Queries answered from the index match those without it."""
+        instance_data = tmpdir.join('instance-data')
+        data = {'v1': {'v1_1': 'val1.1'}, 'top': 'gun',
+                'ds': {'meta_data': {'x-y': {'v1': {'v1-1': [1]}}}}}
+        args = self.args(
+            debug=False, dump_all=False, format=None,
+            instance_data=instance_data.strpath, list_keys=list_keys,
+            user_data='ud', vendor_data='vd', varname=varname)
+        outputs = []
+        for indexed in (True, False):
+            if indexed:
+                write_instance_data(instance_data.strpath, data)
+            else:
+                instance_data.write(json.dumps(data))
+            with mock.patch('os.getuid') as m_getuid:
+                m_getuid.return_value = 100
+                ret = query.handle_args('anyname', args)
+            outputs.append((ret, capsys.readouterr().out))
+        assert outputs[0] == outputs[1]
+
+    def test_handle_args_ignores_stale_index(self, capsys, tmpdir):
+        """An index of older instance-data is not used."""
+        instance_data = tmpdir.join('instance-data')
+        write_instance_data(instance_data.strpath, {'my-var': 'old'})
+        instance_data.write('{"my-var": "it worked"}')
+        args = self.args(
+            debug=False, dump_all=False, format=None,
+            instance_data=instance_data.strpath, list_keys=False,
+            user_data='ud', vendor_data='vd', varname='my_var')
+        with mock.patch('os.getuid') as m_getuid:
+            m_getuid.return_value = 100
+            assert 0 == query.handle_args('anyname', args)
+        out, _err = capsys.readouterr()
+        assert 'it worked\n' == out
+
 # vi: ts=4 expandtab
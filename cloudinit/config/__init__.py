@@ -42,6 +42,9 @@ def fixup_module(mod, def_freq=PER_INSTANCE):
         setattr(mod, 'distros', [])
     if not hasattr(mod, 'osfamilies'):
         setattr(mod, 'osfamilies', [])
+    if not hasattr(mod, 'resources'):
+        # Modules which do not declare what they modify run exclusively
+        setattr(mod, 'resources', None)
     return mod
 
 # vi: ts=4 expandtab
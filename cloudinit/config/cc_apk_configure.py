@@ -56,6 +56,7 @@ REPOSITORIES_TEMPLATE = """\
 
 frequency = PER_INSTANCE
 distros = ['alpine']
+resources = ['packages']
 schema = {
     'id': 'cc_apk_configure',
     'name': 'APK Configure',
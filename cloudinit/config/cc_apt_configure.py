@@ -29,6 +29,7 @@ ADD_APT_REPO_MATCH = r"^[\w-]+:\w"
 
 frequency = PER_INSTANCE
 distros = ["ubuntu", "debian"]
+resources = ["packages", "apt", "debconf"]
 mirror_property = {
     'type': 'array',
     'item': {
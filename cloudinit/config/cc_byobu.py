@@ -43,6 +43,7 @@ from cloudinit import subp
 from cloudinit import util
 
 distros = ['ubuntu', 'debian']
+resources = ['users', 'debconf']
 
 
 def handle(name, cfg, cloud, log, args):
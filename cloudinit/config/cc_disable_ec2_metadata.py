@@ -32,6 +32,7 @@ from cloudinit import util
 from cloudinit.settings import PER_ALWAYS
 
 frequency = PER_ALWAYS
+resources = ['routes']
 
 REJECT_CMD_IF = ['route', 'add', '-host', '169.254.169.254', 'reject']
 REJECT_CMD_IP = ['ip', 'route', 'add', 'prohibit', '169.254.169.254']
@@ -30,6 +30,7 @@ from cloudinit import subp
 frequency = PER_ALWAYS
 
 distros = ['ubuntu', 'debian']
+resources = ['upstart']
 LOG = logging.getLogger(__name__)
 
 
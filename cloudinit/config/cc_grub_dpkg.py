@@ -48,6 +48,7 @@ from cloudinit import util
 from cloudinit.subp import ProcessExecutionError
 
 distros = ['ubuntu', 'debian']
+resources = ['debconf']
 
 
 def fetch_idevs(log):
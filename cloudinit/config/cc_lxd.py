@@ -53,6 +53,7 @@ from cloudinit import util
 import os
 
 distros = ['ubuntu']
+resources = ['packages', 'snap', 'lxd']
 
 LOG = logging.getLogger(__name__)
 
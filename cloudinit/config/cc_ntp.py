@@ -22,6 +22,7 @@ from cloudinit.settings import PER_INSTANCE
 LOG = logging.getLogger(__name__)
 
 frequency = PER_INSTANCE
+resources = ['packages', 'ntp']
 NTP_CONF = '/etc/ntp.conf'
 NR_POOL_SERVERS = 4
 distros = ['alpine', 'centos', 'debian', 'fedora', 'opensuse', 'rhel',
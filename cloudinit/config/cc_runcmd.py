@@ -25,6 +25,7 @@ from textwrap import dedent
 # configuration.
 
 distros = [ALL_DISTROS]
+resources = ['runcmd']
 
 schema = {
     'id': 'cc_runcmd',
@@ -89,6 +89,7 @@ from cloudinit import util
 from string import ascii_letters, digits
 
 LOG = logging.getLogger(__name__)
+resources = ['ssh', 'users']
 
 # We are removing certain 'painful' letters/numbers
 PW_SET = (''.join([x for x in ascii_letters + digits
@@ -18,6 +18,7 @@ from cloudinit import util
 
 distros = ['ubuntu']
 frequency = PER_INSTANCE
+resources = ['snap']
 
 LOG = logging.getLogger(__name__)
 
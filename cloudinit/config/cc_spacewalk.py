@@ -31,6 +31,7 @@ from cloudinit import subp
 
 
 distros = ['redhat', 'fedora']
+resources = ['packages']
 required_packages = ['rhn-setup']
 def_ca_cert_path = "/usr/share/rhn/RHN-ORG-TRUSTED-SSL-CERT"
 
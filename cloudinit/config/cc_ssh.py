@@ -105,6 +105,18 @@ using the ``ssh_genkeytypes`` config flag, which accepts a list of host key
 types to use. For each host key type for which this module has been instructed
 to create a keypair, if a key of the same type is already present on the
 system (i.e. if ``ssh_deletekeys`` was false), no key will be generated.
+Keys of different types are generated concurrently, with at most one
+``ssh-keygen`` per cpu.
+
+Key generation can be started early, in the ``init-local`` stage, by setting
+``ssh_genkeys_early`` to true in system config. Keys of the types in the
+system config ``ssh_genkeytypes`` are then generated in the background, into
+a directory under ``/run/cloud-init``, while the rest of boot continues. This
+module waits for them and then applies the final config, including
+user-data, as usual: ``ssh_deletekeys`` and ``ssh_keys`` are honoured, and
+an early key is only moved into place for a type that would otherwise be
+generated. Unused early keys are deleted. Key generation still running after
+5 minutes is killed.
 
 Supported host key types for the ``ssh_keys`` and the ``ssh_genkeytypes``
 config flags are:
@@ -142,6 +154,7 @@ config flags are:
             ssh-dsa-cert-v01@openssh.com AAAAIHNzaC1lZDI1NTE5LWNlcnQt ...
 
     ssh_genkeytypes: <key type>
+    ssh_genkeys_early: <true/false>
     disable_root: <true/false>
     disable_root_opts: <disable root options string>
     ssh_authorized_keys:
@@ -154,14 +167,21 @@ config flags are:
 """
 
 import glob
+import json
 import os
+import shutil
+import signal
 import sys
+import time
+from concurrent import futures
 
+from cloudinit import atomic_helper
 from cloudinit.distros import ug_util
 from cloudinit import ssh_util
 from cloudinit import subp
 from cloudinit import util
 
+resources = ['ssh', 'users']
 
 GENERATE_KEY_NAMES = ['rsa', 'dsa', 'ecdsa', 'ed25519']
 KEY_FILE_TPL = '/etc/ssh/ssh_host_%s_key'
@@ -182,17 +202,258 @@ for k in GENERATE_KEY_NAMES:
 
 KEY_GEN_TPL = 'o=$(ssh-keygen -yf "%s") && echo "$o" root@localhost > "%s"'
 
+# Seconds to wait for host keys being generated early, in init-local
+EARLY_KEYS_TIMEOUT = 300
+
+
+def delete_host_keys(log, keep=()):
+    """Delete existing host key files except those in keep."""
+    key_pth = os.path.join("/etc/ssh/", "ssh_host_*key*")
+    for f in glob.glob(key_pth):
+        if f in keep:
+            continue
+        try:
+            util.del_file(f)
+        except Exception:
+            util.logexc(log, "Failed deleting key file %s", f)
+
+
+def generate_host_keys(genkeys, log, max_workers=None, key_file_tpl=None):
+    """Generate a host key of each type in genkeys that does not exist.
+
+    ssh-keygen runs for up to max_workers key types at a time, by default
+    one per cpu. Output and errors are reported in the order of genkeys.
+    Keys are written to key_file_tpl, by default KEY_FILE_TPL, formatted
+    with the key type.
+
+    :return: list of the key types generated.
+    """
+    if not key_file_tpl:
+        key_file_tpl = KEY_FILE_TPL
+    lang_c = os.environ.copy()
+    lang_c['LANG'] = 'C'
+    keytypes = []
+    for keytype in genkeys:
+        keyfile = key_file_tpl % (keytype)
+        if keytype in keytypes or os.path.exists(keyfile):
+            continue
+        util.ensure_dir(os.path.dirname(keyfile))
+        keytypes.append(keytype)
+    if not keytypes:
+        return []
+
+    def keygen(keytype):
+        keyfile = key_file_tpl % (keytype)
+        cmd = ['ssh-keygen', '-t', keytype, '-N', '', '-f', keyfile]
+        try:
+            out, _err = subp.subp(cmd, capture=True, env=lang_c)
+            return (out, None)
+        except subp.ProcessExecutionError as e:
+            return (None, e)
+
+    if not max_workers:
+        max_workers = os.cpu_count() or 1
+    # TODO(harlowja): Is this guard needed?
+    with util.SeLinuxGuard(os.path.dirname(key_file_tpl), recursive=True):
+        with futures.ThreadPoolExecutor(
+                max_workers=min(max_workers, len(keytypes))) as executor:
+            results = list(executor.map(keygen, keytypes))
+
+    generated = []
+    for (keytype, (out, e)) in zip(keytypes, results):
+        if e is None:
+            sys.stdout.write(util.decode_binary(out))
+            generated.append(keytype)
+            continue
+        err = util.decode_binary(e.stderr).lower()
+        if (e.exit_code == 1 and
+                err.lower().startswith("unknown key")):
+            log.debug("ssh-keygen: unknown key type '%s'", keytype)
+        else:
+            log.warning("Failed generating key type %s to file %s:"
+                        " ssh-keygen exited %s: %s", keytype,
+                        key_file_tpl % (keytype), e.exit_code,
+                        util.decode_binary(e.stderr).strip())
+    return generated
+
+
+def start_early_host_keys(cfg, paths, instance_id, log):
+    """Generate host keys for a new instance in a background process.
+
+    Called from init-local when ssh_genkeys_early is set, so that key
+    generation overlaps the rest of boot. Keys are generated into the
+    ssh_host_keys_early_dir run directory, never into /etc/ssh, as
+    user-data may still change ssh_deletekeys or ssh_genkeytypes. handle()
+    installs the keys that the final config asks for.
+
+    The ssh_host_keys_early run file records the child's pid before this
+    returns, and the key types generated once the child is done.
+    """
+    if "ssh_keys" in cfg:
+        log.debug("Not generating ssh host keys early, ssh_keys provided")
+        return
+    genkeys = util.get_cfg_option_list(cfg, 'ssh_genkeytypes',
+                                       GENERATE_KEY_NAMES)
+    marker = paths.get_runpath('ssh_host_keys_early')
+    keydir = paths.get_runpath('ssh_host_keys_early_dir')
+    if os.path.exists(keydir):
+        util.del_dir(keydir)
+    util.ensure_dir(keydir, mode=0o700)
+    # The child only starts once the marker holds its pid, so that its own
+    # update of the marker cannot be overwritten by the parent.
+    (read_fd, write_fd) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(write_fd)
+        try:
+            # A process group of its own lets handle() kill ssh-keygen too.
+            os.setpgid(0, 0)
+            os.read(read_fd, 1)
+            _generate_early_host_keys(marker, instance_id, genkeys, keydir,
+                                      log)
+            os._exit(0)
+        except Exception:
+            util.logexc(log, "Failed generating ssh host keys early")
+            os._exit(1)
+    os.close(read_fd)
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass  # the child already did
+    try:
+        atomic_helper.write_json(
+            marker, {'instance_id': instance_id, 'pid': pid, 'done': False,
+                     'keytypes': []}, mode=0o600)
+    finally:
+        os.close(write_fd)
+    log.debug("Forked child %s generating ssh host keys %s early in %s",
+              pid, genkeys, keydir)
+
+
+def _generate_early_host_keys(marker, instance_id, genkeys, keydir, log):
+    status = {'instance_id': instance_id, 'pid': os.getpid(),
+              'done': False, 'keytypes': []}
+    try:
+        status['keytypes'] = generate_host_keys(
+            genkeys, log, key_file_tpl=os.path.join(
+                keydir, os.path.basename(KEY_FILE_TPL)))
+    finally:
+        status['done'] = True
+        atomic_helper.write_json(marker, status, mode=0o600)
+
+
+def _pid_running(pid):
+    if not isinstance(pid, int) or pid <= 0:
+        # A marker without a valid pid has no process to wait for
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _kill_early_host_keys(pid, log, timeout=5):
+    """Kill the early key generation process group and wait for it to exit.
+
+    The child is reaped here when this process forked it. Otherwise its
+    parent, or init, does so and this waits for the pid to disappear.
+    """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError as e:
+        log.debug("Failed killing early ssh host key generation %s: %s",
+                  pid, e)
+    try:
+        os.waitpid(pid, 0)
+        return
+    except ChildProcessError:
+        pass
+    start = time.time()
+    while _pid_running(pid):
+        if time.time() - start > timeout:
+            log.warning("Early ssh host key generation %s did not exit", pid)
+            return
+        time.sleep(0.1)
+
+
+def wait_for_early_host_keys(paths, instance_id, log,
+                             timeout=EARLY_KEYS_TIMEOUT):
+    """Return key types generated early for instance_id.
+
+    Waits for the background key generation started in init-local, if any,
+    to finish. When it is still running after timeout seconds it is killed
+    and waited for, so it is never running once this returns.
+
+    :return: None when no keys were generated early for instance_id,
+        otherwise the list of key types in the ssh_host_keys_early_dir run
+        directory.
+    """
+    marker = paths.get_runpath('ssh_host_keys_early')
+    start = time.time()
+    while True:
+        try:
+            status = json.loads(util.load_file(marker))
+        except (IOError, OSError, ValueError):
+            return None
+        if status.get('instance_id') != instance_id:
+            return None
+        if status.get('done'):
+            return status.get('keytypes', [])
+        if not _pid_running(status.get('pid')):
+            log.warning("Early ssh host key generation did not finish")
+            return []
+        if time.time() - start > timeout:
+            log.warning("Timed out waiting for early ssh host key"
+                        " generation, killing it")
+            _kill_early_host_keys(status['pid'], log)
+            return []
+        time.sleep(0.1)
+
+
+def install_early_host_keys(keydir, early_keytypes, genkeys, log):
+    """Move keys generated early into place for the types in genkeys.
+
+    Only key types without an existing host key are installed, exactly as
+    generate_host_keys would only generate those.
+
+    :return: list of the key types installed.
+    """
+    installed = []
+    early_tpl = os.path.join(keydir, os.path.basename(KEY_FILE_TPL))
+    with util.SeLinuxGuard(os.path.dirname(KEY_FILE_TPL), recursive=True):
+        for keytype in genkeys:
+            keyfile = KEY_FILE_TPL % keytype
+            if (keytype not in early_keytypes or keytype in installed or
+                    os.path.exists(keyfile)):
+                continue
+            try:
+                util.ensure_dir(os.path.dirname(keyfile))
+                for suffix in ('.pub', ''):
+                    shutil.move(early_tpl % keytype + suffix,
+                                keyfile + suffix)
+            except (IOError, OSError):
+                util.logexc(log, "Failed installing early %s host key",
+                            keytype)
+                for suffix in ('', '.pub'):
+                    util.del_file(keyfile + suffix)
+                continue
+            installed.append(keytype)
+    return installed
+
 
 def handle(_name, cfg, cloud, log, _args):
 
+    # Keys generated early in init-local are staged for this module to
+    # apply the final config to. Wait in any case: the background process
+    # must be gone before host keys are touched.
+    early_keytypes = wait_for_early_host_keys(
+        cloud.paths, cloud.get_instance_id(), log)
     # remove the static keys from the pristine image
     if cfg.get("ssh_deletekeys", True):
-        key_pth = os.path.join("/etc/ssh/", "ssh_host_*key*")
-        for f in glob.glob(key_pth):
-            try:
-                util.del_file(f)
-            except Exception:
-                util.logexc(log, "Failed deleting key file %s", f)
+        delete_host_keys(log)
 
     if "ssh_keys" in cfg:
         # if there are keys and/or certificates in cloud-config, use them
@@ -226,28 +487,14 @@ def handle(_name, cfg, cloud, log, _args):
         genkeys = util.get_cfg_option_list(cfg,
                                            'ssh_genkeytypes',
                                            GENERATE_KEY_NAMES)
-        lang_c = os.environ.copy()
-        lang_c['LANG'] = 'C'
-        for keytype in genkeys:
-            keyfile = KEY_FILE_TPL % (keytype)
-            if os.path.exists(keyfile):
-                continue
-            util.ensure_dir(os.path.dirname(keyfile))
-            cmd = ['ssh-keygen', '-t', keytype, '-N', '', '-f', keyfile]
-
-            # TODO(harlowja): Is this guard needed?
-            with util.SeLinuxGuard("/etc/ssh", recursive=True):
-                try:
-                    out, err = subp.subp(cmd, capture=True, env=lang_c)
-                    sys.stdout.write(util.decode_binary(out))
-                except subp.ProcessExecutionError as e:
-                    err = util.decode_binary(e.stderr).lower()
-                    if (e.exit_code == 1 and
-                            err.lower().startswith("unknown key")):
-                        log.debug("ssh-keygen: unknown key type '%s'", keytype)
-                    else:
-                        util.logexc(log, "Failed generating key type %s to "
-                                    "file %s", keytype, keyfile)
+        if early_keytypes:
+            install_early_host_keys(
+                cloud.paths.get_runpath('ssh_host_keys_early_dir'),
+                early_keytypes, genkeys, log)
+        generate_host_keys(genkeys, log)
+    if early_keytypes is not None:
+        shutil.rmtree(cloud.paths.get_runpath('ssh_host_keys_early_dir'),
+                      ignore_errors=True)
 
     if "ssh_publish_hostkeys" in cfg:
         host_key_blacklist = util.get_cfg_option_list(
@@ -37,6 +37,7 @@ import pwd
 
 # https://launchpad.net/ssh-import-id
 distros = ['ubuntu', 'debian']
+resources = ['ssh', 'users']
 
 
 def handle(_name, cfg, cloud, log, args):
@@ -15,6 +15,7 @@ from cloudinit import util
 UA_URL = 'https://ubuntu.com/advantage'
 
 distros = ['ubuntu']
+resources = ['packages', 'apt', 'snap']
 
 schema = {
     'id': 'cc_ubuntu_advantage',
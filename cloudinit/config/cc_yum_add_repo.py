@@ -37,6 +37,7 @@ from configparser import ConfigParser
 from cloudinit import util
 
 distros = ['centos', 'fedora', 'rhel']
+resources = ['packages']
 
 
 def _canonicalize_id(repo_id):
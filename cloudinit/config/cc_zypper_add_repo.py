@@ -15,6 +15,7 @@ from cloudinit.settings import PER_ALWAYS
 from cloudinit import util
 
 distros = ['opensuse', 'sles']
+resources = ['packages']
 
 schema = {
     'id': 'cc_zypper_add_repo',
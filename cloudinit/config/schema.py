@@ -7,7 +7,11 @@ from cloudinit.util import find_modules, load_file
 
 import argparse
 from collections import defaultdict
+from concurrent import futures
+import contextlib
 from copy import deepcopy
+import functools
+import io
 import logging
 import os
 import re
@@ -39,6 +43,8 @@ SCHEMA_LIST_ITEM_TMPL = (
     '{prefix}Each item in **{prop_name}** list supports the following keys:')
 SCHEMA_EXAMPLES_HEADER = '\n**Examples**::\n\n'
 SCHEMA_EXAMPLES_SPACER_TEMPLATE = '\n    # --- Example{0} ---'
+# Number of schemas to keep validators for
+VALIDATOR_CACHE_SIZE = 64
 
 
 class SchemaValidationError(ValueError):
@@ -72,6 +78,57 @@ def is_schema_byte_string(checker, instance):
             isinstance(instance, (bytes,)))
 
 
+@functools.lru_cache(maxsize=None)
+def _get_validator_class():
+    """Return the jsonschema validator class for cloud-config schema."""
+    from jsonschema import Draft4Validator
+    from jsonschema.validators import create, extend
+
+    # Allow for bytes to be presented as an acceptable valid value for string
+    # type jsonschema attributes in cloud-init's schema.
+    # This allows #cloud-config to provide valid yaml "content: !!binary | ..."
+    if hasattr(Draft4Validator, 'TYPE_CHECKER'):  # jsonschema 3.0+
+        type_checker = Draft4Validator.TYPE_CHECKER.redefine(
+            'string', is_schema_byte_string)
+        return extend(Draft4Validator, type_checker=type_checker)
+    # jsonschema 2.6 workaround
+    types = Draft4Validator.DEFAULT_TYPES
+    # Allow bytes as well as string (and disable a spurious
+    # unsupported-assignment-operation pylint warning which appears because
+    # this code path isn't written against the latest jsonschema).
+    types['string'] = (str, bytes)  # pylint: disable=E1137
+    return create(
+        meta_schema=Draft4Validator.META_SCHEMA,
+        validators=Draft4Validator.VALIDATORS,
+        version="draft4",
+        default_types=types)
+
+
+_VALIDATORS = {}
+
+
+def _get_validator(schema):
+    """Return a validator for schema, built once per schema.
+
+    @raises: ImportError when jsonschema is not present.
+
+    Validators are looked up by the identity of schema, which cloud-config
+    modules define once. Serializing the schema to fingerprint it would cost
+    about as much as building the validator. A validator reads its schema as
+    it validates, so changes made to the schema later still apply.
+    """
+    cached = _VALIDATORS.get(id(schema))
+    # The schema is kept with its validator so its id is not reused
+    if cached and cached[0] is schema:
+        return cached[1]
+    from jsonschema import FormatChecker
+    validator = _get_validator_class()(schema, format_checker=FormatChecker())
+    if len(_VALIDATORS) >= VALIDATOR_CACHE_SIZE:
+        _VALIDATORS.clear()
+    _VALIDATORS[id(schema)] = (schema, validator)
+    return validator
+
+
 def validate_cloudconfig_schema(config, schema, strict=False):
     """Validate provided config meets the schema definition.
 
@@ -86,32 +143,11 @@ def validate_cloudconfig_schema(config, schema, strict=False):
         against the provided schema.
     """
     try:
-        from jsonschema import Draft4Validator, FormatChecker
-        from jsonschema.validators import create, extend
+        validator = _get_validator(schema)
     except ImportError:
         logging.debug(
             'Ignoring schema validation. python-jsonschema is not present')
         return
-
-    # Allow for bytes to be presented as an acceptable valid value for string
-    # type jsonschema attributes in cloud-init's schema.
-    # This allows #cloud-config to provide valid yaml "content: !!binary | ..."
-    if hasattr(Draft4Validator, 'TYPE_CHECKER'):  # jsonschema 3.0+
-        type_checker = Draft4Validator.TYPE_CHECKER.redefine(
-            'string', is_schema_byte_string)
-        cloudinitValidator = extend(Draft4Validator, type_checker=type_checker)
-    else:  # jsonschema 2.6 workaround
-        types = Draft4Validator.DEFAULT_TYPES
-        # Allow bytes as well as string (and disable a spurious
-        # unsupported-assignment-operation pylint warning which appears because
-        # this code path isn't written against the latest jsonschema).
-        types['string'] = (str, bytes)  # pylint: disable=E1137
-        cloudinitValidator = create(
-            meta_schema=Draft4Validator.META_SCHEMA,
-            validators=Draft4Validator.VALIDATORS,
-            version="draft4",
-            default_types=types)
-    validator = cloudinitValidator(schema, format_checker=FormatChecker())
     errors = ()
     for error in sorted(validator.iter_errors(config), key=lambda e: e.path):
         path = '.'.join([str(p) for p in error.path])
@@ -238,6 +274,47 @@ def validate_cloudconfig_file(config_path, schema, annotate=False):
         raise
 
 
+def _validate_cloudconfig_file_output(config_path, annotate):
+    """Validate config_path against the full schema, capturing annotations.
+
+    @return: Tuple of whether config_path is valid, the error to report if
+        any and the output printed when annotating.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            validate_cloudconfig_file(config_path, get_schema(), annotate)
+        except SchemaValidationError as e:
+            # Annotations already describe the errors
+            return (False, None if annotate else str(e), output.getvalue())
+        except RuntimeError as e:
+            return (False, str(e), output.getvalue())
+    return (True, None, output.getvalue())
+
+
+def validate_cloudconfig_files(config_paths, annotate=False, jobs=1):
+    """Validate many cloud-config files against the full schema.
+
+    @param config_paths: List of cloud-config file paths.
+    @param annotate: Boolean set True to return the files annotated with
+        their errors.
+    @param jobs: Number of processes validating files concurrently.
+
+    @return: List of (valid, error, annotated output) tuples in the order of
+        config_paths. error is None when valid or when annotated.
+    """
+    if jobs <= 1 or len(config_paths) <= 1:
+        return [_validate_cloudconfig_file_output(config_path, annotate)
+                for config_path in config_paths]
+    # Load the schema once, forked workers inherit it
+    get_schema()
+    with futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(
+            _validate_cloudconfig_file_output, config_paths,
+            [annotate] * len(config_paths),
+            chunksize=max(1, len(config_paths) // (jobs * 4))))
+
+
 def _schemapath_for_cloudconfig(config, original_content):
     """Return a dictionary mapping schemapath to original_content line number.
 
@@ -440,8 +517,8 @@ def get_parser(parser=None):
         parser = argparse.ArgumentParser(
             prog='cloudconfig-schema',
             description='Validate cloud-config files or document schema')
-    parser.add_argument('-c', '--config-file',
-                        help='Path of the cloud-config yaml file to validate')
+    parser.add_argument('-c', '--config-file', nargs='+',
+                        help='Paths of cloud-config yaml files to validate')
     parser.add_argument('--system', action='store_true', default=False,
                         help='Validate the system cloud-config userdata')
     parser.add_argument('-d', '--docs', nargs='+',
@@ -449,6 +526,9 @@ def get_parser(parser=None):
                               ' space-delimited cc_names.'))
     parser.add_argument('--annotate', action="store_true", default=False,
                         help='Annotate existing cloud-config file with errors')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('Number of processes validating config files'
+                              ' (default: %(default)s)'))
     return parser
 
 
@@ -459,20 +539,25 @@ def handle_schema_args(name, args):
         error('Expected one of --config-file, --system or --docs arguments')
     full_schema = get_schema()
     if args.config_file or args.system:
-        try:
-            validate_cloudconfig_file(
-                args.config_file, full_schema, args.annotate)
-        except SchemaValidationError as e:
-            if not args.annotate:
-                error(str(e))
-        except RuntimeError as e:
-            error(str(e))
-        else:
-            if args.config_file is None:
-                cfg_name = "system userdata"
-            else:
-                cfg_name = args.config_file
-            print("Valid cloud-config:", cfg_name)
+        config_paths = args.config_file or [None]
+        results = validate_cloudconfig_files(
+            config_paths, args.annotate, args.jobs)
+        errors = []
+        for config_path, (valid, message, output) in zip(
+                config_paths, results):
+            print(output, end='')
+            if valid:
+                if config_path is None:
+                    cfg_name = "system userdata"
+                else:
+                    cfg_name = config_path
+                print("Valid cloud-config:", cfg_name)
+            elif message and len(config_paths) > 1:
+                errors.append('{0}: {1}'.format(config_path, message))
+            elif message:
+                errors.append(message)
+        if errors:
+            error('\n'.join(errors))
     elif args.docs:
         schema_ids = [subschema['id'] for subschema in full_schema['allOf']]
         schema_ids += ['all']
@@ -1,6 +1,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import os.path
+import subprocess
 
 from cloudinit.config import cc_ssh
 from cloudinit import ssh_util
@@ -403,3 +404,214 @@ class TestHandleSsh(CiTestCase):
         # Check that all expected output has been done.
         for call_ in expected_calls:
             self.assertIn(call_, m_write_file.call_args_list)
+
+
+class TestGenerateHostKeys(CiTestCase):
+    """Test cc_ssh.generate_host_keys."""
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestGenerateHostKeys, self).setUp()
+        tpl = os.path.join(self.tmp_dir(), 'ssh_host_%s_key')
+        patcher = mock.patch(MODPATH + 'KEY_FILE_TPL', tpl)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(MODPATH + 'util.SeLinuxGuard')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch(MODPATH + 'subp.subp')
+    def test_generates_each_missing_key_type_once(self, m_subp):
+        """Each missing key type is generated once, existing ones skipped."""
+        cc_ssh.util.write_file(cc_ssh.KEY_FILE_TPL % 'dsa', 'exists')
+        m_subp.return_value = ('', '')
+        self.assertEqual(
+            ['rsa', 'ecdsa'],
+            cc_ssh.generate_host_keys(['rsa', 'dsa', 'ecdsa', 'rsa'], LOG,
+                                      max_workers=3))
+        self.assertCountEqual(
+            ['rsa', 'ecdsa'], [c[0][0][2] for c in m_subp.call_args_list])
+
+    @mock.patch(MODPATH + 'subp.subp')
+    def test_errors_reported_per_key_type(self, m_subp):
+        """A failing key type does not prevent the others."""
+        def keygen(cmd, **kwargs):
+            if cmd[2] == 'bogus':
+                raise cc_ssh.subp.ProcessExecutionError(
+                    stderr='unknown key type bogus', exit_code=1)
+            if cmd[2] == 'dsa':
+                raise cc_ssh.subp.ProcessExecutionError(
+                    stderr='no entropy', exit_code=2)
+            return ('', '')
+        m_subp.side_effect = keygen
+        self.assertEqual(
+            ['rsa'], cc_ssh.generate_host_keys(['bogus', 'dsa', 'rsa'], LOG))
+        logs = self.logs.getvalue()
+        self.assertIn('WARNING: Failed generating key type dsa to file %s:'
+                      ' ssh-keygen exited 2: no entropy' %
+                      cc_ssh.KEY_FILE_TPL % 'dsa', logs)
+        self.assertNotIn('bogus to file', logs)
+
+
+class TestEarlyHostKeys(CiTestCase):
+    """Test host keys generated early in init-local."""
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestEarlyHostKeys, self).setUp()
+        self.paths = mock.Mock()
+        self.marker = self.tmp_path('ssh-host-keys-early.json')
+        self.keydir = self.tmp_path('ssh-host-keys-early')
+        self.paths.get_runpath.side_effect = lambda name: {
+            'ssh_host_keys_early': self.marker,
+            'ssh_host_keys_early_dir': self.keydir}[name]
+        self.etc_ssh = self.tmp_path('etc-ssh')
+        for (target, value) in (
+                ('KEY_FILE_TPL',
+                 os.path.join(self.etc_ssh, 'ssh_host_%s_key')),
+                ('util.SeLinuxGuard', mock.MagicMock())):
+            patcher = mock.patch(MODPATH + target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _write_status(self, **status):
+        base = {'instance_id': 'i-1', 'pid': os.getpid(), 'done': True,
+                'keytypes': ['rsa']}
+        base.update(status)
+        cc_ssh.util.write_file(self.marker, cc_ssh.json.dumps(base))
+
+    def _write_keys(self, directory, keytypes, content):
+        for keytype in keytypes:
+            for suffix in ('', '.pub'):
+                cc_ssh.util.write_file(
+                    os.path.join(directory,
+                                 'ssh_host_%s_key%s' % (keytype, suffix)),
+                    '%s %s%s' % (content, keytype, suffix))
+
+    def _key(self, keytype):
+        return cc_ssh.util.load_file(cc_ssh.KEY_FILE_TPL % keytype)
+
+    def _handle(self, cfg):
+        cloud = mock.Mock()
+        cloud.paths = self.paths
+        cloud.get_instance_id.return_value = 'i-1'
+        cfg = dict(cfg, ssh_publish_hostkeys={'enabled': False})
+        with mock.patch(MODPATH + 'ug_util.normalize_users_groups',
+                        return_value=([], {})):
+            with mock.patch(MODPATH + 'ssh_util.setup_user_keys'):
+                with mock.patch(MODPATH + 'subp.subp',
+                                return_value=('', '')) as m_subp:
+                    cc_ssh.handle('name', cfg, cloud, LOG, None)
+        return m_subp
+
+    def test_no_early_keys(self):
+        self.assertIsNone(
+            cc_ssh.wait_for_early_host_keys(self.paths, 'i-1', LOG))
+
+    def test_early_keys_for_this_instance(self):
+        self._write_status()
+        self.assertEqual(
+            ['rsa'], cc_ssh.wait_for_early_host_keys(self.paths, 'i-1', LOG))
+        self.assertIsNone(
+            cc_ssh.wait_for_early_host_keys(self.paths, 'i-2', LOG))
+
+    @mock.patch(MODPATH + '_pid_running', return_value=False)
+    def test_early_keys_from_dead_process_ignored(self, m_running):
+        self._write_status(done=False)
+        self.assertEqual(
+            [], cc_ssh.wait_for_early_host_keys(self.paths, 'i-1', LOG))
+
+    def test_early_keys_without_pid_ignored(self):
+        """A marker without a valid pid is treated as a dead process."""
+        for pid in (None, 'x', 0):
+            self._write_status(done=False, pid=pid)
+            self.assertEqual(
+                [], cc_ssh.wait_for_early_host_keys(self.paths, 'i-1', LOG))
+        base = {'instance_id': 'i-1', 'done': False}
+        cc_ssh.util.write_file(self.marker, cc_ssh.json.dumps(base))
+        self.assertEqual(
+            [], cc_ssh.wait_for_early_host_keys(self.paths, 'i-1', LOG))
+
+    def test_running_past_timeout_is_killed_and_reaped(self):
+        """Key generation still running at the timeout does not outlive it."""
+        proc = subprocess.Popen(['sleep', '60'], start_new_session=True)
+        self.addCleanup(proc.kill)
+        self._write_status(done=False, pid=proc.pid)
+        self.assertEqual(
+            [], cc_ssh.wait_for_early_host_keys(
+                self.paths, 'i-1', LOG, timeout=0))
+        self.assertFalse(cc_ssh._pid_running(proc.pid))
+        self.assertIn('Timed out waiting for early ssh host key generation',
+                      self.logs.getvalue())
+
+    def test_start_records_pid_before_returning(self):
+        """The marker names the child as soon as it has been started."""
+        def generate_host_keys(genkeys, log, key_file_tpl):
+            self._write_keys(os.path.dirname(key_file_tpl), genkeys, 'early')
+            return genkeys
+
+        with mock.patch(MODPATH + 'generate_host_keys',
+                        side_effect=generate_host_keys):
+            cc_ssh.start_early_host_keys(
+                {'ssh_genkeytypes': ['ed25519']}, self.paths, 'i-1', LOG)
+            status = cc_ssh.json.loads(cc_ssh.util.load_file(self.marker))
+        self.assertEqual('i-1', status['instance_id'])
+        self.assertEqual(
+            ['ed25519'],
+            cc_ssh.wait_for_early_host_keys(self.paths, 'i-1', LOG))
+        self.assertEqual(status['pid'], os.waitpid(status['pid'], 0)[0])
+        # Keys are staged, not written to /etc/ssh
+        self.assertFalse(os.path.exists(self.etc_ssh))
+        self.assertEqual(
+            'early ed25519',
+            cc_ssh.util.load_file(
+                os.path.join(self.keydir, 'ssh_host_ed25519_key')))
+
+    @mock.patch(MODPATH + 'delete_host_keys')
+    def test_handle_user_data_keeps_image_keys(self, m_delete):
+        """User-data ssh_deletekeys: false keeps the image's host keys."""
+        self._write_keys(self.etc_ssh, ['rsa'], 'image')
+        self._write_keys(self.keydir, ['rsa', 'ed25519'], 'early')
+        self._write_status(keytypes=['rsa', 'ed25519'])
+        m_subp = self._handle(
+            {'ssh_deletekeys': False, 'ssh_genkeytypes': ['rsa', 'ed25519']})
+        m_delete.assert_not_called()
+        m_subp.assert_not_called()
+        self.assertEqual('image rsa', self._key('rsa'))
+        self.assertEqual('early ed25519', self._key('ed25519'))
+        self.assertFalse(os.path.exists(self.keydir))
+
+    @mock.patch(MODPATH + 'delete_host_keys')
+    def test_handle_installs_early_keys_of_final_types(self, m_delete):
+        """Early keys are installed for the final ssh_genkeytypes only."""
+        self._write_keys(self.keydir, ['rsa', 'dsa'], 'early')
+        self._write_status(keytypes=['rsa', 'dsa'])
+        m_subp = self._handle({'ssh_genkeytypes': ['rsa', 'ecdsa']})
+        m_delete.assert_called_once_with(LOG)
+        self.assertEqual('early rsa', self._key('rsa'))
+        self.assertEqual('early rsa.pub',
+                         cc_ssh.util.load_file(
+                             cc_ssh.KEY_FILE_TPL % 'rsa' + '.pub'))
+        self.assertFalse(os.path.exists(cc_ssh.KEY_FILE_TPL % 'dsa'))
+        self.assertEqual(
+            ['ecdsa'], [c[0][0][2] for c in m_subp.call_args_list])
+        self.assertFalse(os.path.exists(self.keydir))
+
+    @mock.patch(MODPATH + 'delete_host_keys')
+    @mock.patch(MODPATH + 'wait_for_early_host_keys', return_value=['rsa'])
+    def test_handle_ssh_keys_waits_and_discards_early_keys(self, m_wait,
+                                                           m_delete):
+        """ssh_keys from user-data replace keys generated early."""
+        self._write_keys(self.keydir, ['rsa'], 'early')
+        key_to_file = {'rsa_private': (cc_ssh.KEY_FILE_TPL % 'rsa', 0o600)}
+        with mock.patch.dict(MODPATH + 'CONFIG_KEY_TO_FILE', key_to_file,
+                             clear=True):
+            with mock.patch.dict(MODPATH + 'PRIV_TO_PUB', {}, clear=True):
+                self._handle({'ssh_keys': {'rsa_private': 'private'}})
+        m_wait.assert_called_once_with(self.paths, 'i-1', LOG)
+        self.assertEqual('private', self._key('rsa'))
+        self.assertFalse(os.path.exists(self.keydir))
+
+# vi: ts=4 expandtab
@@ -0,0 +1,132 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Cache configuration parsed from yaml files across cloud-init processes.
+
+Every stage and most subcommands read and merge /etc/cloud/cloud.cfg, each
+cloud.cfg.d/*.cfg file and the instance cloud-config, parsing the same yaml
+again in each process. Once the cache has been loaded, :meth:`ConfigCache.get`
+keeps parsed configuration in a root-only file under /run/cloud-init, along
+with the inode, size and modification time of every file and directory it was
+read from. A cached configuration is used while none of those changed.
+
+Configuration read from files modified while it was being read, or within
+the timestamp granularity of some filesystems before, is not cached.
+"""
+
+import copy
+import os
+import pickle
+import time
+
+from cloudinit import atomic_helper
+from cloudinit import log as logging
+from cloudinit import util
+from cloudinit import version
+
+LOG = logging.getLogger(__name__)
+
+CONFIG_CACHE_FILE = '/run/cloud-init/config-cache.pkl'
+# Files modified this many seconds before being read may change again
+# without a visible change of their modification time.
+MTIME_GRANULARITY = 2
+
+
+def _source_key(path):
+    """Return what identifies the content of path, None if it is absent."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class ConfigCache(object):
+    """Parsed configuration, optionally backed by a file."""
+
+    def __init__(self):
+        self.path = None
+        self.entries = {}
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def load(self, path):
+        """Load configuration cached in path and cache new configuration there.
+
+        The file is only trusted when it is owned by the current user and
+        nobody else can read or write it.
+        """
+        entries = {}
+        try:
+            with open(path, 'rb') as stream:
+                stat = os.fstat(stream.fileno())
+                if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+                    LOG.debug("Ignoring config cache %s not private to uid %d",
+                              path, os.getuid())
+                else:
+                    data = pickle.load(stream)
+                    if data.get('version') == version.version_string():
+                        entries = data['entries']
+        except (IOError, OSError):
+            pass
+        except Exception as e:
+            LOG.debug("Ignoring invalid config cache %s: %s", path, e)
+        self.path = path
+        self.entries = entries
+
+    def clear(self):
+        """Forget all configuration and stop using the cache file."""
+        self.path = None
+        self.entries = {}
+
+    def get(self, key, read):
+        """Return the configuration cached for key or read() it.
+
+        @param key: Hashable key naming the configuration.
+        @param read: Callable returning the configuration and the paths of
+            the files and directories it was read from, including those
+            which were looked for but absent.
+        @return: A copy of the configuration, callers may change it.
+        """
+        if not self.enabled:
+            return read()[0]
+        entry = self.entries.get(key)
+        if entry and all(_source_key(path) == source_key
+                         for (path, source_key) in entry['sources']):
+            return copy.deepcopy(entry['config'])
+        start = time.time() - MTIME_GRANULARITY
+        (config, paths) = read()
+        sources = [(path, _source_key(path)) for path in paths]
+        if any(source_key and source_key[2] >= start * 1e9
+               for (_path, source_key) in sources):
+            LOG.debug("Not caching config %s read from files being changed",
+                      key)
+            return config
+        self.entries[key] = {'config': copy.deepcopy(config),
+                             'sources': sources}
+        self._write()
+        return config
+
+    def _write(self):
+        # Written to a temporary file renamed into place so that a
+        # concurrent reader never sees a partial file.
+        try:
+            atomic_helper.write_file(
+                self.path, pickle.dumps(
+                    {'version': version.version_string(),
+                     'entries': self.entries}),
+                mode=0o600, omode='wb')
+        except Exception as e:
+            LOG.debug("Failed to write config cache %s: %s", self.path, e)
+
+
+config_cache = ConfigCache()
+
+
+def read_conf(fname):
+    """Return util.read_conf(fname) through the config cache."""
+    return config_cache.get(
+        ('read_conf', fname), lambda: (util.read_conf(fname), [fname]))
+
+# vi: ts=4 expandtab
@@ -1,4 +1,5 @@
 # This file is part of cloud-init. See LICENSE file for license information.
+from cloudinit import boot_facts
 from cloudinit import log as logging
 from cloudinit import subp
 from cloudinit.util import is_container, is_FreeBSD
@@ -39,6 +40,28 @@ DMIDECODE_TO_KERNEL = {
     'system-version': kdmi('product_version', 'smbios.system.version'),
 }
 
+# Where dmidecode prints each of the keys above in a full dump, as the
+# title of the structure and the name of the field within it.
+DMIDECODE_DUMP_FIELDS = {
+    'baseboard-asset-tag': ('Base Board Information', 'Asset Tag'),
+    'baseboard-manufacturer': ('Base Board Information', 'Manufacturer'),
+    'baseboard-product-name': ('Base Board Information', 'Product Name'),
+    'baseboard-serial-number': ('Base Board Information', 'Serial Number'),
+    'baseboard-version': ('Base Board Information', 'Version'),
+    'bios-release-date': ('BIOS Information', 'Release Date'),
+    'bios-vendor': ('BIOS Information', 'Vendor'),
+    'bios-version': ('BIOS Information', 'Version'),
+    'chassis-asset-tag': ('Chassis Information', 'Asset Tag'),
+    'chassis-manufacturer': ('Chassis Information', 'Manufacturer'),
+    'chassis-serial-number': ('Chassis Information', 'Serial Number'),
+    'chassis-version': ('Chassis Information', 'Version'),
+    'system-manufacturer': ('System Information', 'Manufacturer'),
+    'system-product-name': ('System Information', 'Product Name'),
+    'system-serial-number': ('System Information', 'Serial Number'),
+    'system-uuid': ('System Information', 'UUID'),
+    'system-version': ('System Information', 'Version'),
+}
+
 
 def _read_dmi_syspath(key):
     """
@@ -115,6 +138,111 @@ def _call_dmidecode(key, dmidecode_path):
         return None
 
 
+def _dmidecode_path():
+    """Return the path to dmidecode if it can be used on this system."""
+    def is_x86(arch):
+        return (arch == 'x86_64' or (arch[0] == 'i' and arch[2:] == '86'))
+
+    # running dmidecode can be problematic on some arches (LP: #1243287)
+    uname_arch = os.uname()[4]
+    if not (is_x86(uname_arch) or uname_arch in ('aarch64', 'amd64')):
+        LOG.debug("dmidata is not supported on %s", uname_arch)
+        return None
+
+    dmidecode_path = subp.which('dmidecode')
+    if not dmidecode_path:
+        LOG.warning("did not find either path %s or dmidecode command",
+                    DMI_SYS_PATH)
+    return dmidecode_path
+
+
+def _parse_kenv_dump(content):
+    """Return the smbios values of a kenv(1) listing keyed by kenv name."""
+    values = {}
+    for line in content.splitlines():
+        (name, sep, value) = line.partition('=')
+        if not sep:
+            continue
+        value = value.strip()
+        if len(value) > 1 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        values[name.strip()] = value
+    return values
+
+
+def _parse_dmidecode_dump(content):
+    """Return the values of a dmidecode dump for DMIDECODE_DUMP_FIELDS.
+
+    Like dmidecode --string, a key found in several structures of the same
+    type has all of its values, one per line.
+    """
+    fields = {}
+    for key, location in DMIDECODE_DUMP_FIELDS.items():
+        fields.setdefault(location, []).append(key)
+    found = {}
+    title = None
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        if not line[0].isspace():
+            title = line.strip()
+            continue
+        if line.startswith('\t\t'):
+            # continuation of a multi-line field
+            continue
+        (name, sep, value) = line.strip().partition(':')
+        if not sep:
+            continue
+        for key in fields.get((title, name), []):
+            found.setdefault(key, []).append(value.strip())
+    values = {}
+    for key, found_values in found.items():
+        value = '\n'.join(found_values)
+        if value.replace(".", "") == "":
+            value = ""
+        values[key] = value
+    return values
+
+
+@boot_facts.boot_fact('dmi_snapshot')
+def read_dmi_snapshot():
+    """Return the value of every key in DMIDECODE_TO_KERNEL at once.
+
+    Values come from /sys/class/dmi/id, with a single dmidecode dump for any
+    missing there, or from a single kenv listing on FreeBSD. Keys without a
+    value are None. Being a boot fact, the snapshot is read once per boot
+    while the boot facts cache is enabled.
+    """
+    snapshot = dict((key, None) for key in DMIDECODE_TO_KERNEL)
+    if is_FreeBSD():
+        try:
+            (out, _err) = subp.subp(['kenv'])
+        except subp.ProcessExecutionError as e:
+            LOG.debug('failed kenv cmd: %s', e)
+            return snapshot
+        kenv = _parse_kenv_dump(out)
+        for key, kmap in DMIDECODE_TO_KERNEL.items():
+            if kmap.freebsd is not None:
+                snapshot[key] = kenv.get(kmap.freebsd)
+        return snapshot
+
+    for key in snapshot:
+        snapshot[key] = _read_dmi_syspath(key)
+    if any(value is None for value in snapshot.values()):
+        dmidecode_path = _dmidecode_path()
+        if dmidecode_path:
+            try:
+                (out, _err) = subp.subp([dmidecode_path, '-q'])
+            except subp.ProcessExecutionError as e:
+                LOG.debug('failed dmidecode cmd: %s', e)
+            else:
+                dump = _parse_dmidecode_dump(out)
+                for key, value in snapshot.items():
+                    if value is None:
+                        snapshot[key] = dump.get(key)
+    return snapshot
+
+
 def read_dmi_data(key):
     """
     Wrapper for reading DMI data.
@@ -131,11 +259,17 @@ def read_dmi_data(key):
         3) Fall-back to passing `key` to `dmidecode --string`.
 
     If all of the above fail to find a value, None will be returned.
+
+    While the boot facts cache is enabled, keys in DMIDECODE_TO_KERNEL are
+    served from read_dmi_snapshot() instead.
     """
 
     if is_container():
         return None
 
+    if boot_facts.boot_facts.enabled and key in DMIDECODE_TO_KERNEL:
+        return read_dmi_snapshot()[key]
+
     if is_FreeBSD():
         return _read_kenv(key)
 
@@ -143,21 +277,9 @@ def read_dmi_data(key):
     if syspath_value is not None:
         return syspath_value
 
-    def is_x86(arch):
-        return (arch == 'x86_64' or (arch[0] == 'i' and arch[2:] == '86'))
-
-    # running dmidecode can be problematic on some arches (LP: #1243287)
-    uname_arch = os.uname()[4]
-    if not (is_x86(uname_arch) or uname_arch in ('aarch64', 'amd64')):
-        LOG.debug("dmidata is not supported on %s", uname_arch)
-        return None
-
-    dmidecode_path = subp.which('dmidecode')
+    dmidecode_path = _dmidecode_path()
     if dmidecode_path:
         return _call_dmidecode(key, dmidecode_path)
-
-    LOG.warning("did not find either path %s or dmidecode command",
-                DMI_SYS_PATH)
     return None
 
 # vi: ts=4 expandtab
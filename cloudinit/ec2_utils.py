@@ -8,6 +8,7 @@
 
 import functools
 import json
+from concurrent import futures
 
 from cloudinit import log as logging
 from cloudinit import url_helper
@@ -50,7 +51,16 @@ class MetadataLeafDecoder(object):
 # See: http://docs.aws.amazon.com/AWSEC2/latest/UserGuide/
 #         ec2-instance-metadata.html
 class MetadataMaterializer(object):
-    def __init__(self, blob, base_url, caller, leaf_decoder=None):
+    """Crawl a metadata tree into a dictionary.
+
+    When max_workers is greater than 1, the tree is crawled breadth-first
+    and all sibling directories and leaves at a given depth are requested
+    concurrently using a pool of at most max_workers threads. The resulting
+    dictionary is identical to the one produced by a sequential crawl.
+    """
+
+    def __init__(self, blob, base_url, caller, leaf_decoder=None,
+                 max_workers=None):
         self._blob = blob
         self._md = None
         self._base_url = base_url
@@ -59,6 +69,7 @@ class MetadataMaterializer(object):
             self._leaf_decoder = MetadataLeafDecoder()
         else:
             self._leaf_decoder = leaf_decoder
+        self._max_workers = max_workers
 
     def _parse(self, blob):
         leaves = {}
@@ -106,9 +117,24 @@ class MetadataMaterializer(object):
     def materialize(self):
         if self._md is not None:
             return self._md
-        self._md = self._materialize(self._blob, self._base_url)
+        if self._max_workers and self._max_workers > 1:
+            self._md = self._materialize_concurrently(
+                self._blob, self._base_url)
+        else:
+            self._md = self._materialize(self._blob, self._base_url)
         return self._md
 
+    def _join(self, base_url, child_contents, leaf_contents):
+        joined = {}
+        joined.update(child_contents)
+        for field in leaf_contents.keys():
+            if field in joined:
+                LOG.warning("Duplicate key found in results from %s",
+                            base_url)
+            else:
+                joined[field] = leaf_contents[field]
+        return joined
+
     def _materialize(self, blob, base_url):
         (leaves, children) = self._parse(blob)
         child_contents = {}
@@ -123,15 +149,49 @@ class MetadataMaterializer(object):
             leaf_url = url_helper.combine_url(base_url, resource)
             leaf_blob = self._caller(leaf_url)
             leaf_contents[field] = self._leaf_decoder(field, leaf_blob)
-        joined = {}
-        joined.update(child_contents)
-        for field in leaf_contents.keys():
-            if field in joined:
-                LOG.warning("Duplicate key found in results from %s",
-                            base_url)
-            else:
-                joined[field] = leaf_contents[field]
-        return joined
+        return self._join(base_url, child_contents, leaf_contents)
+
+    def _materialize_concurrently(self, blob, base_url):
+        # Each node is (url, children, leaves) where children and leaves
+        # keep the listing order so the joined result matches _materialize.
+        root = (base_url, [], [])
+        level = [(root, blob)]
+        with futures.ThreadPoolExecutor(
+                max_workers=self._max_workers) as executor:
+            while level:
+                fetches = []
+                for (node, node_blob) in level:
+                    (url, children, leaves) = node
+                    (leaf_map, child_names) = self._parse(node_blob)
+                    for c in child_names:
+                        child_url = url_helper.combine_url(url, c)
+                        if not child_url.endswith("/"):
+                            child_url += "/"
+                        child = (child_url, [], [])
+                        children.append((c, child))
+                        fetches.append((child_url, child, None))
+                    for (field, resource) in leaf_map.items():
+                        leaf_url = url_helper.combine_url(url, resource)
+                        fetches.append((leaf_url, leaves, field))
+                # map() yields results in submission order and re-raises
+                # the first failure, just like the sequential crawl would.
+                blobs = executor.map(
+                    self._caller, [f[0] for f in fetches])
+                level = []
+                for ((_url, target, field), fetched) in zip(fetches, blobs):
+                    if field is None:
+                        level.append((target, fetched))
+                    else:
+                        target.append(
+                            (field, self._leaf_decoder(field, fetched)))
+        return self._join_tree(root)
+
+    def _join_tree(self, node):
+        (url, children, leaves) = node
+        child_contents = {}
+        for (name, child) in children:
+            child_contents[name] = self._join_tree(child)
+        return self._join(url, child_contents, dict(leaves))
 
 
 def skip_retry_on_codes(status_codes, _request_args, cause):
@@ -172,7 +232,7 @@ def _get_instance_metadata(tree, api_version='latest',
                            ssl_details=None, timeout=5, retries=5,
                            leaf_decoder=None, headers_cb=None,
                            headers_redact=None,
-                           exception_cb=None):
+                           exception_cb=None, max_workers=None):
     md_url = url_helper.combine_url(metadata_address, api_version, tree)
     caller = functools.partial(
         url_helper.read_file_or_url, ssl_details=ssl_details,
@@ -187,7 +247,8 @@ def _get_instance_metadata(tree, api_version='latest',
         response = caller(md_url)
         materializer = MetadataMaterializer(response.contents,
                                             md_url, mcaller,
-                                            leaf_decoder=leaf_decoder)
+                                            leaf_decoder=leaf_decoder,
+                                            max_workers=max_workers)
         md = materializer.materialize()
         if not isinstance(md, (dict)):
             md = {}
@@ -202,7 +263,7 @@ def get_instance_metadata(api_version='latest',
                           ssl_details=None, timeout=5, retries=5,
                           leaf_decoder=None, headers_cb=None,
                           headers_redact=None,
-                          exception_cb=None):
+                          exception_cb=None, max_workers=None):
     # Note, 'meta-data' explicitly has trailing /.
     # this is required for CloudStack (LP: #1356855)
     return _get_instance_metadata(tree='meta-data/', api_version=api_version,
@@ -211,7 +272,8 @@ def get_instance_metadata(api_version='latest',
                                   retries=retries, leaf_decoder=leaf_decoder,
                                   headers_redact=headers_redact,
                                   headers_cb=headers_cb,
-                                  exception_cb=exception_cb)
+                                  exception_cb=exception_cb,
+                                  max_workers=max_workers)
 
 
 def get_instance_identity(api_version='latest',
@@ -219,7 +281,7 @@ def get_instance_identity(api_version='latest',
                           ssl_details=None, timeout=5, retries=5,
                           leaf_decoder=None, headers_cb=None,
                           headers_redact=None,
-                          exception_cb=None):
+                          exception_cb=None, max_workers=None):
     return _get_instance_metadata(tree='dynamic/instance-identity',
                                   api_version=api_version,
                                   metadata_address=metadata_address,
@@ -227,5 +289,6 @@ def get_instance_identity(api_version='latest',
                                   retries=retries, leaf_decoder=leaf_decoder,
                                   headers_redact=headers_redact,
                                   headers_cb=headers_cb,
-                                  exception_cb=exception_cb)
+                                  exception_cb=exception_cb,
+                                  max_workers=max_workers)
 # vi: ts=4 expandtab
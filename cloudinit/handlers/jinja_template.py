@@ -4,12 +4,6 @@ from errno import EACCES
 import os
 import re
 
-try:
-    from jinja2.exceptions import UndefinedError as JUndefinedError
-except ImportError:
-    # No jinja2 dependency
-    JUndefinedError = Exception
-
 from cloudinit import handlers
 from cloudinit import log as logging
 from cloudinit.sources import INSTANCE_JSON_FILE
@@ -94,6 +88,12 @@ def render_jinja_payload_from_file(
 
 
 def render_jinja_payload(payload, payload_fn, instance_data, debug=False):
+    try:
+        # Imported here as most boots render no jinja payloads
+        from jinja2.exceptions import UndefinedError as JUndefinedError
+    except ImportError:
+        # No jinja2 dependency
+        JUndefinedError = Exception
     instance_jinja_vars = convert_jinja_instance_data(
         instance_data,
         decode_paths=instance_data.get('base64-encoded-keys', []))
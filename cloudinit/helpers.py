@@ -18,6 +18,7 @@ from io import StringIO
 from cloudinit.settings import (PER_INSTANCE, PER_ALWAYS, PER_ONCE,
                                 CFG_ENV_NAME)
 
+from cloudinit import config_cache
 from cloudinit import log as logging
 from cloudinit import type_utils
 from cloudinit import util
@@ -215,7 +216,7 @@ class ConfigMerger(object):
         if CFG_ENV_NAME in os.environ:
             e_fn = os.environ[CFG_ENV_NAME]
             try:
-                e_cfgs.append(util.read_conf(e_fn))
+                e_cfgs.append(config_cache.read_conf(e_fn))
             except Exception:
                 util.logexc(LOG, 'Failed loading of env. config from %s',
                             e_fn)
@@ -236,7 +237,7 @@ class ConfigMerger(object):
             cc_fn = self._paths.get_ipath_cur(cc_p)
             if cc_fn and os.path.isfile(cc_fn):
                 try:
-                    i_cfgs.append(util.read_conf(cc_fn))
+                    i_cfgs.append(config_cache.read_conf(cc_fn))
                 except PermissionError:
                     LOG.debug(
                         'Skipped loading cloud-config from %s due to'
@@ -257,7 +258,7 @@ class ConfigMerger(object):
         if self._fns:
             for c_fn in self._fns:
                 try:
-                    cfgs.append(util.read_conf(c_fn))
+                    cfgs.append(config_cache.read_conf(c_fn))
                 except Exception:
                     util.logexc(LOG, "Failed loading of configuration from %s",
                                 c_fn)
@@ -335,12 +336,17 @@ class Paths(object):
             "userdata_raw": "user-data.txt",
             "userdata": "user-data.txt.i",
             "obj_pkl": "obj.pkl",
+            "obj_pkl_header": "obj.pkl.json",
             "cloud_config": "cloud-config.txt",
             "vendor_cloud_config": "vendor-cloud-config.txt",
             "data": "data",
             "vendordata_raw": "vendor-data.txt",
             "vendordata": "vendor-data.txt.i",
             "instance_id": ".instance-id",
+            "boot_facts": "boot-facts.json",
+            "jinja_cache": "data/jinja-cache",
+            "ssh_host_keys_early": "ssh-host-keys-early.json",
+            "ssh_host_keys_early_dir": "ssh-host-keys-early",
             "manual_clean_marker": "manual-clean",
             "warnings": "warnings",
         }
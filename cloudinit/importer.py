@@ -8,8 +8,144 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import json
+import os
 import sys
 
+# Index of the modules found in INDEXED_PACKAGES, generated at build time so
+# that looking modules up does not need to import them first.
+MODULE_INDEX_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'module_index.json')
+MODULE_INDEX_VERSION = 2
+
+# Indexed packages and the file name prefix of the modules they provide
+INDEXED_PACKAGES = {
+    'cloudinit.config': 'cc_',
+    'cloudinit.sources': 'DataSource',
+}
+
+_MODULE_INDEX = None
+
+
+def _top_level_names(body):
+    """Return the names a module body binds at import time."""
+    import ast
+    names = set()
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                             ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = getattr(node, 'targets', None) or [node.target]
+            for target in targets:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        names.add(name.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split('.')[0])
+        else:
+            # Definitions nested in top-level if, try and with statements
+            for field in ('body', 'orelse', 'finalbody', 'handlers'):
+                names.update(_top_level_names(getattr(node, field, [])))
+    return names
+
+
+def _module_entry(path):
+    """Return the index entry of the module source in path."""
+    import ast
+
+    with open(path, 'rb') as stream:
+        source = stream.read()
+    tree = ast.parse(source, path)
+    return {'attrs': sorted(_top_level_names(tree.body)),
+            'size': len(source)}
+
+
+def build_module_index(root_dir=None):
+    """Return the index of the modules in INDEXED_PACKAGES under root_dir.
+
+    Modules are parsed, not imported, so the index can be built without
+    their dependencies being installed. Each module is recorded with the
+    names it defines at module level, such as the schema of config modules,
+    and the size of its source.
+
+    @param root_dir: Directory of the cloudinit package, defaults to the
+        directory this module was loaded from.
+    """
+    if root_dir is None:
+        root_dir = os.path.dirname(os.path.abspath(__file__))
+    index = {'version': MODULE_INDEX_VERSION, 'packages': {}}
+    for (package, prefix) in sorted(INDEXED_PACKAGES.items()):
+        pkg_dir = os.path.join(root_dir, *package.split('.')[1:])
+        modules = {}
+        for fname in sorted(os.listdir(pkg_dir)):
+            if fname.startswith(prefix) and fname.endswith('.py'):
+                modules[fname[:-3]] = _module_entry(
+                    os.path.join(pkg_dir, fname))
+        index['packages'][package] = modules
+    return index
+
+
+def write_module_index(path, root_dir=None):
+    """Write the module index of the cloudinit package in root_dir to path."""
+    with open(path, 'w') as stream:
+        json.dump(build_module_index(root_dir), stream, indent=1,
+                  sort_keys=True)
+
+
+def _index_matches_tree(index, root_dir, index_mtime):
+    """Return True if the index describes the modules found in root_dir.
+
+    Every module must be listed with the size of its source, and none may
+    have been modified after the index was written.
+    """
+    for (package, prefix) in INDEXED_PACKAGES.items():
+        pkg_dir = os.path.join(root_dir, *package.split('.')[1:])
+        modules = index.get(package, {})
+        found = set()
+        for fname in os.listdir(pkg_dir):
+            if not fname.startswith(prefix) or not fname.endswith('.py'):
+                continue
+            name = fname[:-3]
+            if name not in modules:
+                return False
+            stat = os.stat(os.path.join(pkg_dir, fname))
+            if (stat.st_size != modules[name].get('size') or
+                    stat.st_mtime > index_mtime):
+                return False
+            found.add(name)
+        if found != set(modules):
+            return False
+    return True
+
+
+def get_module_index():
+    """Return the module index as {package: {module name: entry}}.
+
+    The index is empty when MODULE_INDEX_FILE is missing, invalid or does
+    not match the modules installed next to it, such as after one of them
+    was edited in place, in which case modules are looked up by importing
+    them.
+    """
+    global _MODULE_INDEX
+    if _MODULE_INDEX is None:
+        index = {}
+        try:
+            with open(MODULE_INDEX_FILE) as stream:
+                data = json.load(stream)
+                index_mtime = os.fstat(stream.fileno()).st_mtime
+            if (data.get('version') == MODULE_INDEX_VERSION and
+                    _index_matches_tree(data['packages'],
+                                        os.path.dirname(MODULE_INDEX_FILE),
+                                        index_mtime)):
+                index = data['packages']
+        except (IOError, OSError, AttributeError, KeyError, TypeError,
+                ValueError):
+            pass
+        _MODULE_INDEX = index
+    return _MODULE_INDEX
+
 
 def import_module(module_name):
     __import__(module_name)
@@ -29,7 +165,16 @@ def find_module(base_name, search_paths, required_attrs=None):
         full_path = '.'.join(real_path)
         lookup_paths.append(full_path)
     found_paths = []
+    index = get_module_index()
     for full_path in lookup_paths:
+        (package, _sep, name) = full_path.rpartition('.')
+        if package in index:
+            # The index knows whether the module exists and what it defines,
+            # only import the modules it lists with the required attrs.
+            entry = index[package].get(name)
+            if entry is None or not set(required_attrs).issubset(
+                    entry['attrs']):
+                continue
         mod = None
         try:
             mod = import_module(full_path)
@@ -41,12 +41,130 @@ def sys_dev_path(devname, path=""):
     return get_sys_class_path() + devname + "/" + path
 
 
+class NetDeviceSnapshot(object):
+    """Attributes of all network devices read from sysfs in one pass.
+
+    While a snapshot is active (see refresh_device_snapshot) read_sys_net
+    and the device predicates in this module answer from it instead of
+    reading sysfs for every call. Devices and attributes the snapshot does
+    not cover are still read from sysfs.
+    """
+
+    # Attribute files read for each device. Link state (carrier, dormant,
+    # operstate) changes as interfaces are brought up, so it is not cached.
+    files = (
+        'addr_assign_type', 'address', 'name_assign_type', 'type', 'uevent',
+        'device/device', 'device/features', 'bonding_slave/perm_hwaddr',
+    )
+    # Symlinks whose target device or driver name is recorded
+    links = ('device/driver', 'master')
+
+    def __init__(self):
+        self.devices = {}
+        try:
+            names = os.listdir(get_sys_class_path())
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            names = []
+        for name in names:
+            self.devices[name] = self._read_device(name)
+
+    def _read_device(self, name):
+        dev_path = sys_dev_path(name)
+        try:
+            entries = set(os.listdir(dev_path))
+        except OSError:
+            entries = set()
+        device = {'entries': entries, 'files': {}, 'links': {}}
+        for path in self.files:
+            if path.split('/')[0] not in entries:
+                device['files'][path] = FileNotFoundError(
+                    errno.ENOENT, os.strerror(errno.ENOENT), dev_path + path)
+                continue
+            try:
+                device['files'][path] = util.load_file(dev_path + path)
+            except (OSError, IOError) as e:
+                device['files'][path] = e
+        for path in self.links:
+            target = None
+            if path.split('/')[0] in entries:
+                try:
+                    target = os.path.basename(os.readlink(dev_path + path))
+                except OSError:
+                    pass
+            device['links'][path] = target
+        return device
+
+    def read(self, devname, path):
+        """Return the contents of path, raising the error reading it raised.
+
+        :raise KeyError: when devname or path is not in the snapshot.
+        """
+        contents = self.devices[devname]['files'][path]
+        if isinstance(contents, Exception):
+            raise contents
+        return contents
+
+    def has_entry(self, devname, path):
+        """Return whether devname has the top level sysfs entry path."""
+        return path in self.devices[devname]['entries']
+
+    def link(self, devname, path):
+        """Return the basename of the target of symlink path, or None."""
+        return self.devices[devname]['links'][path]
+
+
+_device_snapshot = None
+
+
+def get_device_snapshot():
+    """Return the active NetDeviceSnapshot, or None."""
+    return _device_snapshot
+
+
+def refresh_device_snapshot():
+    """Read a new snapshot of all network devices and make it active."""
+    global _device_snapshot
+    _device_snapshot = NetDeviceSnapshot()
+    return _device_snapshot
+
+
+def clear_device_snapshot():
+    """Stop using a snapshot, reading sysfs on every call again."""
+    global _device_snapshot
+    _device_snapshot = None
+
+
+def _refresh_active_snapshot():
+    """Re-read the active snapshot, if any, after devices changed."""
+    if _device_snapshot is not None:
+        refresh_device_snapshot()
+
+
+def _snapshot_has(devname):
+    return _device_snapshot is not None and devname in _device_snapshot.devices
+
+
+def _sys_dev_check(devname, path, check=None):
+    """Return check(sys_dev_path(devname, path)) or the snapshot answer."""
+    if _snapshot_has(devname) and '/' not in path:
+        return _device_snapshot.has_entry(devname, path)
+    if check is None:
+        check = os.path.exists
+    return check(sys_dev_path(devname, path=path))
+
+
 def read_sys_net(devname, path, translate=None,
                  on_enoent=None, on_keyerror=None,
                  on_einval=None):
     dev_path = sys_dev_path(devname, path)
     try:
-        contents = util.load_file(dev_path)
+        if (_snapshot_has(devname) and
+                path in _device_snapshot.devices[devname]['files']):
+            contents = _device_snapshot.read(devname, path)
+        else:
+            contents = util.load_file(dev_path)
     except (OSError, IOError) as e:
         e_errno = getattr(e, 'errno', None)
         if e_errno in (errno.ENOENT, errno.ENOTDIR):
@@ -99,18 +217,17 @@ def is_up(devname):
 
 
 def is_bridge(devname):
-    return os.path.exists(sys_dev_path(devname, "bridge"))
+    return _sys_dev_check(devname, "bridge")
 
 
 def is_bond(devname):
-    return os.path.exists(sys_dev_path(devname, "bonding"))
+    return _sys_dev_check(devname, "bonding")
 
 
 def get_master(devname):
     """Return the master path for devname, or None if no master"""
-    path = sys_dev_path(devname, path="master")
-    if os.path.exists(path):
-        return path
+    if _sys_dev_check(devname, "master"):
+        return sys_dev_path(devname, path="master")
     return None
 
 
@@ -119,6 +236,11 @@ def master_is_bridge_or_bond(devname):
     master_path = get_master(devname)
     if master_path is None:
         return False
+    if _snapshot_has(devname):
+        master = _device_snapshot.link(devname, 'master')
+        if _snapshot_has(master):
+            return (_device_snapshot.has_entry(master, "bonding") or
+                    _device_snapshot.has_entry(master, "bridge"))
     bonding_path = os.path.join(master_path, "bonding")
     bridge_path = os.path.join(master_path, "bridge")
     return (os.path.exists(bonding_path) or os.path.exists(bridge_path))
@@ -129,8 +251,7 @@ def master_is_openvswitch(devname):
     master_path = get_master(devname)
     if master_path is None:
         return False
-    ovs_path = sys_dev_path(devname, path="upper_ovs-system")
-    return os.path.exists(ovs_path)
+    return _sys_dev_check(devname, "upper_ovs-system")
 
 
 def is_netfailover(devname, driver=None):
@@ -204,8 +325,8 @@ def is_netfail_primary(devname, driver=None):
         Return True if all of the above is True.
     """
     # /sys/class/net/<devname>/master -> ../../<master devname>
-    master_sysfs_path = sys_dev_path(devname, path='master')
-    if not os.path.exists(master_sysfs_path):
+    master_sysfs_path = get_master(devname)
+    if master_sysfs_path is None:
         return False
 
     if driver is None:
@@ -214,7 +335,11 @@ def is_netfail_primary(devname, driver=None):
     if driver == "virtio_net":
         return False
 
-    master_devname = os.path.basename(os.path.realpath(master_sysfs_path))
+    if _snapshot_has(devname):
+        master_devname = _device_snapshot.link(devname, 'master')
+    else:
+        master_devname = os.path.basename(
+            os.path.realpath(master_sysfs_path))
     master_driver = device_driver(master_devname)
     if master_driver != "virtio_net":
         return False
@@ -272,6 +397,8 @@ def is_vlan(devname):
 
 def device_driver(devname):
     """Return the device driver for net device named 'devname'."""
+    if _snapshot_has(devname):
+        return _device_snapshot.link(devname, "device/driver")
     driver = None
     driver_path = sys_dev_path(devname, "device/driver")
     # driver is a symlink to the driver *dir*
@@ -301,6 +428,11 @@ def get_devicelist():
             devs = []
         else:
             raise
+    if (_device_snapshot is not None and
+            set(devs) != set(_device_snapshot.devices)):
+        # Devices were added or removed, such as bonds and vlans which also
+        # change the master of existing devices.
+        _refresh_active_snapshot()
     return devs
 
 
@@ -368,6 +500,7 @@ def find_fallback_nic_on_linux(blacklist_drivers=None):
                       unstable)
             msg = 'Waiting for udev events to settle'
             util.log_time(LOG.debug, msg, func=util.udevadm_settle)
+            _refresh_active_snapshot()
 
     # get list of interfaces that could have connections
     invalid_interfaces = set(['lo'])
@@ -726,6 +859,8 @@ def _rename_interfaces(renames, strict_present=True, strict_busy=True,
                 errors.append(
                     "[unknown] Error performing %s%s for %s, %s: %s" %
                     (op, params, mac, new_name, e))
+        # Device names and states changed
+        _refresh_active_snapshot()
 
     if len(errors):
         raise Exception('\n'.join(errors))
@@ -734,7 +869,7 @@ def _rename_interfaces(renames, strict_present=True, strict_busy=True,
 def get_interface_mac(ifname):
     """Returns the string value of an interface's MAC Address"""
     path = "address"
-    if os.path.isdir(sys_dev_path(ifname, "bonding_slave")):
+    if _sys_dev_check(ifname, "bonding_slave", os.path.isdir):
         # for a bond slave, get the nic's hwaddress, not the address it
         # is using because its part of a bond.
         path = "bonding_slave/perm_hwaddr"
@@ -391,6 +391,117 @@ class TestGetDeviceList(CiTestCase):
         self.assertCountEqual(['eth0', 'eth1'], net.get_devicelist())
 
 
+class TestNetDeviceSnapshot(CiTestCase):
+
+    def setUp(self):
+        super(TestNetDeviceSnapshot, self).setUp()
+        sys_mock = mock.patch('cloudinit.net.get_sys_class_path')
+        self.m_sys_path = sys_mock.start()
+        self.sysdir = self.tmp_dir() + '/'
+        self.m_sys_path.return_value = self.sysdir
+        self.addCleanup(sys_mock.stop)
+        self.add_patch('cloudinit.net.util.get_cmdline', 'm_cmdline',
+                       return_value='net.ifnames=0')
+        self.addCleanup(net.clear_device_snapshot)
+        # eth0 and eth1 are bonded into bond0, eth2 is in bridge br0
+        devices = {
+            'eth0': ('aa:aa:aa:aa:aa:00', '1', 'virtio_net'),
+            'eth1': ('aa:aa:aa:aa:aa:01', '1', 'e1000'),
+            'eth2': ('aa:aa:aa:aa:aa:02', '0', 'e1000'),
+            'eth3': ('aa:aa:aa:aa:aa:03', '0', 'e1000'),
+            'bond0': ('aa:aa:aa:aa:aa:00', '1', None),
+            'br0': ('aa:aa:aa:aa:aa:02', '1', None),
+        }
+        for (name, (mac, carrier, driver)) in devices.items():
+            write_file(self.sysdir + name + '/address', mac)
+            write_file(self.sysdir + name + '/carrier', carrier)
+            write_file(self.sysdir + name + '/addr_assign_type', '0')
+            if driver:
+                driver_dir = self.tmp_path('drivers/' + driver)
+                ensure_file(driver_dir + '/module')
+                os.makedirs(self.sysdir + name + '/device')
+                os.symlink(driver_dir, self.sysdir + name + '/device/driver')
+        write_file(self.sysdir + 'bond0/addr_assign_type', '2')
+        ensure_file(self.sysdir + 'bond0/bonding/slaves')
+        ensure_file(self.sysdir + 'br0/bridge/bridge_id')
+        for (name, master) in (('eth0', 'bond0'), ('eth1', 'bond0'),
+                               ('eth2', 'br0')):
+            os.symlink('../' + master, self.sysdir + name + '/master')
+        write_file(self.sysdir + 'eth0/bonding_slave/perm_hwaddr',
+                   'aa:aa:aa:aa:aa:00')
+        write_file(self.sysdir + 'eth1/bonding_slave/perm_hwaddr',
+                   'aa:aa:aa:aa:aa:01')
+
+    def _query(self):
+        return (sorted(net.get_interfaces()),
+                net.get_interfaces_by_mac(),
+                net.find_fallback_nic(),
+                sorted(net.get_devicelist()))
+
+    def test_snapshot_answers_like_sysfs(self):
+        """Queries return the same results with a snapshot active."""
+        expected = self._query()
+        self.assertIn(('eth3', 'aa:aa:aa:aa:aa:03', 'e1000', None),
+                      expected[0])
+        net.refresh_device_snapshot()
+        self.assertEqual(expected, self._query())
+
+    def test_snapshot_reused_until_refreshed(self):
+        """Attributes are not read again until the snapshot is refreshed."""
+        snapshot = net.refresh_device_snapshot()
+        self.assertIs(snapshot, net.get_device_snapshot())
+        with mock.patch('cloudinit.net.util.load_file',
+                        return_value='1') as m_load:
+            self._query()
+        # Only link state is read from sysfs again
+        self.assertEqual(
+            {'carrier'},
+            set(os.path.basename(call[0][0])
+                for call in m_load.call_args_list))
+        write_file(self.sysdir + 'eth3/address', 'aa:aa:aa:aa:aa:13')
+        self.assertEqual('aa:aa:aa:aa:aa:03',
+                         net.read_sys_net('eth3', 'address'))
+        net.refresh_device_snapshot()
+        self.assertEqual('aa:aa:aa:aa:aa:13',
+                         net.read_sys_net('eth3', 'address'))
+
+    def test_link_state_read_from_sysfs(self):
+        """Carrier, dormant and operstate are never answered from cache."""
+        net.refresh_device_snapshot()
+        self.assertFalse(net.read_sys_net_int('eth3', 'carrier'))
+        self.assertFalse(net.is_up('eth3'))
+        write_file(self.sysdir + 'eth3/carrier', '1')
+        write_file(self.sysdir + 'eth3/operstate', 'up')
+        self.assertEqual(1, net.read_sys_net_int('eth3', 'carrier'))
+        self.assertTrue(net.is_up('eth3'))
+
+    def test_new_devices_refresh_snapshot(self):
+        """Devices created after the snapshot are listed and refresh it."""
+        net.refresh_device_snapshot()
+        self.assertFalse(net.master_is_bridge_or_bond('eth3'))
+        ensure_file(self.sysdir + 'bond1/bonding/slaves')
+        os.symlink('../bond1', self.sysdir + 'eth3/master')
+        self.assertIn('bond1', net.get_devicelist())
+        self.assertIn('bond1', net.get_device_snapshot().devices)
+        self.assertTrue(net.master_is_bridge_or_bond('eth3'))
+
+    def test_snapshot_preserves_read_errors(self):
+        """Missing attributes raise as they do when read from sysfs."""
+        net.refresh_device_snapshot()
+        with self.assertRaises(FileNotFoundError):
+            net.read_sys_net('eth0', 'operstate')
+        self.assertFalse(net.read_sys_net_safe('eth0', 'operstate'))
+
+    def test_unknown_devices_and_attributes_read_from_sysfs(self):
+        """Attributes outside the snapshot are still read from sysfs."""
+        net.refresh_device_snapshot()
+        write_file(self.sysdir + 'eth0/mtu', '1500')
+        write_file(self.sysdir + 'eth9/address', 'aa:aa:aa:aa:aa:09')
+        self.assertEqual('1500', net.read_sys_net('eth0', 'mtu'))
+        self.assertEqual(
+            'aa:aa:aa:aa:aa:09', net.read_sys_net('eth9', 'address'))
+
+
 class TestGetInterfaceMAC(CiTestCase):
 
     def setUp(self):
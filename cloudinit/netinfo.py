@@ -8,11 +8,14 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
-from copy import copy, deepcopy
+from copy import deepcopy
 import re
+import socket
+import struct
 
 from cloudinit import log as logging
 from cloudinit.net.network_state import net_prefix_to_ipv4_mask
+from cloudinit.sources.helpers import netlink
 from cloudinit import subp
 from cloudinit import util
 
@@ -28,6 +31,19 @@ DEFAULT_NETDEV_INFO = {
     "up": False
 }
 
+# Values from linux/if.h, linux/if_arp.h and linux/rtnetlink.h, with the
+# names iproute2 prints for them
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+ARPHRD_ETHER = 1
+RT_TABLE_MAIN = 254
+RTN_UNICAST = 1
+RT_SCOPES = {0: 'global', 200: 'site', 253: 'link', 254: 'host',
+             255: 'nowhere'}
+RTN_TYPES = {0: 'none', 1: 'unicast', 2: 'local', 3: 'broadcast',
+             4: 'anycast', 5: 'multicast', 6: 'blackhole', 7: 'unreachable',
+             8: 'prohibit', 9: 'throw', 10: 'nat', 11: 'xresolve'}
+
 
 def _netdev_info_iproute(ipaddr_out):
     """
@@ -92,6 +108,49 @@ def _netdev_info_iproute(ipaddr_out):
     return devs
 
 
+def _netdev_info_netlink():
+    """
+    Get network device dicts over rtnetlink without running ip.
+
+    @returns: The same dict as _netdev_info_iproute, or None when netlink is
+              not available.
+    """
+    try:
+        links = netlink.read_links()
+        addresses = netlink.read_addresses()
+    except (netlink.NetlinkCreateSocketError, OSError, struct.error) as e:
+        LOG.debug('Could not read network devices over netlink: %s', e)
+        return None
+    devs = {}
+    names = {}
+    for link in links:
+        dev_name = link.name.lower()
+        names[link.index] = dev_name
+        hwaddr = ''
+        if link.type == ARPHRD_ETHER and link.address:
+            hwaddr = link.address
+        devs[dev_name] = {
+            'ipv4': [], 'ipv6': [], 'hwaddr': hwaddr,
+            'up': bool(link.flags & IFF_UP and link.flags & IFF_LOWER_UP),
+        }
+    for addr in addresses:
+        if addr.index not in names:
+            continue
+        dev = devs[names[addr.index]]
+        scope = RT_SCOPES.get(addr.scope, str(addr.scope))
+        if addr.family == socket.AF_INET:
+            dev['ipv4'].append({
+                'ip': addr.local or addr.address,
+                'bcast': addr.broadcast or '',
+                'mask': net_prefix_to_ipv4_mask(addr.prefixlen),
+                'scope': scope})
+        else:
+            dev['ipv6'].append({
+                'ip': '%s/%d' % (addr.address, addr.prefixlen),
+                'scope6': scope})
+    return devs
+
+
 def _netdev_info_ifconfig_netbsd(ifconfig_data):
     # fields that need to be returned in devs for each dev
     devs = {}
@@ -197,7 +256,12 @@ def _netdev_info_ifconfig(ifconfig_data):
 
 def netdev_info(empty=""):
     devs = {}
-    if util.is_NetBSD():
+    # Reading netlink directly avoids forking ip, fall back to the commands
+    # below when it is not available
+    netlink_devs = _netdev_info_netlink() if util.is_Linux() else None
+    if netlink_devs is not None:
+        devs = netlink_devs
+    elif util.is_NetBSD():
         (ifcfg_out, _err) = subp.subp(["ifconfig", "-a"], rcs=[0, 1])
         devs = _netdev_info_ifconfig_netbsd(ifcfg_out)
     elif subp.which('ip'):
@@ -237,6 +301,61 @@ def netdev_info(empty=""):
     return devs
 
 
+def _iproute_route4_entry(toks):
+    """Return the route dict for the tokens of an ip -o route line."""
+    entry = {
+        'destination': '', 'flags': '', 'gateway': '', 'genmask': '',
+        'iface': '', 'metric': ''}
+    flags = ['U']
+    if toks[0] == "default":
+        entry['destination'] = "0.0.0.0"
+        entry['genmask'] = "0.0.0.0"
+    else:
+        if '/' in toks[0]:
+            (addr, cidr) = toks[0].split("/")
+        else:
+            addr = toks[0]
+            cidr = '32'
+            flags.append("H")
+            entry['genmask'] = net_prefix_to_ipv4_mask(cidr)
+        entry['destination'] = addr
+        entry['genmask'] = net_prefix_to_ipv4_mask(cidr)
+        entry['gateway'] = "0.0.0.0"
+    for i in range(len(toks)):
+        if toks[i] == "via":
+            entry['gateway'] = toks[i + 1]
+            flags.insert(1, "G")
+        if toks[i] == "dev":
+            entry["iface"] = toks[i + 1]
+        if toks[i] == "metric":
+            entry['metric'] = toks[i + 1]
+    entry['flags'] = ''.join(flags)
+    return entry
+
+
+def _iproute_route6_entry(toks):
+    """Return the route dict for the tokens of an ip -6 route line."""
+    entry = {}
+    if toks[0] == "default":
+        entry['destination'] = "::/0"
+        entry['flags'] = "UG"
+    else:
+        entry['destination'] = toks[0]
+        entry['gateway'] = "::"
+        entry['flags'] = "U"
+    for i in range(len(toks)):
+        if toks[i] == "via":
+            entry['gateway'] = toks[i + 1]
+            entry['flags'] = "UG"
+        if toks[i] == "dev":
+            entry["iface"] = toks[i + 1]
+        if toks[i] == "metric":
+            entry['metric'] = toks[i + 1]
+        if toks[i] == "expires":
+            entry['flags'] = entry['flags'] + 'e'
+    return entry
+
+
 def _netdev_route_info_iproute(iproute_data):
     """
     Get network route dicts from ip route info.
@@ -252,39 +371,10 @@ def _netdev_route_info_iproute(iproute_data):
     routes['ipv4'] = []
     routes['ipv6'] = []
     entries = iproute_data.splitlines()
-    default_route_entry = {
-        'destination': '', 'flags': '', 'gateway': '', 'genmask': '',
-        'iface': '', 'metric': ''}
     for line in entries:
-        entry = copy(default_route_entry)
         if not line:
             continue
-        toks = line.split()
-        flags = ['U']
-        if toks[0] == "default":
-            entry['destination'] = "0.0.0.0"
-            entry['genmask'] = "0.0.0.0"
-        else:
-            if '/' in toks[0]:
-                (addr, cidr) = toks[0].split("/")
-            else:
-                addr = toks[0]
-                cidr = '32'
-                flags.append("H")
-                entry['genmask'] = net_prefix_to_ipv4_mask(cidr)
-            entry['destination'] = addr
-            entry['genmask'] = net_prefix_to_ipv4_mask(cidr)
-            entry['gateway'] = "0.0.0.0"
-        for i in range(len(toks)):
-            if toks[i] == "via":
-                entry['gateway'] = toks[i + 1]
-                flags.insert(1, "G")
-            if toks[i] == "dev":
-                entry["iface"] = toks[i + 1]
-            if toks[i] == "metric":
-                entry['metric'] = toks[i + 1]
-        entry['flags'] = ''.join(flags)
-        routes['ipv4'].append(entry)
+        routes['ipv4'].append(_iproute_route4_entry(line.split()))
     try:
         (iproute_data6, _err6) = subp.subp(
             ["ip", "--oneline", "-6", "route", "list", "table", "all"],
@@ -294,28 +384,59 @@ def _netdev_route_info_iproute(iproute_data):
     else:
         entries6 = iproute_data6.splitlines()
         for line in entries6:
-            entry = {}
             if not line:
                 continue
-            toks = line.split()
-            if toks[0] == "default":
-                entry['destination'] = "::/0"
-                entry['flags'] = "UG"
-            else:
-                entry['destination'] = toks[0]
-                entry['gateway'] = "::"
-                entry['flags'] = "U"
-            for i in range(len(toks)):
-                if toks[i] == "via":
-                    entry['gateway'] = toks[i + 1]
-                    entry['flags'] = "UG"
-                if toks[i] == "dev":
-                    entry["iface"] = toks[i + 1]
-                if toks[i] == "metric":
-                    entry['metric'] = toks[i + 1]
-                if toks[i] == "expires":
-                    entry['flags'] = entry['flags'] + 'e'
-            routes['ipv6'].append(entry)
+            routes['ipv6'].append(_iproute_route6_entry(line.split()))
+    return routes
+
+
+def _route_tokens(route, names):
+    """Return the leading tokens ip route prints for a netlink route.
+
+    Only the tokens the iproute entry parsers use are produced, so routes
+    read over netlink are described exactly like those read from ip.
+    """
+    if route.type != RTN_UNICAST:
+        toks = [RTN_TYPES.get(route.type, str(route.type))]
+    elif not route.dst_len:
+        toks = ['default']
+    elif route.dst_len == (32 if route.family == socket.AF_INET else 128):
+        toks = [route.dst]
+    else:
+        toks = ['%s/%d' % (route.dst, route.dst_len)]
+    if route.gateway:
+        toks.extend(['via', route.gateway])
+    if route.oif in names:
+        toks.extend(['dev', names[route.oif]])
+    if route.priority is not None:
+        toks.extend(['metric', str(route.priority)])
+    if route.expires:
+        toks.extend(['expires', '%dsec' % route.expires])
+    return toks
+
+
+def _netdev_route_info_netlink():
+    """
+    Get network route dicts over rtnetlink without running ip.
+
+    @returns: The same dict as _netdev_route_info_iproute, with ipv4 routes
+              of the main table and ipv6 routes of all tables, or None when
+              netlink is not available.
+    """
+    try:
+        names = dict((link.index, link.name) for link in netlink.read_links())
+        routes4 = netlink.read_routes(socket.AF_INET)
+        routes6 = netlink.read_routes(socket.AF_INET6)
+    except (netlink.NetlinkCreateSocketError, OSError, struct.error) as e:
+        LOG.debug('Could not read routes over netlink: %s', e)
+        return None
+    routes = {}
+    routes['ipv4'] = [
+        _iproute_route4_entry(_route_tokens(route, names))
+        for route in routes4 if route.table == RT_TABLE_MAIN]
+    routes['ipv6'] = [
+        _iproute_route6_entry(_route_tokens(route, names))
+        for route in routes6]
     return routes
 
 
@@ -394,7 +515,10 @@ def _netdev_route_info_netstat(route_data):
 
 def route_info():
     routes = {}
-    if subp.which('ip'):
+    netlink_routes = _netdev_route_info_netlink() if util.is_Linux() else None
+    if netlink_routes is not None:
+        routes = netlink_routes
+    elif subp.which('ip'):
         # Try iproute first of all
         (iproute_out, _err) = subp.subp(["ip", "-o", "route", "list"])
         routes = _netdev_route_info_iproute(iproute_out)
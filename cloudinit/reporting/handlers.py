@@ -1,6 +1,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import abc
+import collections
 import fcntl
 import json
 import os
@@ -18,10 +19,48 @@ from cloudinit import (url_helper, util)
 LOG = logging.getLogger(__name__)
 
 
+# Queued by flush() to end the batch being collected by a publish thread.
+_FLUSH = object()
+
+
 class ReportException(Exception):
     pass
 
 
+def _get_queued_batch(q, interval=None, max_size=None):
+    """Block for the next item on q and return it with a batch of others.
+
+    Items queued within interval seconds of the first one are added to the
+    batch, up to max_size items; without an interval only the items already
+    queued are added. A _FLUSH marker ends the batch early.
+
+    Returns (count, batch) where count is the number of items taken from q,
+    including markers, so that the caller can call q.task_done() for each.
+    """
+    item = q.get(block=True)
+    count = 1
+    batch = []
+    deadline = None
+    if interval:
+        deadline = time.monotonic() + interval
+    while item is not _FLUSH:
+        batch.append(item)
+        if max_size and len(batch) >= max_size:
+            break
+        try:
+            if deadline is None:
+                item = q.get(block=False)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                item = q.get(block=True, timeout=remaining)
+            count += 1
+        except queue.Empty:
+            break
+    return (count, batch)
+
+
 class ReportingHandler(metaclass=abc.ABCMeta):
     """Base class for report handlers.
 
@@ -67,9 +106,24 @@ class PrintHandler(ReportingHandler):
 
 
 class WebHookHandler(ReportingHandler):
+    """Publishes events to a webhook endpoint.
+
+    By default each event is POSTed as a json object from the thread that
+    published it. Setting max_batch_size or flush_interval moves sending to
+    a background thread instead: events published within flush_interval
+    seconds of each other, up to max_batch_size events, are POSTed together
+    as a json list (or one object per POST when max_batch_size is 1).
+    flush() waits for all queued events to be sent.
+
+    With a spool_file, events the background thread failed to deliver are
+    saved there and resent before newer events on the next attempt, which
+    may be made by a later cloud-init stage.
+    """
+
     def __init__(self, endpoint, consumer_key=None, token_key=None,
                  token_secret=None, consumer_secret=None, timeout=None,
-                 retries=None):
+                 retries=None, max_batch_size=None, flush_interval=None,
+                 spool_file=None):
         super(WebHookHandler, self).__init__()
 
         if any([consumer_key, token_key, token_secret, consumer_secret]):
@@ -82,20 +136,112 @@ class WebHookHandler(ReportingHandler):
         self.timeout = timeout
         self.retries = retries
         self.ssl_details = util.fetch_ssl_details()
-
-    def publish_event(self, event):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.spool_file = spool_file
+        self.q = None
+        if max_batch_size or flush_interval:
+            self.q = queue.Queue()
+            self.publish_thread = threading.Thread(
+                target=self._publish_event_routine)
+            self.publish_thread.daemon = True
+            self.publish_thread.start()
+
+    def _post(self, data):
         if self.oauth_helper:
             readurl = self.oauth_helper.readurl
         else:
             readurl = url_helper.readurl
+        return readurl(
+            self.endpoint, data=data, timeout=self.timeout,
+            retries=self.retries, ssl_details=self.ssl_details)
+
+    def _read_spool(self):
+        if not self.spool_file:
+            return []
         try:
-            return readurl(
-                self.endpoint, data=json.dumps(event.as_dict()),
-                timeout=self.timeout,
-                retries=self.retries, ssl_details=self.ssl_details)
+            content = util.load_file(self.spool_file, quiet=True)
+        except (OSError, IOError) as e:
+            LOG.warning("failed reading webhook spool %s: %s",
+                        self.spool_file, e)
+            return []
+        spooled = []
+        for line in content.splitlines():
+            try:
+                spooled.append(json.loads(line))
+            except ValueError:
+                LOG.warning("Ignoring corrupt event in webhook spool %s",
+                            self.spool_file)
+        return spooled
+
+    def _write_spool(self, event_dicts):
+        if not self.spool_file:
+            return
+        if not event_dicts:
+            util.del_file(self.spool_file)
+            return
+        content = ''.join(json.dumps(e) + '\n' for e in event_dicts)
+        try:
+            util.write_file(self.spool_file, content, mode=0o600)
+        except (OSError, IOError) as e:
+            LOG.warning("failed writing webhook spool %s: %s",
+                        self.spool_file, e)
+
+    def _send(self, event_dicts):
+        """POST event_dicts after any spooled events, in batches.
+
+        Events that could not be posted are kept in the spool file.
+        """
+        spooled = self._read_spool()
+        pending = spooled + event_dicts
+        batch_size = self.max_batch_size or len(pending)
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            if self.max_batch_size == 1:
+                data = json.dumps(batch[0])
+            else:
+                data = json.dumps(batch)
+            try:
+                self._post(data)
+            except Exception:
+                LOG.warning("failed posting %d events to %s",
+                            len(pending) - start, self.endpoint)
+                self._write_spool(pending[start:])
+                return
+        if spooled:
+            self._write_spool([])
+
+    def _publish_event_routine(self):
+        while True:
+            (items_from_queue, batch) = _get_queued_batch(
+                self.q, self.flush_interval, self.max_batch_size)
+            try:
+                if batch:
+                    self._send(batch)
+            except Exception as e:
+                LOG.warning("failed sending events to webhook: %s", e)
+            finally:
+                for _ in range(items_from_queue):
+                    self.q.task_done()
+
+    def publish_event(self, event):
+        if self.q is not None:
+            self.q.put(event.as_dict())
+            return
+        try:
+            return self._post(json.dumps(event.as_dict()))
         except Exception:
             LOG.warning("failed posting event: %s", event.as_string())
 
+    def flush(self):
+        if self.q is None:
+            return
+        LOG.debug('WebHookHandler flushing remaining events')
+        if self.flush_interval:
+            # Cut the current flush interval short.
+            self.q.put(_FLUSH)
+        self.q.join()
+
 
 class HyperVKvpReportingHandler(ReportingHandler):
     """
@@ -109,6 +255,14 @@ class HyperVKvpReportingHandler(ReportingHandler):
     This reporter collates all events for a module (origin|name) in a single
     json string in the dictionary.
 
+    By default every event is appended to the pool file as soon as the
+    publishing thread picks it up. Setting batch_interval (in seconds)
+    coalesces the events published within that interval into one locked
+    write. Setting max_pool_records bounds the number of records this
+    handler keeps in the pool: once the limit is reached the oldest of its
+    own records are overwritten in place, so the pool file stops growing
+    and records written by other agents are left alone.
+
     For more information, see
     https://technet.microsoft.com/en-us/library/dn798287.aspx#Linux%20guests
     """
@@ -128,13 +282,22 @@ class HyperVKvpReportingHandler(ReportingHandler):
 
     def __init__(self,
                  kvp_file_path=KVP_POOL_FILE_GUEST,
-                 event_types=None):
+                 event_types=None,
+                 batch_interval=None,
+                 max_pool_records=None):
         super(HyperVKvpReportingHandler, self).__init__()
         self._kvp_file_path = kvp_file_path
         HyperVKvpReportingHandler._truncate_guest_pool_file(
             self._kvp_file_path)
 
         self._event_types = event_types
+        self._batch_interval = batch_interval
+        self._max_pool_records = max_pool_records
+        # Offsets of the records written by this handler, oldest first.
+        # Only populated when max_pool_records is set.
+        self._record_offsets = None
+        self._stats = {'events': 0, 'batches': 0, 'records_written': 0,
+                       'records_reused': 0, 'max_latency': 0.0}
         self.q = queue.Queue()
         self.incarnation_no = self._get_incarnation_no()
         self.event_key_prefix = u"{0}|{1}".format(self.EVENT_PREFIX,
@@ -239,6 +402,73 @@ class HyperVKvpReportingHandler(ReportingHandler):
             f.flush()
             fcntl.flock(f, fcntl.LOCK_UN)
 
+    def _record_age_key(self, record_data):
+        """Return a key ordering our records from oldest to newest.
+
+        Records are ordered by the event timestamp in their value. Records
+        without a readable timestamp sort first, so they are reused first.
+        """
+        try:
+            value = json.loads(self._decode_kvp_item(record_data)['value'])
+            timestamp = value['ts']
+            if '.' not in timestamp:
+                # isoformat() leaves out microseconds when they are zero
+                timestamp = timestamp.rstrip('Z') + '.000000Z'
+            return timestamp
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return ''
+
+    def _load_record_offsets(self, f):
+        """Return the offsets of our records already present in the pool.
+
+        Records from an earlier stage of this boot share our key prefix and
+        count towards max_pool_records. Once an earlier stage wrapped around
+        max_pool_records their file position no longer tells their age, so
+        they are ordered by event timestamp, oldest first.
+        """
+        records = []
+        prefix = (self.event_key_prefix + '|').encode('utf-8')
+        f.seek(0)
+        offset = 0
+        record_data = f.read(self.HV_KVP_RECORD_SIZE)
+        while len(record_data) == self.HV_KVP_RECORD_SIZE:
+            if record_data.startswith(prefix):
+                records.append(
+                    (self._record_age_key(record_data), offset))
+            offset += self.HV_KVP_RECORD_SIZE
+            record_data = f.read(self.HV_KVP_RECORD_SIZE)
+        return collections.deque(offset for (_age, offset) in sorted(records))
+
+    def _write_kvp_items(self, record_data):
+        """Write records to the pool, reusing our oldest slots when full.
+
+        Returns the number of records that overwrote an existing slot.
+        """
+        if not self._max_pool_records:
+            self._append_kvp_item(record_data)
+            return 0
+        reused = 0
+        with open(self._kvp_file_path, 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if self._record_offsets is None:
+                    self._record_offsets = self._load_record_offsets(f)
+                end = f.seek(0, os.SEEK_END)
+                for data in record_data:
+                    if len(self._record_offsets) >= self._max_pool_records:
+                        offset = self._record_offsets.popleft()
+                        reused += 1
+                    else:
+                        offset = end
+                        end += self.HV_KVP_RECORD_SIZE
+                    f.seek(offset)
+                    f.write(data)
+                    self._record_offsets.append(offset)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return reused
+
     def _break_down(self, key, meta_data, description):
         del meta_data[self.MSG_KEY]
         des_in_json = json.dumps(description)
@@ -294,21 +524,23 @@ class HyperVKvpReportingHandler(ReportingHandler):
 
     def _publish_event_routine(self):
         while True:
-            items_from_queue = 0
             try:
-                event = self.q.get(block=True)
-                items_from_queue += 1
-                encoded_data = []
-                while event is not None:
-                    encoded_data += self._encode_event(event)
-                    try:
-                        # get all the rest of the events in the queue
-                        event = self.q.get(block=False)
-                        items_from_queue += 1
-                    except queue.Empty:
-                        event = None
+                (items_from_queue, batch) = _get_queued_batch(
+                    self.q, self._batch_interval)
                 try:
-                    self._append_kvp_item(encoded_data)
+                    if not batch:
+                        continue
+                    encoded_data = []
+                    for (_queued, event) in batch:
+                        encoded_data += self._encode_event(event)
+                    reused = self._write_kvp_items(encoded_data)
+                    latency = time.monotonic() - batch[0][0]
+                    self._stats['events'] += len(batch)
+                    self._stats['batches'] += 1
+                    self._stats['records_written'] += len(encoded_data)
+                    self._stats['records_reused'] += reused
+                    self._stats['max_latency'] = max(
+                        self._stats['max_latency'], latency)
                 except (OSError, IOError) as e:
                     LOG.warning("failed posting events to kvp, %s", e)
                 finally:
@@ -324,11 +556,31 @@ class HyperVKvpReportingHandler(ReportingHandler):
     # so defer it to another thread.
     def publish_event(self, event):
         if not self._event_types or event.event_type in self._event_types:
-            self.q.put(event)
+            self.q.put((time.monotonic(), event))
+
+    def stats(self):
+        """Return publishing statistics for this handler.
+
+        queue_depth is the number of events waiting to be written and
+        max_latency the longest time in seconds between an event being
+        published and its batch reaching the pool file.
+        """
+        stats = dict(self._stats)
+        stats['queue_depth'] = self.q.qsize()
+        return stats
 
     def flush(self):
         LOG.debug('HyperVReportingHandler flushing remaining events')
+        if self._batch_interval:
+            # Cut the current batch interval short.
+            self.q.put(_FLUSH)
         self.q.join()
+        stats = self.stats()
+        LOG.debug('HyperVReportingHandler wrote %d events in %d batches,'
+                  ' %d records (%d reused), max latency %.3fs',
+                  stats['events'], stats['batches'],
+                  stats['records_written'], stats['records_reused'],
+                  stats['max_latency'])
 
 
 available_handlers = DictRegistry()
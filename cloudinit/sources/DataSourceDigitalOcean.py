@@ -47,6 +47,10 @@ class DataSourceDigitalOcean(sources.DataSource):
     def _get_sysinfo(self):
         return do_helper.read_sysinfo()
 
+    def _is_platform_viable(self):
+        """Check platform environment to report if this datasource may run."""
+        return self._get_sysinfo()[0]
+
     def _get_data(self):
         (is_do, droplet_id) = self._get_sysinfo()
 
@@ -83,7 +83,8 @@ class DataSourceEc2(sources.DataSource):
         """Return the cloud name as identified during _get_data."""
         return identify_platform()
 
-    def _get_data(self):
+    def _is_platform_viable(self):
+        """Check platform environment to report if this datasource may run."""
         strict_mode, _sleep = read_strict_mode(
             util.get_cfg_by_path(self.sys_cfg, STRICT_ID_PATH,
                                  STRICT_ID_DEFAULT), ("warn", None))
@@ -94,6 +95,11 @@ class DataSourceEc2(sources.DataSource):
             return False
         elif self.cloud_name == CloudNames.NO_EC2_METADATA:
             return False
+        return True
+
+    def _get_data(self):
+        if not self._is_platform_viable():
+            return False
 
         if self.perform_dhcp_setup:  # Setup networking in init-local stage.
             if util.is_FreeBSD():
@@ -224,7 +230,8 @@ class DataSourceEc2(sources.DataSource):
                 headers_cb=self._get_headers,
                 exception_cb=self._imds_exception_cb,
                 request_method=request_method,
-                headers_redact=AWS_TOKEN_REDACT)
+                headers_redact=AWS_TOKEN_REDACT,
+                race=self._race_metadata_urls())
         except uhelp.UrlError:
             # We use the raised exception to interupt the retry loop.
             # Nothing else to do here.
@@ -238,6 +245,11 @@ class DataSourceEc2(sources.DataSource):
         # or the IMDS HTTP endpoint is disabled
         return None
 
+    def _race_metadata_urls(self):
+        """Whether to probe all metadata_urls concurrently."""
+        return util.get_cfg_option_bool(
+            self.ds_cfg, 'race_metadata_urls', default=False)
+
     def wait_for_metadata_service(self):
         mcfg = self.ds_cfg
 
@@ -282,7 +294,8 @@ class DataSourceEc2(sources.DataSource):
                 urls=urls, max_wait=url_params.max_wait_seconds,
                 timeout=url_params.timeout_seconds, status_cb=LOG.warning,
                 headers_redact=AWS_TOKEN_REDACT, headers_cb=self._get_headers,
-                request_method=request_method)
+                request_method=request_method,
+                race=self._race_metadata_urls())
 
             if url:
                 metadata_address = url2base[url]
@@ -462,6 +475,7 @@ class DataSourceEc2(sources.DataSource):
             exc_cb_ud = self._skip_or_refresh_stale_aws_token_cb
         else:
             exc_cb = exc_cb_ud = None
+        max_workers = self.get_crawl_max_workers()
         try:
             crawled_metadata['user-data'] = ec2.get_instance_userdata(
                 api_version, self.metadata_address,
@@ -470,12 +484,12 @@ class DataSourceEc2(sources.DataSource):
             crawled_metadata['meta-data'] = ec2.get_instance_metadata(
                 api_version, self.metadata_address,
                 headers_cb=self._get_headers, headers_redact=redact,
-                exception_cb=exc_cb)
+                exception_cb=exc_cb, max_workers=max_workers)
             if self.cloud_name == CloudNames.AWS:
                 identity = ec2.get_instance_identity(
                     api_version, self.metadata_address,
                     headers_cb=self._get_headers, headers_redact=redact,
-                    exception_cb=exc_cb)
+                    exception_cb=exc_cb, max_workers=max_workers)
                 crawled_metadata['dynamic'] = {'instance-identity': identity}
         except Exception:
             util.logexc(
@@ -6,6 +6,7 @@ import datetime
 import json
 
 from base64 import b64decode
+from concurrent import futures
 
 from cloudinit import dmi
 from cloudinit.distros import ug_util
@@ -17,7 +18,7 @@ from cloudinit import util
 LOG = logging.getLogger(__name__)
 
 MD_V1_URL = 'http://metadata.google.internal/computeMetadata/v1/'
-BUILTIN_DS_CONFIG = {'metadata_url': MD_V1_URL}
+BUILTIN_DS_CONFIG = {'metadata_url': MD_V1_URL, 'recursive_fetch': False}
 REQUIRED_FIELDS = ('instance-id', 'availability-zone', 'local-hostname')
 GUEST_ATTRIBUTES_URL = ('http://metadata.google.internal/computeMetadata/'
                         'v1/instance/guest-attributes')
@@ -67,10 +68,20 @@ class DataSourceGCE(sources.DataSource):
             BUILTIN_DS_CONFIG])
         self.metadata_address = self.ds_cfg['metadata_url']
 
+    def _is_platform_viable(self):
+        """Check platform environment to report if this datasource may run."""
+        return platform_reports_gce()
+
     def _get_data(self):
+        if not self._is_platform_viable():
+            return False
+
+        recursive = util.translate_bool(self.ds_cfg.get('recursive_fetch'))
         ret = util.log_time(
             LOG.debug, 'Crawl of GCE metadata service',
-            read_md, kwargs={'address': self.metadata_address})
+            read_md, kwargs={'address': self.metadata_address,
+                             'platform_check': False,
+                             'recursive': recursive})
 
         if not ret['success']:
             if ret['platform_reports_gce']:
@@ -176,7 +187,49 @@ def _parse_public_keys(public_keys_data, default_user=None):
     return public_keys
 
 
-def read_md(address=None, platform_check=True):
+def _get_md_recursive(metadata_fetcher):
+    """Fetch the instance and project trees concurrently.
+
+    Returns the same keys as the per-path fetch in read_md, with a None value
+    for any key that is not present.
+    """
+    def get_tree(path):
+        value = metadata_fetcher.get_value(path, False, is_recursive=True)
+        if value is None:
+            return {}
+        try:
+            tree = json.loads(value)
+        except ValueError as e:
+            LOG.debug("url %s returned invalid json: %s", path, e)
+            return {}
+        return tree if isinstance(tree, dict) else {}
+
+    def text(value):
+        return None if value is None else str(value)
+
+    def attributes(tree):
+        if 'attributes' not in tree:
+            return None
+        return json.dumps(tree['attributes'])
+
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        (instance, project) = executor.map(get_tree, ('instance', 'project'))
+    return {
+        'instance-id': text(instance.get('id')),
+        'availability-zone': text(instance.get('zone')),
+        'local-hostname': text(instance.get('hostname')),
+        'instance-data': attributes(instance),
+        'project-data': attributes(project),
+    }
+
+
+def read_md(address=None, platform_check=True, recursive=False):
+    """Read GCE metadata from address.
+
+    By default each metadata path is requested in turn. With recursive=True
+    the instance and project trees are requested concurrently, one request
+    each, and the same metadata is derived from them.
+    """
 
     if address is None:
         address = MD_V1_URL
@@ -206,13 +259,19 @@ def read_md(address=None, platform_check=True):
 
     metadata_fetcher = GoogleMetadataFetcher(address)
     md = {}
+    if recursive:
+        md = _get_md_recursive(metadata_fetcher)
     # Iterate over url_map keys to get metadata items.
     for (mkey, paths, required, is_text, is_recursive) in url_map:
-        value = None
-        for path in paths:
-            new_value = metadata_fetcher.get_value(path, is_text, is_recursive)
-            if new_value is not None:
-                value = new_value
+        if recursive:
+            value = md[mkey]
+        else:
+            value = None
+            for path in paths:
+                new_value = metadata_fetcher.get_value(
+                    path, is_text, is_recursive)
+                if new_value is not None:
+                    value = new_value
         if required and value is None:
             msg = "required key %s returned nothing. not GCE"
             ret['reason'] = msg % mkey
@@ -287,8 +346,12 @@ if __name__ == "__main__":
     parser.add_argument("--no-platform-check", dest="platform_check",
                         help="Ignore smbios platform check",
                         action='store_false', default=True)
+    parser.add_argument("--recursive", dest="recursive",
+                        help="Fetch instance and project metadata trees",
+                        action='store_true', default=False)
     args = parser.parse_args()
-    data = read_md(address=args.endpoint, platform_check=args.platform_check)
+    data = read_md(address=args.endpoint, platform_check=args.platform_check,
+                   recursive=args.recursive)
     if 'user-data' in data:
         # user-data is bytes not string like other things. Handle it specially.
         # If it can be represented as utf-8 then do so. Otherwise print base64
@@ -47,6 +47,10 @@ class DataSourceHetzner(sources.DataSource):
         self._network_config = None
         self.dsmode = sources.DSMODE_NETWORK
 
+    def _is_platform_viable(self):
+        """Check platform environment to report if this datasource may run."""
+        return get_hcloud_data()[0]
+
     def _get_data(self):
         (on_hetzner, serial) = get_hcloud_data()
 
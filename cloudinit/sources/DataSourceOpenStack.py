@@ -83,7 +83,9 @@ class DataSourceOpenStack(openstack.SourceMixin, sources.DataSource):
         start_time = time.time()
         avail_url, _response = url_helper.wait_for_url(
             urls=md_urls, max_wait=url_params.max_wait_seconds,
-            timeout=url_params.timeout_seconds)
+            timeout=url_params.timeout_seconds,
+            race=util.get_cfg_option_bool(
+                self.ds_cfg, 'race_metadata_urls', default=False))
         if avail_url:
             LOG.debug("Using metadata source: '%s'", url2base[avail_url])
         else:
@@ -120,6 +122,11 @@ class DataSourceOpenStack(openstack.SourceMixin, sources.DataSource):
             self.network_json, known_macs=None)
         return self._network_config
 
+    def _is_platform_viable(self):
+        """Check platform environment to report if this datasource may run."""
+        oracle_considered = 'Oracle' in self.sys_cfg.get('datasource_list')
+        return detect_openstack(accept_oracle=not oracle_considered)
+
     def _get_data(self):
         """Crawl metadata, parse and persist that data for this instance.
 
@@ -127,8 +134,7 @@ class DataSourceOpenStack(openstack.SourceMixin, sources.DataSource):
             False when unable to contact metadata service or when metadata
             format is invalid or disabled.
         """
-        oracle_considered = 'Oracle' in self.sys_cfg.get('datasource_list')
-        if not detect_openstack(accept_oracle=not oracle_considered):
+        if not self._is_platform_viable():
             return False
 
         if self.perform_dhcp_setup:  # Setup networking in init-local stage.
@@ -186,14 +192,15 @@ class DataSourceOpenStack(openstack.SourceMixin, sources.DataSource):
                     error=str(e)))
 
         url_params = self.get_url_params()
-
+        max_workers = self.get_crawl_max_workers()
         try:
             result = util.log_time(
                 LOG.debug, 'Crawl of openstack metadata service',
                 read_metadata_service, args=[self.metadata_address],
                 kwargs={'ssl_details': self.ssl_details,
                         'retries': url_params.num_retries,
-                        'timeout': url_params.timeout_seconds})
+                        'timeout': url_params.timeout_seconds,
+                        'max_workers': max_workers})
         except openstack.NonReadable as e:
             raise sources.InvalidMetaDataException(str(e))
         except (openstack.BrokenMetadata, IOError) as e:
@@ -216,9 +223,10 @@ class DataSourceOpenStackLocal(DataSourceOpenStack):
 
 
 def read_metadata_service(base_url, ssl_details=None,
-                          timeout=5, retries=5):
+                          timeout=5, retries=5, max_workers=None):
     reader = openstack.MetadataReader(base_url, ssl_details=ssl_details,
-                                      timeout=timeout, retries=retries)
+                                      timeout=timeout, retries=retries,
+                                      max_workers=max_workers)
     return reader.read_v2()
 
 
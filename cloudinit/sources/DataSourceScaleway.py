@@ -206,8 +206,12 @@ class DataSourceScaleway(sources.DataSource):
             self.retries, self.timeout
         )
 
+    def _is_platform_viable(self):
+        """Check platform environment to report if this datasource may run."""
+        return on_scaleway()
+
     def _get_data(self):
-        if not on_scaleway():
+        if not self._is_platform_viable():
             return False
 
         if self._fallback_interface is None:
@@ -12,7 +12,9 @@ import abc
 import copy
 import json
 import os
+import re
 from collections import namedtuple
+from concurrent import futures
 
 from cloudinit import dmi
 from cloudinit import importer
@@ -21,7 +23,7 @@ from cloudinit import net
 from cloudinit import type_utils
 from cloudinit import user_data as ud
 from cloudinit import util
-from cloudinit.atomic_helper import write_json
+from cloudinit.atomic_helper import write_file, write_json
 from cloudinit.event import EventType
 from cloudinit.filters import launch_index
 from cloudinit.reporting import events
@@ -47,6 +49,11 @@ EXPERIMENTAL_TEXT = (
 INSTANCE_JSON_FILE = 'instance-data.json'
 # security-sensitive key values are present in this root-readable file
 INSTANCE_JSON_SENSITIVE_FILE = 'instance-data-sensitive.json'
+# Key index written next to each instance-data file for cloud-init query
+INSTANCE_JSON_INDEX_SUFFIX = '.index'
+INSTANCE_JSON_INDEX_VERSION = 1
+# Nesting depth of the dict keys listed in the key index
+INSTANCE_JSON_INDEX_DEPTH = 3
 REDACT_SENSITIVE_VALUE = 'redacted for non-root user'
 
 # Key which can be provide a cloud's official product name to cloud-init
@@ -130,6 +137,166 @@ def redact_sensitive_keys(metadata, redact_value=REDACT_SENSITIVE_VALUE):
     return md_copy
 
 
+def _json_key(key):
+    """Return key as a json object key, as json.dumps would write it."""
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (bool, int, float)):
+        return json.dumps(key)
+    raise TypeError(
+        'keys must be str, int, float, bool or None, not %s' %
+        type(key).__name__)
+
+
+def _json_value(value):
+    """Return value as it reads back after util.json_dumps and json.loads."""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, dict):
+        return dict(
+            (_json_key(key), _json_value(val)) for key, val in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_json_value(val) for val in value]
+    return _json_value(util.json_serialize_default(value))
+
+
+def _process_instance_dict(data, key_path, sensitive_keys, redact_value,
+                           base64_encoded_keys, sens_keys):
+    """Return processed and redacted copies of a dict of instance data.
+
+    The redacted copy shares every value which contains no sensitive key
+    with the processed copy.
+    """
+    processed = {}
+    redactions = {}
+    for key, val in data.items():
+        key = _json_key(key)
+        if key_path:
+            sub_key_path = key_path + '/' + key
+        else:
+            sub_key_path = key
+        sensitive = key in sensitive_keys or sub_key_path in sensitive_keys
+        if sensitive:
+            sens_keys.append(sub_key_path)
+        if isinstance(val, dict):
+            (val, redacted_val) = _process_instance_dict(
+                val, sub_key_path, sensitive_keys, redact_value,
+                base64_encoded_keys, sens_keys)
+        else:
+            val = redacted_val = _json_value(val)
+            if isinstance(val, str) and val.startswith('ci-b64:'):
+                base64_encoded_keys.append(sub_key_path)
+                val = redacted_val = val.replace('ci-b64:', '')
+        processed[key] = val
+        if sensitive:
+            redactions[key] = redact_value
+        elif redacted_val is not val:
+            redactions[key] = redacted_val
+    if not redactions:
+        return (processed, processed)
+    redacted = dict(processed)
+    redacted.update(redactions)
+    return (processed, redacted)
+
+
+def process_instance_data(instance_data, sensitive_keys=(),
+                          redact_value=REDACT_SENSITIVE_VALUE):
+    """Process instance data for persisting as json in a single walk.
+
+    This is equivalent to process_instance_metadata on the json_dumps round
+    trip of instance_data followed by redact_sensitive_keys, without copying
+    or serializing the data more than once. instance_data is not modified.
+
+    @return: Tuple of the processed and the redacted instance data.
+    @raises: TypeError on keys json cannot represent.
+    """
+    base64_encoded_keys = []
+    sens_keys = []
+    (processed, redacted) = _process_instance_dict(
+        instance_data, '', sensitive_keys, redact_value, base64_encoded_keys,
+        sens_keys)
+    for md in (processed, redacted):
+        md['base64_encoded_keys'] = sorted(base64_encoded_keys)
+        md['sensitive_keys'] = sorted(sens_keys)
+    return (processed, redacted)
+
+
+def _dump_indexed_json(value, key, depth, offset, parts):
+    """Append the json of value to parts and return its index entry and size.
+
+    The text appended is that of json.dumps(indent=1, sort_keys=True) for a
+    value nested depth levels deep starting at offset. Dicts less than
+    INSTANCE_JSON_INDEX_DEPTH deep, or keyed like v1 as their keys are
+    aliased by cloud-init query, are indexed as a dict of their keys. Any
+    other value is indexed as the [offset, length] of its json text.
+    """
+    if (not isinstance(value, dict) or not value or
+            (depth >= INSTANCE_JSON_INDEX_DEPTH and
+             not re.match(r'v\d+', key))):
+        text = json.dumps(value, indent=1, sort_keys=True)
+        if depth:
+            text = text.replace('\n', '\n' + ' ' * depth)
+        parts.append(text)
+        return ([offset, len(text)], len(text))
+    index = {}
+    start = offset
+    separator = '{\n' + ' ' * (depth + 1)
+    for sub_key in sorted(value):
+        item = separator + json.dumps(sub_key) + ': '
+        parts.append(item)
+        offset += len(item)
+        (index[sub_key], size) = _dump_indexed_json(
+            value[sub_key], sub_key, depth + 1, offset, parts)
+        offset += size
+        separator = ',\n' + ' ' * (depth + 1)
+    parts.append('\n' + ' ' * depth + '}')
+    return (index, offset + depth + 2 - start)
+
+
+def write_instance_data(filename, instance_data, mode=0o644):
+    """Write instance_data as json to filename along with its key index.
+
+    The json written is that of atomic_helper.write_json. The index, written
+    to filename + INSTANCE_JSON_INDEX_SUFFIX, lets cloud-init query read
+    just the values it is asked for. See load_instance_data_index.
+    """
+    parts = []
+    (keys, _size) = _dump_indexed_json(instance_data, '', 0, 0, parts)
+    parts.append('\n')
+    write_file(filename, ''.join(parts), omode='w', mode=mode)
+    stat = os.stat(filename)
+    write_json(
+        filename + INSTANCE_JSON_INDEX_SUFFIX,
+        {'version': INSTANCE_JSON_INDEX_VERSION, 'size': stat.st_size,
+         'mtime_ns': stat.st_mtime_ns, 'keys': keys},
+        mode=mode)
+
+
+def load_instance_data_index(filename):
+    """Return the key index of the instance-data json file filename.
+
+    Each key of the index maps to either the index of a dict value or to
+    the [offset, length] of the value's json text in filename.
+
+    @return: Dict of the index or None when there is no index for the
+        current content of filename.
+    """
+    try:
+        index = json.loads(
+            util.load_file(filename + INSTANCE_JSON_INDEX_SUFFIX))
+        stat = os.stat(filename)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(index, dict):
+        return None
+    if (index.get('version') != INSTANCE_JSON_INDEX_VERSION or
+            index.get('size') != stat.st_size or
+            index.get('mtime_ns') != stat.st_mtime_ns):
+        LOG.debug('Ignoring stale instance-data index for %s', filename)
+        return None
+    return index.get('keys')
+
+
 URLParams = namedtuple(
     'URLParms', ['max_wait_seconds', 'timeout_seconds', 'num_retries'])
 
@@ -172,6 +339,11 @@ class DataSource(metaclass=abc.ABCMeta):
     url_timeout = 10    # timeout for each metadata url read attempt
     url_retries = 5     # number of times to retry url upon 404
 
+    # Number of concurrent requests used to crawl the metadata service,
+    # overridden by max_workers in ds_cfg. The default of 1 crawls
+    # sequentially.
+    crawl_max_workers = 1
+
     # The datasource defines a set of supported EventTypes during which
     # the datasource can react to changes in metadata and regenerate
     # network configuration on metadata changes.
@@ -211,7 +383,12 @@ class DataSource(metaclass=abc.ABCMeta):
             self.ds_cfg = {}
 
         if not ud_proc:
-            self.ud_proc = ud.UserDataProcessor(self.paths)
+            sys_cfg = self.sys_cfg or {}
+            self.ud_proc = ud.UserDataProcessor(
+                self.paths, max_workers=util.get_cfg_option_max_workers(
+                    sys_cfg, 'include_max_workers'),
+                cache_includes=util.get_cfg_option_bool(
+                    sys_cfg, 'include_cache', False))
         else:
             self.ud_proc = ud_proc
 
@@ -293,8 +470,7 @@ class DataSource(metaclass=abc.ABCMeta):
         if hasattr(self, '_crawled_metadata'):
             # Any datasource with _crawled_metadata will best represent
             # most recent, 'raw' metadata
-            crawled_metadata = copy.deepcopy(
-                getattr(self, '_crawled_metadata'))
+            crawled_metadata = dict(getattr(self, '_crawled_metadata'))
             crawled_metadata.pop('user-data', None)
             crawled_metadata.pop('vendor-data', None)
             instance_data = {'ds': crawled_metadata}
@@ -309,8 +485,10 @@ class DataSource(metaclass=abc.ABCMeta):
                 if ec2_metadata != UNSET:
                     instance_data['ds']['ec2_metadata'] = ec2_metadata
         instance_data['ds']['_doc'] = EXPERIMENTAL_TEXT
-        # Add merged cloud.cfg and sys info for jinja templates and cli query
-        instance_data['merged_cfg'] = copy.deepcopy(self.sys_cfg)
+        # Add merged cloud.cfg and sys info for jinja templates and cli query.
+        # Shallow copies are enough as process_instance_data copies the
+        # values it writes.
+        instance_data['merged_cfg'] = dict(self.sys_cfg)
         instance_data['merged_cfg']['_doc'] = (
             'Merged cloud-init system config from /etc/cloud/cloud.cfg and'
             ' /etc/cloud/cloud.cfg.d/')
@@ -318,12 +496,10 @@ class DataSource(metaclass=abc.ABCMeta):
         instance_data.update(
             self._get_standardized_metadata(instance_data))
         try:
-            # Process content base64encoding unserializable values
-            content = util.json_dumps(instance_data)
-            # Strip base64: prefix and set base64_encoded_keys list.
-            processed_data = process_instance_metadata(
-                json.loads(content),
-                sensitive_keys=self.sensitive_metadata_keys)
+            # Base64 encode unserializable values, strip their ci-b64: prefix
+            # and set base64_encoded_keys while redacting sensitive keys.
+            (processed_data, redacted_data) = process_instance_data(
+                instance_data, sensitive_keys=self.sensitive_metadata_keys)
         except TypeError as e:
             LOG.warning('Error persisting instance-data.json: %s', str(e))
             return False
@@ -332,10 +508,10 @@ class DataSource(metaclass=abc.ABCMeta):
             return False
         json_sensitive_file = os.path.join(self.paths.run_dir,
                                            INSTANCE_JSON_SENSITIVE_FILE)
-        write_json(json_sensitive_file, processed_data, mode=0o600)
+        write_instance_data(json_sensitive_file, processed_data, mode=0o600)
         json_file = os.path.join(self.paths.run_dir, INSTANCE_JSON_FILE)
         # World readable
-        write_json(json_file, redact_sensitive_keys(processed_data))
+        write_instance_data(json_file, redacted_data)
         return True
 
     def _get_data(self):
@@ -344,6 +520,15 @@ class DataSource(metaclass=abc.ABCMeta):
             'Subclasses of DataSource must implement _get_data which'
             ' sets self.metadata, vendordata_raw and userdata_raw.')
 
+    def _is_platform_viable(self):
+        """Check platform environment to report if this datasource may run.
+
+        Subclasses override this with cheap local checks (DMI, seed
+        directories, kernel cmdline) which do not touch the network. The
+        default of True means the platform cannot be ruled out locally.
+        """
+        return True
+
     def get_url_params(self):
         """Return the Datasource's prefered url_read parameters.
 
@@ -380,6 +565,15 @@ class DataSource(metaclass=abc.ABCMeta):
 
         return URLParams(max_wait, timeout, retries)
 
+    def get_crawl_max_workers(self):
+        """Return the number of concurrent requests used to crawl metadata.
+
+        Subclasses may override crawl_max_workers, the default used when
+        max_workers is not set in the datasource's config.
+        """
+        return util.get_cfg_option_max_workers(
+            self.ds_cfg, 'max_workers', self.crawl_max_workers)
+
     def get_userdata(self, apply_filter=False):
         if self.userdata is None:
             self.userdata = self.ud_proc.process(self.get_userdata_raw())
@@ -752,13 +946,56 @@ def normalize_pubkey_data(pubkey_data):
     return keys
 
 
+def _check_platform_viability(sources, max_workers=None):
+    """Run _is_platform_viable of each datasource instance concurrently.
+
+    @return: List of booleans in the order of sources. A datasource which is
+        None or whose check raises is reported viable so it still gets a full
+        update_metadata attempt.
+    """
+    def check(source):
+        if source is None:
+            return True
+        try:
+            return bool(source._is_platform_viable())
+        except Exception:
+            util.logexc(
+                LOG, "Checking platform viability of %s failed", source)
+            return True
+
+    if not sources:
+        return []
+    with futures.ThreadPoolExecutor(
+            max_workers=max_workers or len(sources)) as executor:
+        return list(executor.map(check, sources))
+
+
 def find_source(sys_cfg, distro, paths, ds_deps, cfg_list, pkg_list, reporter):
     ds_list = list_sources(cfg_list, ds_deps, pkg_list)
     ds_names = [type_utils.obj_name(f) for f in ds_list]
     mode = "network" if DEP_NETWORK in ds_deps else "local"
     LOG.debug("Searching for %s data source in: %s", mode, ds_names)
 
-    for name, cls in zip(ds_names, ds_list):
+    instances = [None] * len(ds_list)
+    viable = [True] * len(ds_list)
+    if util.get_cfg_option_bool(sys_cfg, 'datasource_parallel_probe', False):
+        # Check all platforms concurrently up front so that only viable
+        # datasources are crawled, still in datasource_list order.
+        with events.ReportEventStack(
+                name="check-platforms",
+                description="checking %s platform viability of %s" % (
+                    mode, ", ".join(ds_names)),
+                parent=reporter):
+            for idx, cls in enumerate(ds_list):
+                try:
+                    instances[idx] = cls(sys_cfg, distro, paths)
+                except Exception:
+                    util.logexc(LOG, "Initializing %s failed", cls)
+            viable = _check_platform_viability(instances)
+        LOG.debug("Viable %s data sources: %s", mode,
+                  [n for (n, v) in zip(ds_names, viable) if v])
+
+    for name, cls, s, is_viable in zip(ds_names, ds_list, instances, viable):
         myrep = events.ReportEventStack(
             name="search-%s" % name.replace("DataSource", ""),
             description="searching for %s data from %s" % (mode, name),
@@ -766,8 +1003,12 @@ def find_source(sys_cfg, distro, paths, ds_deps, cfg_list, pkg_list, reporter):
             parent=reporter)
         try:
             with myrep:
+                if not is_viable:
+                    myrep.message = "platform not viable for %s" % name
+                    continue
                 LOG.debug("Seeing if we can get any data from %s", cls)
-                s = cls(sys_cfg, distro, paths)
+                if s is None:
+                    s = cls(sys_cfg, distro, paths)
                 if s.update_metadata([EventType.BOOT_NEW_INSTANCE]):
                     myrep.message = "found %s data from %s" % (mode, name)
                     return (s, type_utils.obj_name(cls))
@@ -22,6 +22,12 @@ RTM_NEWLINK = 16
 RTM_DELLINK = 17
 RTM_GETLINK = 18
 RTM_SETLINK = 19
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
 MAX_SIZE = 65535
 RTA_DATA_OFFSET = 32
 MSG_TYPE_OFFSET = 16
@@ -29,15 +35,33 @@ SELECT_TIMEOUT = 60
 
 NLMSGHDR_FMT = "IHHII"
 IFINFOMSG_FMT = "BHiII"
+IFADDRMSG_FMT = "BBBBI"
+RTMSG_FMT = "BBBBBBBBI"
+RTA_CACHEINFO_FMT = "IIiIIIII"
 NLMSGHDR_SIZE = struct.calcsize(NLMSGHDR_FMT)
 IFINFOMSG_SIZE = struct.calcsize(IFINFOMSG_FMT)
 RTATTR_START_OFFSET = NLMSGHDR_SIZE + IFINFOMSG_SIZE
 RTA_DATA_START_OFFSET = 4
 PAD_ALIGNMENT = 4
 
+IFLA_ADDRESS = 1
 IFLA_IFNAME = 3
 IFLA_OPERSTATE = 16
 
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_BROADCAST = 4
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_CACHEINFO = 12
+RTA_TABLE = 15
+
+# Seconds to wait for each reply to a dump request
+DUMP_TIMEOUT = 5
+
 # https://www.kernel.org/doc/Documentation/networking/operstates.txt
 OPER_UNKNOWN = 0
 OPER_NOTPRESENT = 1
@@ -51,6 +75,11 @@ RTAAttr = namedtuple('RTAAttr', ['length', 'rta_type', 'data'])
 InterfaceOperstate = namedtuple('InterfaceOperstate', ['ifname', 'operstate'])
 NetlinkHeader = namedtuple('NetlinkHeader', ['length', 'type', 'flags', 'seq',
                                              'pid'])
+Link = namedtuple('Link', ['index', 'name', 'type', 'flags', 'address'])
+Address = namedtuple('Address', ['family', 'prefixlen', 'scope', 'index',
+                                 'address', 'local', 'broadcast'])
+Route = namedtuple('Route', ['family', 'dst_len', 'table', 'type', 'dst',
+                             'gateway', 'oif', 'priority', 'expires'])
 
 
 class NetlinkCreateSocketError(RuntimeError):
@@ -134,7 +163,7 @@ def unpack_rta_attr(data, offset):
     :raises: AssertionError if data is None or offset is not integer.
     '''
     assert (data is not None), ("data is none")
-    assert (type(offset) == int), ("offset is not integer")
+    assert isinstance(offset, int), ("offset is not integer")
     assert (offset >= RTATTR_START_OFFSET), (
         "rta offset is less than expected length")
     length = rta_type = 0
@@ -326,4 +355,144 @@ def read_netlink_messages(netlink_socket,
                 return
         data = data[offset:]
 
+
+def unpack_rta_attrs(data, offset):
+    '''Unpack all rta attributes in data from offset.
+
+    :return: dict of attribute data keyed by attribute type.
+    '''
+    attrs = {}
+    while offset + RTA_DATA_START_OFFSET <= len(data):
+        length, rta_type = struct.unpack_from("HH", data, offset=offset)
+        if length < RTA_DATA_START_OFFSET:
+            break
+        attrs[rta_type] = data[offset+RTA_DATA_START_OFFSET:offset+length]
+        offset += (length + PAD_ALIGNMENT - 1) & ~(PAD_ALIGNMENT - 1)
+    return attrs
+
+
+def dump_netlink_messages(msg_type, request_body):
+    '''Send a NETLINK_ROUTE dump request and return all replies.
+
+    :param: msg_type: RTM_GET* request type.
+    :param: request_body: packed family header of the request.
+    :returns: list of (message type, message body) tuples.
+    :raises: NetlinkCreateSocketError if the socket cannot be created and
+             OSError if the request fails.
+    '''
+    try:
+        netlink_socket = socket.socket(socket.AF_NETLINK,
+                                       socket.SOCK_RAW,
+                                       socket.NETLINK_ROUTE)
+        netlink_socket.bind((0, 0))
+    except (AttributeError, socket.error) as e:
+        msg = "Exception during netlink socket create: %s" % e
+        raise NetlinkCreateSocketError(msg) from e
+    messages = []
+    try:
+        netlink_socket.settimeout(DUMP_TIMEOUT)
+        seq = 1
+        netlink_socket.send(
+            struct.pack(NLMSGHDR_FMT, NLMSGHDR_SIZE + len(request_body),
+                        msg_type, NLM_F_REQUEST | NLM_F_DUMP, seq, 0) +
+            request_body)
+        while True:
+            data = netlink_socket.recv(MAX_SIZE)
+            offset = 0
+            while offset + NLMSGHDR_SIZE <= len(data):
+                length, nl_type, _flags, nl_seq, _pid = struct.unpack_from(
+                    NLMSGHDR_FMT, data, offset=offset)
+                if length < NLMSGHDR_SIZE:
+                    raise OSError("Invalid netlink message length %d" % length)
+                body = data[offset+NLMSGHDR_SIZE:offset+length]
+                offset += (length + PAD_ALIGNMENT - 1) & ~(PAD_ALIGNMENT - 1)
+                if nl_seq != seq:
+                    continue
+                if nl_type == NLMSG_DONE:
+                    return messages
+                if nl_type == NLMSG_ERROR:
+                    error = struct.unpack_from("i", body)[0]
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    continue
+                messages.append((nl_type, body))
+    finally:
+        netlink_socket.close()
+
+
+def _ntop(family, data):
+    return socket.inet_ntop(family, data) if data else None
+
+
+def read_links():
+    '''Return a Link for each network interface, in interface order.'''
+    links = []
+    body = struct.pack(IFINFOMSG_FMT, socket.AF_UNSPEC, 0, 0, 0, 0)
+    for (nl_type, data) in dump_netlink_messages(RTM_GETLINK, body):
+        if nl_type != RTM_NEWLINK:
+            continue
+        _family, if_type, index, flags, _change = struct.unpack_from(
+            IFINFOMSG_FMT, data)
+        attrs = unpack_rta_attrs(data, IFINFOMSG_SIZE)
+        address = None
+        if attrs.get(IFLA_ADDRESS):
+            address = ':'.join('%02x' % b for b in attrs[IFLA_ADDRESS])
+        name = util.decode_binary(attrs.get(IFLA_IFNAME, b'')).strip('\0')
+        links.append(Link(index, name, if_type, flags, address))
+    return links
+
+
+def read_addresses(family=socket.AF_UNSPEC):
+    '''Return an Address for each ip address of family.'''
+    addresses = []
+    body = struct.pack(IFADDRMSG_FMT, family, 0, 0, 0, 0)
+    header_size = struct.calcsize(IFADDRMSG_FMT)
+    for (nl_type, data) in dump_netlink_messages(RTM_GETADDR, body):
+        if nl_type != RTM_NEWADDR:
+            continue
+        ifa_family, prefixlen, _flags, scope, index = struct.unpack_from(
+            IFADDRMSG_FMT, data)
+        if ifa_family not in (socket.AF_INET, socket.AF_INET6):
+            continue
+        attrs = unpack_rta_attrs(data, header_size)
+        addresses.append(Address(
+            ifa_family, prefixlen, scope, index,
+            _ntop(ifa_family, attrs.get(IFA_ADDRESS)),
+            _ntop(ifa_family, attrs.get(IFA_LOCAL)),
+            _ntop(ifa_family, attrs.get(IFA_BROADCAST))))
+    return addresses
+
+
+def read_routes(family):
+    '''Return a Route for each route of family in all routing tables.'''
+    routes = []
+    body = struct.pack(RTMSG_FMT, family, 0, 0, 0, 0, 0, 0, 0, 0)
+    header_size = struct.calcsize(RTMSG_FMT)
+    for (nl_type, data) in dump_netlink_messages(RTM_GETROUTE, body):
+        if nl_type != RTM_NEWROUTE:
+            continue
+        (rtm_family, dst_len, _src_len, _tos, table, _protocol, _scope,
+         rtm_type, _flags) = struct.unpack_from(RTMSG_FMT, data)
+        if rtm_family != family:
+            continue
+        attrs = unpack_rta_attrs(data, header_size)
+        if RTA_TABLE in attrs:
+            table = struct.unpack("I", attrs[RTA_TABLE])[0]
+        oif = priority = None
+        if RTA_OIF in attrs:
+            oif = struct.unpack("I", attrs[RTA_OIF])[0]
+        if RTA_PRIORITY in attrs:
+            priority = struct.unpack("I", attrs[RTA_PRIORITY])[0]
+        expires = 0
+        if len(attrs.get(RTA_CACHEINFO, b'')) >= struct.calcsize(
+                RTA_CACHEINFO_FMT):
+            expires = struct.unpack_from(
+                RTA_CACHEINFO_FMT, attrs[RTA_CACHEINFO])[2]
+        routes.append(Route(
+            rtm_family, dst_len, table, rtm_type,
+            _ntop(rtm_family, attrs.get(RTA_DST)),
+            _ntop(rtm_family, attrs.get(RTA_GATEWAY)),
+            oif, priority, expires))
+    return routes
+
 # vi: ts=4 expandtab
@@ -11,6 +11,7 @@ import base64
 import copy
 import functools
 import os
+from concurrent import futures
 
 from cloudinit import ec2_utils
 from cloudinit import log as logging
@@ -163,9 +164,16 @@ class SourceMixin(object):
 
 
 class BaseReader(metaclass=abc.ABCMeta):
+    """Read OpenStack metadata from base_path.
 
-    def __init__(self, base_path):
+    With max_workers greater than 1, read_v2 reads independent files with
+    up to max_workers concurrent reads. Errors are reported exactly as if
+    the files had been read one after another.
+    """
+
+    def __init__(self, base_path, max_workers=None):
         self.base_path = base_path
+        self.max_workers = max_workers
 
     @abc.abstractmethod
     def _path_join(self, base, *add_ons):
@@ -206,6 +214,25 @@ class BaseReader(metaclass=abc.ABCMeta):
                   versions_available)
         return selected_version
 
+    def _call_all(self, calls):
+        """Return an iterator of (result, exception) for each of calls.
+
+        Outcomes are in the order of calls. Sequentially, each call is only
+        made once the previous outcome has been consumed, so a caller that
+        raises on a failure makes no further calls.
+        """
+        def call(func):
+            try:
+                return (func(), None)
+            except Exception as e:
+                return (None, e)
+
+        if not self.max_workers or self.max_workers <= 1 or len(calls) < 2:
+            return (call(func) for func in calls)
+        with futures.ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(calls))) as executor:
+            return iter(list(executor.map(call, calls)))
+
     def _read_content_path(self, item, decode=False):
         path = item.get('content_path', '').lstrip("/")
         path_pieces = path.split("/")
@@ -259,21 +286,25 @@ class BaseReader(metaclass=abc.ABCMeta):
             'version': 2,
         }
         data = datafiles(self._find_working_version())
-        for (name, (path, required, translator)) in data.items():
-            path = self._path_join(self.base_path, path)
-            data = None
+        paths = [(name, self._path_join(self.base_path, path), required,
+                  translator)
+                 for (name, (path, required, translator)) in data.items()]
+        outcomes = self._call_all(
+            [functools.partial(self._path_read, path)
+             for (_name, path, _required, _translator) in paths])
+        for (name, path, required, translator) in paths:
+            (data, error) = next(outcomes)
             found = False
-            try:
-                data = self._path_read(path)
-            except IOError as e:
-                if not required:
-                    LOG.debug("Failed reading optional path %s due"
-                              " to: %s", path, e)
-                else:
-                    LOG.debug("Failed reading mandatory path %s due"
-                              " to: %s", path, e)
-            else:
+            if error is None:
                 found = True
+            elif not isinstance(error, IOError):
+                raise error
+            elif not required:
+                LOG.debug("Failed reading optional path %s due"
+                          " to: %s", path, error)
+            else:
+                LOG.debug("Failed reading mandatory path %s due"
+                          " to: %s", path, error)
             if required and not found:
                 raise NonReadable("Missing mandatory path: %s" % path)
             if found and translator:
@@ -296,33 +327,44 @@ class BaseReader(metaclass=abc.ABCMeta):
                     "Badly formatted metadata random_seed entry: %s" % e
                 ) from e
 
+        # Files, the network config and ec2 metadata are all independent
+        # reads. Their outcomes are handled in the order they were read in
+        # before reads could be made concurrently.
+        file_items = [item for item in metadata.get('files', [])
+                      if 'path' in item]
+        calls = [functools.partial(self._read_content_path, item)
+                 for item in file_items]
+        # The 'network_config' item in metadata is a content pointer
+        # to the network config that should be applied. It is just a
+        # ubuntu/debian '/etc/network/interfaces' file.
+        net_item = metadata.get("network_config", None)
+        if net_item:
+            calls.append(functools.partial(
+                self._read_content_path, net_item, decode=True))
+        calls.append(self._read_ec2_metadata)
+        outcomes = self._call_all(calls)
+
         # load any files that were provided
         files = {}
-        metadata_files = metadata.get('files', [])
-        for item in metadata_files:
-            if 'path' not in item:
-                continue
+        for item in file_items:
             path = item['path']
-            try:
-                files[path] = self._read_content_path(item)
-            except Exception as e:
+            (content, error) = next(outcomes)
+            if error is not None:
                 raise BrokenMetadata(
-                    "Failed to read provided file %s: %s" % (path, e)
-                ) from e
+                    "Failed to read provided file %s: %s" % (path, error)
+                ) from error
+            files[path] = content
         results['files'] = files
 
-        # The 'network_config' item in metadata is a content pointer
-        # to the network config that should be applied. It is just a
-        # ubuntu/debian '/etc/network/interfaces' file.
-        net_item = metadata.get("network_config", None)
         if net_item:
-            try:
-                content = self._read_content_path(net_item, decode=True)
-                results['network_config'] = content
-            except IOError as e:
+            (content, error) = next(outcomes)
+            if isinstance(error, IOError):
                 raise BrokenMetadata(
-                    "Failed to read network configuration: %s" % (e)
-                ) from e
+                    "Failed to read network configuration: %s" % (error)
+                ) from error
+            elif error is not None:
+                raise error
+            results['network_config'] = content
 
         # To openstack, user can specify meta ('nova boot --meta=key=value')
         # and those will appear under metadata['meta'].
@@ -334,7 +376,10 @@ class BaseReader(metaclass=abc.ABCMeta):
             pass
 
         # Read any ec2-metadata (if applicable)
-        results['ec2-metadata'] = self._read_ec2_metadata()
+        (ec2_metadata, error) = next(outcomes)
+        if error is not None:
+            raise error
+        results['ec2-metadata'] = ec2_metadata
 
         # Perform some misc. metadata key renames...
         for (target_key, source_key, is_required) in KEY_COPIES:
@@ -346,8 +391,8 @@ class BaseReader(metaclass=abc.ABCMeta):
 
 
 class ConfigDriveReader(BaseReader):
-    def __init__(self, base_path):
-        super(ConfigDriveReader, self).__init__(base_path)
+    def __init__(self, base_path, max_workers=None):
+        super(ConfigDriveReader, self).__init__(base_path, max_workers)
         self._versions = None
 
     def _path_join(self, base, *add_ons):
@@ -453,8 +498,9 @@ class ConfigDriveReader(BaseReader):
 
 
 class MetadataReader(BaseReader):
-    def __init__(self, base_url, ssl_details=None, timeout=5, retries=5):
-        super(MetadataReader, self).__init__(base_url)
+    def __init__(self, base_url, ssl_details=None, timeout=5, retries=5,
+                 max_workers=None):
+        super(MetadataReader, self).__init__(base_url, max_workers)
         self.ssl_details = ssl_details
         self.timeout = float(timeout)
         self.retries = int(retries)
@@ -503,7 +549,8 @@ class MetadataReader(BaseReader):
     def _read_ec2_metadata(self):
         return ec2_utils.get_instance_metadata(ssl_details=self.ssl_details,
                                                timeout=self.timeout,
-                                               retries=self.retries)
+                                               retries=self.retries,
+                                               max_workers=self.max_workers)
 
 
 # Convert OpenStack ConfigDrive NetworkData json to network_config yaml
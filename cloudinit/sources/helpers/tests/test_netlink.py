@@ -10,9 +10,12 @@ from cloudinit.sources.helpers.netlink import (
     NetlinkCreateSocketError, create_bound_netlink_socket, read_netlink_socket,
     read_rta_oper_state, unpack_rta_attr, wait_for_media_disconnect_connect,
     wait_for_nic_attach_event, wait_for_nic_detach_event,
+    dump_netlink_messages, read_addresses, read_links, unpack_rta_attrs,
+    Address, Link,
     OPER_DOWN, OPER_UP, OPER_DORMANT, OPER_LOWERLAYERDOWN, OPER_NOTPRESENT,
     OPER_TESTING, OPER_UNKNOWN, RTATTR_START_OFFSET, RTM_NEWLINK, RTM_DELLINK,
-    RTM_SETLINK, RTM_GETLINK, MAX_SIZE)
+    RTM_SETLINK, RTM_GETLINK, RTM_GETADDR, RTM_NEWADDR, NLMSG_DONE,
+    NLMSG_ERROR, MAX_SIZE)
 
 
 def int_to_bytes(i):
@@ -478,3 +481,75 @@ class TestWaitForMediaDisconnectConnect(CiTestCase):
         m_read_netlink_socket.side_effect = [data1, data2]
         wait_for_media_disconnect_connect(m_socket, ifname)
         self.assertEqual(m_read_netlink_socket.call_count, 2)
+
+
+def rta(rta_type, data):
+    '''Return a packed and padded rta attribute'''
+    attr = struct.pack("HH", 4 + len(data), rta_type) + data
+    return attr + b'\0' * (-len(attr) % 4)
+
+
+def nlmsg(msg_type, body, seq=1):
+    '''Return a packed netlink message'''
+    return struct.pack("IHHII", 16 + len(body), msg_type, 2, seq, 0) + body
+
+
+LINK_MSG = nlmsg(
+    RTM_NEWLINK, struct.pack("BHiII", 0, 1, 2, 0x11043, 0) +
+    rta(1, b'\x52\x54\x00\x12\x34\x56') + rta(3, b'eth0\0'))
+ADDR_MSG = nlmsg(
+    RTM_NEWADDR, struct.pack("BBBBI", socket.AF_INET, 24, 0, 0, 2) +
+    rta(1, socket.inet_aton('10.0.0.5')) +
+    rta(2, socket.inet_aton('10.0.0.5')) +
+    rta(4, socket.inet_aton('10.0.0.255')))
+DONE_MSG = nlmsg(NLMSG_DONE, struct.pack("i", 0))
+
+
+@mock.patch('cloudinit.sources.helpers.netlink.socket.socket')
+class TestDumpNetlinkMessages(CiTestCase):
+
+    def test_unpack_rta_attrs(self, _m_socket):
+        '''unpack_rta_attrs returns padded attributes keyed by type'''
+        data = b'head' + rta(3, b'eth0\0') + rta(16, b'\x06')
+        self.assertEqual({3: b'eth0\0', 16: b'\x06'},
+                         unpack_rta_attrs(data, 4))
+
+    def test_socket_error_on_create(self, m_socket):
+        '''NetlinkCreateSocketError is raised when socket creation errors'''
+        m_socket.side_effect = socket.error("Fake socket failure")
+        with self.assertRaises(NetlinkCreateSocketError):
+            dump_netlink_messages(RTM_GETLINK, b'')
+
+    def test_messages_read_until_done(self, m_socket):
+        '''Replies spread over several reads are returned in order'''
+        m_sock = m_socket.return_value
+        m_sock.recv.side_effect = [
+            LINK_MSG + nlmsg(RTM_NEWLINK, b'other', seq=7), ADDR_MSG,
+            DONE_MSG]
+        messages = dump_netlink_messages(RTM_GETLINK, b'body')
+        self.assertEqual(
+            [RTM_NEWLINK, RTM_NEWADDR], [msg[0] for msg in messages])
+        request = m_sock.send.call_args[0][0]
+        self.assertEqual(
+            (20, RTM_GETLINK, 0x301, 1, 0),
+            struct.unpack_from("IHHII", request))
+        m_sock.close.assert_called_once_with()
+
+    def test_netlink_error_raises(self, m_socket):
+        '''A netlink error reply is raised as OSError'''
+        m_socket.return_value.recv.return_value = nlmsg(
+            NLMSG_ERROR, struct.pack("i", -1))
+        with self.assertRaises(OSError):
+            dump_netlink_messages(RTM_GETADDR, b'')
+        m_socket.return_value.close.assert_called_once_with()
+
+    def test_read_links_and_addresses(self, m_socket):
+        '''read_links and read_addresses decode their replies'''
+        m_socket.return_value.recv.side_effect = [
+            LINK_MSG, DONE_MSG, ADDR_MSG, DONE_MSG]
+        self.assertEqual(
+            [Link(2, 'eth0', 1, 0x11043, '52:54:00:12:34:56')], read_links())
+        self.assertEqual(
+            [Address(socket.AF_INET, 24, 0, 2, '10.0.0.5', '10.0.0.5',
+                     '10.0.0.255')],
+            read_addresses())
@@ -2,6 +2,7 @@
 
 import copy
 import inspect
+import json
 import os
 import stat
 
@@ -9,9 +10,11 @@ from cloudinit.event import EventType
 from cloudinit.helpers import Paths
 from cloudinit import importer
 from cloudinit.sources import (
-    EXPERIMENTAL_TEXT, INSTANCE_JSON_FILE, INSTANCE_JSON_SENSITIVE_FILE,
-    METADATA_UNKNOWN, REDACT_SENSITIVE_VALUE, UNSET, DataSource,
-    canonical_cloud_id, redact_sensitive_keys)
+    EXPERIMENTAL_TEXT, INSTANCE_JSON_FILE, INSTANCE_JSON_INDEX_SUFFIX,
+    INSTANCE_JSON_SENSITIVE_FILE, METADATA_UNKNOWN, REDACT_SENSITIVE_VALUE,
+    UNSET, DataSource, DataSourceNotFoundException, canonical_cloud_id,
+    find_source, load_instance_data_index, process_instance_data,
+    process_instance_metadata, redact_sensitive_keys, write_instance_data)
 from cloudinit.tests.helpers import CiTestCase, mock
 from cloudinit.user_data import UserDataProcessor
 from cloudinit import util
@@ -133,6 +136,16 @@ class TestDataSource(CiTestCase):
         (_max_wait, timeout, _retries) = datasource.get_url_params()
         self.assertEqual(0, timeout)
 
+    def test_datasource_get_crawl_max_workers(self):
+        """max_workers in ds_cfg overrides crawl_max_workers, at least 1."""
+        self.assertEqual(1, self.datasource.get_crawl_max_workers())
+        for (value, expected) in (('4', 4), (0, 1), ('many', 1), (None, 1)):
+            sys_cfg = {'datasource': {'_undef': {'max_workers': value}}}
+            datasource = DataSource(sys_cfg, self.distro, self.paths)
+            self.assertEqual(expected, datasource.get_crawl_max_workers())
+        self.assertIn("Config max_workers 'many' is not an int",
+                      self.logs.getvalue())
+
     def test_datasource_get_url_uses_defaults_on_errors(self):
         """On invalid system config values for url_params defaults are used."""
         # All invalid values should be logged
@@ -685,6 +698,143 @@ class TestRedactSensitiveData(CiTestCase):
             redact_sensitive_keys(md))
 
 
+def _two_pass_instance_data(instance_data, sensitive_keys):
+    """Process instance data the way persist_instance_data used to."""
+    processed = process_instance_metadata(
+        json.loads(util.json_dumps(instance_data)),
+        sensitive_keys=sensitive_keys)
+    return (processed, redact_sensitive_keys(processed))
+
+
+def _large_instance_data(size=1024 * 1024):
+    """Return instance data of about size bytes of json."""
+    def nic(idx):
+        return {
+            'device-number': str(idx),
+            'local-ipv4s': ['10.0.%d.%d' % divmod(idx % 65536, 256)],
+            'subnet-ipv4-cidr-block': '10.0.0.0/16', 'raw': b'\x00\x01',
+            'security-credentials': {'Token': 'tok%d' % idx}}
+    count = size // len(util.json_dumps({'02:00:00:00:00:00': nic(0)}))
+    nics = dict(
+        ('02:00:00:%02x:%02x:%02x' % (idx >> 16, idx >> 8 & 255, idx & 255),
+         nic(idx)) for idx in range(count))
+    return {'ds': {'meta_data': {'network': {'interfaces': {'macs': nics}}}},
+            'merged_cfg': {'_doc': 'merged', 'datasource_list': ['Ec2']}}
+
+
+class TestProcessInstanceData(CiTestCase):
+
+    sensitive_keys = ('merged_cfg', 'security-credentials')
+
+    def assert_matches_two_pass(self, instance_data):
+        expected = _two_pass_instance_data(
+            copy.deepcopy(instance_data), self.sensitive_keys)
+        untouched = copy.deepcopy(instance_data)
+        self.assertEqual(
+            expected,
+            process_instance_data(instance_data, self.sensitive_keys))
+        self.assertEqual(untouched, instance_data)
+
+    def test_matches_json_round_trip(self):
+        """Processing matches serializing, loading and then processing."""
+        self.assert_matches_two_pass({
+            'ds': {'meta_data': {
+                'binary': b'\x80\xff', 'pre-encoded': 'ci-b64:aGk=',
+                'list': [b'\x00', {'in-list': b'\x01'}, ('a', 1)],
+                'int-keys': {1: 'a', 10: 'b'}, 'none-key': {None: 'c'},
+                'float-keys': {2.5: 'd'}, 'bool-keys': {True: 'e'},
+                'unserializable': set([1]),
+                'nested': {'security-credentials': {'a': 'b'},
+                           'deeper': {'bin': b'\x02'}}}},
+            'merged_cfg': {'_doc': 'doc', 'password': 's3kr1t'},
+            'sys_info': {'dist': ('ubuntu', '20.04', 'focal')}})
+
+    def test_redacted_shares_unchanged_values(self):
+        """Only dicts containing sensitive keys are copied for redaction."""
+        (processed, redacted) = process_instance_data(
+            {'ds': {'public': {'a': 1}, 'security-credentials': 'x'},
+             'sys_info': {'b': 2}}, self.sensitive_keys)
+        self.assertIs(processed['sys_info'], redacted['sys_info'])
+        self.assertIs(processed['ds']['public'], redacted['ds']['public'])
+        self.assertEqual('x', processed['ds']['security-credentials'])
+        self.assertEqual(REDACT_SENSITIVE_VALUE,
+                         redacted['ds']['security-credentials'])
+
+    def test_unrepresentable_keys_raise_type_error(self):
+        """Keys json cannot write raise TypeError as json.dumps does."""
+        with self.assertRaises(TypeError):
+            process_instance_data({'ds': {b'key': 'value'}})
+
+    def test_large_metadata_matches_two_pass(self):
+        """Megabytes of metadata are processed like the two pass writer."""
+        self.assert_matches_two_pass(_large_instance_data())
+
+
+class TestWriteInstanceData(CiTestCase):
+
+    instance_data = {
+        'ds': {'meta_data': {'network': {'interfaces': {'macs': {
+            '02:00:00:00:00:01': {'device-number': '0'}}}},
+            'empty': {}, 'list': [1, {'a': 'b\n'}], 'v3': {'k': 'v'}}},
+        'v1': {'region': 'us-east-1', 'v2': {'deep': {'deeper': {}}}},
+        'none': None}
+
+    def assert_index_values(self, index, value, content):
+        """Assert each index entry locates value in content."""
+        if isinstance(index, dict):
+            self.assertEqual(sorted(value), sorted(index))
+            for key in index:
+                self.assert_index_values(index[key], value[key], content)
+        else:
+            (offset, length) = index
+            self.assertEqual(
+                value, json.loads(content[offset:offset + length]))
+
+    def test_writes_json_and_index_of_its_values(self):
+        """The json is that of write_json, the index locates its values."""
+        json_file = self.tmp_path(INSTANCE_JSON_FILE)
+        write_instance_data(json_file, self.instance_data)
+        content = util.load_file(json_file)
+        self.assertEqual(
+            json.dumps(self.instance_data, indent=1, sort_keys=True) + '\n',
+            content)
+        index = load_instance_data_index(json_file)
+        self.assert_index_values(index, self.instance_data, content)
+        # Values nested three deep are located as a whole, unless their
+        # keys are aliased as those of v1
+        self.assertIsInstance(index['ds']['meta_data']['network'], list)
+        self.assertEqual({'k'}, set(index['ds']['meta_data']['v3']))
+
+    def test_index_has_the_mode_of_the_json(self):
+        """Keys of root-only instance-data are not world readable."""
+        json_file = self.tmp_path(INSTANCE_JSON_SENSITIVE_FILE)
+        write_instance_data(json_file, self.instance_data, mode=0o600)
+        file_stat = os.stat(json_file + INSTANCE_JSON_INDEX_SUFFIX)
+        self.assertEqual(0o600, stat.S_IMODE(file_stat.st_mode))
+
+    def test_index_of_other_content_ignored(self):
+        """Missing, corrupt or stale indexes are not used."""
+        json_file = self.tmp_path(INSTANCE_JSON_FILE)
+        util.write_file(json_file, '{}')
+        self.assertIsNone(load_instance_data_index(json_file))
+        util.write_file(json_file + INSTANCE_JSON_INDEX_SUFFIX, '{"size": ')
+        self.assertIsNone(load_instance_data_index(json_file))
+        write_instance_data(json_file, self.instance_data)
+        util.write_file(json_file, '{"none": null}')
+        self.assertIsNone(load_instance_data_index(json_file))
+
+    def test_persist_instance_data_writes_indexes(self):
+        """Both instance-data files are written with an index."""
+        tmp = self.tmp_dir()
+        datasource = DataSourceTestSubclassNet(
+            {'datasource': {'_undef': {'key1': False}}}, mock.Mock(),
+            Paths({'run_dir': tmp}))
+        datasource.get_data()
+        for json_file in (INSTANCE_JSON_FILE, INSTANCE_JSON_SENSITIVE_FILE):
+            index = load_instance_data_index(self.tmp_path(json_file, tmp))
+            self.assertIn('region', index['v1'])
+
+
 class TestCanonicalCloudID(CiTestCase):
 
     def test_cloud_id_returns_platform_on_unknowns(self):
@@ -756,4 +906,94 @@ class TestCanonicalCloudID(CiTestCase):
                                region='!chinaeast',
                                platform='platform'))
 
+
+def _make_probe_datasource(name, viable, found, calls):
+    """Return a DataSource class recording viability and crawl calls."""
+
+    def _is_platform_viable(self):
+        calls.append(('viable', name))
+        if isinstance(viable, Exception):
+            raise viable
+        return viable
+
+    def _get_data(self):
+        calls.append(('get_data', name))
+        return found
+
+    return type('DataSource%s' % name, (DataSource,), {
+        'dsname': name, '_is_platform_viable': _is_platform_viable,
+        '_get_data': _get_data})
+
+
+class TestFindSource(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestFindSource, self).setUp()
+        self.calls = []
+        self.paths = Paths({'run_dir': self.tmp_dir()})
+
+    def _find_source(self, ds_list, parallel):
+        sys_cfg = {'datasource_parallel_probe': parallel}
+        with mock.patch('cloudinit.sources.list_sources') as m_list:
+            m_list.return_value = ds_list
+            return find_source(
+                sys_cfg, None, self.paths, [], [], [], reporter=None)
+
+    def test_default_crawls_sequentially_without_viability_checks(self):
+        """Without datasource_parallel_probe each datasource is crawled."""
+        ds_list = [
+            _make_probe_datasource('One', False, False, self.calls),
+            _make_probe_datasource('Two', True, True, self.calls)]
+        (ds, name) = self._find_source(ds_list, parallel=False)
+        self.assertEqual('DataSourceTwo', name)
+        self.assertIsInstance(ds, ds_list[1])
+        self.assertEqual(
+            [('get_data', 'One'), ('get_data', 'Two')], self.calls)
+
+    def test_parallel_probe_only_crawls_viable_datasources(self):
+        """Datasources whose platform is not viable are never crawled."""
+        ds_list = [
+            _make_probe_datasource('One', False, True, self.calls),
+            _make_probe_datasource('Two', True, False, self.calls),
+            _make_probe_datasource('Three', True, True, self.calls)]
+        (ds, name) = self._find_source(ds_list, parallel=True)
+        self.assertEqual('DataSourceThree', name)
+        self.assertEqual(
+            [('viable', 'One'), ('viable', 'Three'), ('viable', 'Two')],
+            sorted(c for c in self.calls if c[0] == 'viable'))
+        self.assertEqual(
+            [('get_data', 'Two'), ('get_data', 'Three')],
+            [c for c in self.calls if c[0] == 'get_data'])
+        self.assertIn(
+            "Viable local data sources: ['DataSourceTwo', 'DataSourceThree']",
+            self.logs.getvalue())
+
+    def test_parallel_probe_keeps_datasource_list_priority(self):
+        """The first viable datasource in list order which finds data wins."""
+        ds_list = [
+            _make_probe_datasource('One', True, True, self.calls),
+            _make_probe_datasource('Two', True, True, self.calls)]
+        (_ds, name) = self._find_source(ds_list, parallel=True)
+        self.assertEqual('DataSourceOne', name)
+        self.assertNotIn(('get_data', 'Two'), self.calls)
+
+    def test_parallel_probe_treats_check_errors_as_viable(self):
+        """A failing viability check still gets a full crawl."""
+        ds_list = [
+            _make_probe_datasource('One', RuntimeError('boom'), True,
+                                   self.calls)]
+        (_ds, name) = self._find_source(ds_list, parallel=True)
+        self.assertEqual('DataSourceOne', name)
+        self.assertIn(
+            'Checking platform viability of', self.logs.getvalue())
+
+    def test_parallel_probe_raises_when_nothing_viable(self):
+        """DataSourceNotFoundException is raised as in sequential mode."""
+        ds_list = [_make_probe_datasource('One', False, True, self.calls)]
+        with self.assertRaises(DataSourceNotFoundException):
+            self._find_source(ds_list, parallel=True)
+        self.assertEqual([('viable', 'One')], self.calls)
+
 # vi: ts=4 expandtab
@@ -8,6 +8,7 @@ import copy
 import os
 import pickle
 import sys
+from concurrent import futures
 
 from cloudinit.settings import (
     FREQUENCIES, CLOUD_CONFIG, PER_INSTANCE, RUN_CLOUD_CONFIG)
@@ -26,6 +27,7 @@ from cloudinit.sources import NetworkConfigSource
 
 from cloudinit import cloud
 from cloudinit import config
+from cloudinit import config_cache
 from cloudinit import distros
 from cloudinit import helpers
 from cloudinit import importer
@@ -42,6 +44,9 @@ LOG = logging.getLogger(__name__)
 NULL_DATA_SOURCE = None
 NO_PREVIOUS_INSTANCE_ID = "NO_PREVIOUS_INSTANCE_ID"
 
+# Version of the json header written next to the pickled datasource
+OBJ_PKL_HEADER_VERSION = 1
+
 
 class Init(object):
     def __init__(self, ds_deps=None, reporter=None):
@@ -98,7 +103,7 @@ class Init(object):
         # Ensure actually read
         self.read_cfg()
         # Nobody gets the real config
-        ocfg = copy.deepcopy(self._cfg)
+        ocfg = util.copy_cfg(self._cfg)
         if restriction == 'restricted':
             ocfg.pop('system_info', None)
         elif restriction == 'system':
@@ -187,6 +192,10 @@ class Init(object):
         # the file wont exist.
         return _pkl_load(self.paths.get_ipath_cur('obj_pkl'))
 
+    def _restore_cache_header(self):
+        return _pkl_header_load(self.paths.get_ipath_cur('obj_pkl_header'),
+                                self.paths.get_ipath_cur('obj_pkl'))
+
     def _write_to_cache(self):
         if self.datasource is NULL_DATA_SOURCE:
             return False
@@ -196,7 +205,12 @@ class Init(object):
             util.write_file(
                 self.paths.get_ipath_cur("manual_clean_marker"),
                 omode="w", content="")
-        return _pkl_store(self.datasource, self.paths.get_ipath_cur("obj_pkl"))
+        pkl_fn = self.paths.get_ipath_cur("obj_pkl")
+        if not _pkl_store(self.datasource, pkl_fn):
+            return False
+        return _pkl_header_store(
+            self.datasource, self.paths.get_ipath_cur("obj_pkl_header"),
+            pkl_fn)
 
     def _get_datasources(self):
         # Any config provided???
@@ -212,16 +226,25 @@ class Init(object):
         if existing not in ("check", "trust"):
             raise ValueError("Unexpected value for existing: %s" % existing)
 
-        ds = self._restore_from_cache()
-        if not ds:
-            return (None, "no cache found")
-
         run_iid_fn = self.paths.get_runpath('instance_id')
         if os.path.exists(run_iid_fn):
             run_iid = util.load_file(run_iid_fn).strip()
         else:
             run_iid = None
 
+        # The header lets us reject a cache for another instance without
+        # unpickling it when the datasource has no check_instance_id.
+        header = self._restore_cache_header()
+        if (header and existing == "check" and
+                run_iid != header['instance_id'] and
+                not header['check_instance_id']):
+            return (None, "cache invalid in datasource: %s (%s)" % (
+                header['datasource'], header['instance_id']))
+
+        ds = self._restore_from_cache()
+        if not ds:
+            return (None, "no cache found")
+
         if run_iid == ds.get_instance_id():
             return (ds, "restored from cache with run check: %s" % ds)
         elif existing == "trust":
@@ -731,6 +754,11 @@ class Modules(object):
 
     @property
     def cfg(self):
+        # Only give out a copy so that others can't modify this...
+        return util.copy_cfg(self._read_cfg())
+
+    def _read_cfg(self):
+        """Return the merged config itself, which must not be modified."""
         # None check to avoid empty case causing re-reading
         if self._cached_cfg is None:
             merger = helpers.ConfigMerger(paths=self.init.paths,
@@ -739,14 +767,14 @@ class Modules(object):
                                           base_cfg=self.init.cfg)
             self._cached_cfg = merger.cfg
             # LOG.debug("Loading 'module' config %s", self._cached_cfg)
-        # Only give out a copy so that others can't modify this...
-        return copy.deepcopy(self._cached_cfg)
+        return self._cached_cfg
 
     def _read_modules(self, name):
         module_list = []
-        if name not in self.cfg:
+        cfg = self._read_cfg()
+        if name not in cfg:
             return module_list
-        cfg_mods = self.cfg.get(name)
+        cfg_mods = cfg.get(name)
         if not cfg_mods:
             return module_list
         # Create 'module_list', an array of hashes
@@ -768,7 +796,7 @@ class Modules(object):
                 if len(item) >= 2:
                     contents['freq'] = item[1].strip()
                 if len(item) >= 3:
-                    contents['args'] = item[2:]
+                    contents['args'] = util.copy_cfg(item[2:])
                 if contents:
                     module_list.append(contents)
             elif isinstance(item, (dict)):
@@ -780,7 +808,7 @@ class Modules(object):
                 if 'frequency' in item:
                     contents['freq'] = item['frequency'].strip()
                 if 'args' in item:
-                    contents['args'] = item['args'] or []
+                    contents['args'] = util.copy_cfg(item['args'] or [])
                 if contents and valid:
                     module_list.append(contents)
             else:
@@ -813,48 +841,141 @@ class Modules(object):
             mostly_mods.append([mod, raw_name, freq, run_args])
         return mostly_mods
 
+    def _module_max_workers(self):
+        return util.get_cfg_option_max_workers(
+            self._read_cfg(), 'module_max_workers')
+
+    def _run_module(self, cc, mod, name, freq, args, mod_cfg):
+        # Try the modules frequency, otherwise fallback to a known one
+        if not freq:
+            freq = mod.frequency
+        if freq not in FREQUENCIES:
+            freq = PER_INSTANCE
+        LOG.debug("Running module %s (%s) with frequency %s",
+                  name, mod, freq)
+
+        # Use the configs logger and not our own
+        # TODO(harlowja): possibly check the module
+        # for having a LOG attr and just give it back
+        # its own logger?
+        func_args = [name, mod_cfg,
+                     cc, config.LOG, args]
+        # This name will affect the semaphore name created
+        run_name = "config-%s" % (name)
+
+        desc = "running %s with frequency %s" % (run_name, freq)
+        myrep = events.ReportEventStack(
+            name=run_name, description=desc, parent=self.reporter)
+
+        with myrep:
+            ran, _r = cc.run(run_name, mod.handle, func_args,
+                             freq=freq)
+            if ran:
+                myrep.message = "%s ran successfully" % run_name
+            else:
+                myrep.message = "%s previously ran" % run_name
+
     def _run_modules(self, mostly_mods):
+        max_workers = self._module_max_workers()
+        if max_workers > 1 and len(mostly_mods) > 1:
+            return self._run_modules_concurrently(mostly_mods, max_workers)
         cc = self.init.cloudify()
         # Return which ones ran
         # and which ones failed + the exception of why it failed
         failures = []
         which_ran = []
+        # Modules share one copy of the config until a module modifies it,
+        # so only modules which change their config cost another copy.
+        mod_cfg = None
         for (mod, name, freq, args) in mostly_mods:
             try:
-                # Try the modules frequency, otherwise fallback to a known one
-                if not freq:
-                    freq = mod.frequency
-                if freq not in FREQUENCIES:
-                    freq = PER_INSTANCE
-                LOG.debug("Running module %s (%s) with frequency %s",
-                          name, mod, freq)
-
-                # Use the configs logger and not our own
-                # TODO(harlowja): possibly check the module
-                # for having a LOG attr and just give it back
-                # its own logger?
-                func_args = [name, self.cfg,
-                             cc, config.LOG, args]
+                if mod_cfg is None:
+                    mod_cfg = self.cfg
                 # Mark it as having started running
                 which_ran.append(name)
-                # This name will affect the semaphore name created
-                run_name = "config-%s" % (name)
-
-                desc = "running %s with frequency %s" % (run_name, freq)
-                myrep = events.ReportEventStack(
-                    name=run_name, description=desc, parent=self.reporter)
+                self._run_module(cc, mod, name, freq, args, mod_cfg)
+            except Exception as e:
+                util.logexc(LOG, "Running module %s (%s) failed", name, mod)
+                failures.append((name, e))
+            if mod_cfg is not None and mod_cfg != self._cached_cfg:
+                LOG.debug("Module %s modified its config, using a fresh copy"
+                          " for the next module", name)
+                mod_cfg = None
+        return (which_ran, failures)
 
-                with myrep:
-                    ran, _r = cc.run(run_name, mod.handle, func_args,
-                                     freq=freq)
-                    if ran:
-                        myrep.message = "%s ran successfully" % run_name
-                    else:
-                        myrep.message = "%s previously ran" % run_name
+    @staticmethod
+    def _module_dependencies(mostly_mods):
+        """Return the indexes of the earlier modules each module waits for.
 
+        A module waits for every earlier module sharing one of its declared
+        resources. Modules declaring no resources wait for, and are waited
+        for by, all other modules, so their relative order is kept.
+        """
+        deps = []
+        for (idx, (mod, _name, _freq, _args)) in enumerate(mostly_mods):
+            resources = getattr(mod, 'resources', None)
+            mod_deps = set()
+            for (prev_idx, prev) in enumerate(mostly_mods[:idx]):
+                prev_resources = getattr(prev[0], 'resources', None)
+                if (resources is None or prev_resources is None or
+                        set(resources) & set(prev_resources)):
+                    mod_deps.add(prev_idx)
+            deps.append(mod_deps)
+        return deps
+
+    def _run_modules_concurrently(self, mostly_mods, max_workers):
+        """Run modules in a pool of threads as their dependencies allow.
+
+        The result is the same as _run_modules: modules are reported as ran
+        and failed in list order whatever order they completed in. Each
+        module gets its own copy of the config.
+        """
+        cc = self.init.cloudify()
+        deps = self._module_dependencies(mostly_mods)
+        started = [False] * len(mostly_mods)
+        errors = [None] * len(mostly_mods)
+        pending = list(range(len(mostly_mods)))
+        done = set()
+        running = {}
+
+        def run(idx, mod_cfg):
+            (mod, name, freq, args) = mostly_mods[idx]
+            try:
+                self._run_module(cc, mod, name, freq, args, mod_cfg)
             except Exception as e:
                 util.logexc(LOG, "Running module %s (%s) failed", name, mod)
-                failures.append((name, e))
+                return e
+            return None
+
+        LOG.debug("Running %d modules with up to %d workers",
+                  len(mostly_mods), max_workers)
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                for idx in [i for i in pending if deps[i] <= done]:
+                    pending.remove(idx)
+                    try:
+                        mod_cfg = self.cfg
+                    except Exception as e:
+                        util.logexc(LOG, "Running module %s (%s) failed",
+                                    mostly_mods[idx][1], mostly_mods[idx][0])
+                        errors[idx] = e
+                        done.add(idx)
+                        continue
+                    started[idx] = True
+                    running[executor.submit(run, idx, mod_cfg)] = idx
+                if not running:
+                    continue
+                finished, _ = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED)
+                for future in finished:
+                    idx = running.pop(future)
+                    errors[idx] = future.result()
+                    done.add(idx)
+        which_ran = [mod[1] for (mod, ran) in zip(mostly_mods, started)
+                     if ran]
+        failures = [(mod[1], error)
+                    for (mod, error) in zip(mostly_mods, errors)
+                    if error is not None]
         return (which_ran, failures)
 
     def run_single(self, mod_name, args=None, freq=None):
@@ -876,7 +997,7 @@ class Modules(object):
 
         skipped = []
         forced = []
-        overridden = self.cfg.get('unverified_modules', [])
+        overridden = self._read_cfg().get('unverified_modules', [])
         active_mods = []
         all_distros = set([distros.ALL_DISTROS])
         for (mod, name, _freq, _args) in mostly_mods:
@@ -912,18 +1033,28 @@ def read_runtime_config():
     return util.read_conf(RUN_CLOUD_CONFIG)
 
 
-def fetch_base_config():
-    return util.mergemanydict(
+def _read_base_config(cmdline):
+    """Return the base config and the paths of the files it was read from."""
+    sources = [RUN_CLOUD_CONFIG]
+    cfg = util.mergemanydict(
         [
             # builtin config
             util.get_builtin_cfg(),
             # Anything in your conf.d or 'default' cloud.cfg location.
-            util.read_conf_with_confd(CLOUD_CONFIG),
+            util.read_conf_with_confd(CLOUD_CONFIG, sources),
             # runtime config
             read_runtime_config(),
             # Kernel/cmdline parameters override system config
-            util.read_conf_from_cmdline(),
+            util.read_conf_from_cmdline(cmdline),
         ], reverse=True)
+    return (cfg, sources)
+
+
+def fetch_base_config():
+    cmdline = util.get_cmdline()
+    return config_cache.config_cache.get(
+        ('base_config', CLOUD_CONFIG, cmdline),
+        lambda: _read_base_config(cmdline))
 
 
 def _pkl_store(obj, fname):
@@ -940,6 +1071,61 @@ def _pkl_store(obj, fname):
     return True
 
 
+def _pkl_header_store(ds, fname, pkl_fname):
+    """Write a small json header describing the pickle at pkl_fname.
+
+    The header records the instance-id of the pickled datasource and the
+    size and mtime of the pickle, so a header left behind by a cloud-init
+    which did not write one is detected as stale.
+    """
+    try:
+        pkl_stat = os.stat(pkl_fname)
+        header = {
+            'version': OBJ_PKL_HEADER_VERSION,
+            'instance_id': ds.get_instance_id(),
+            'datasource': type_utils.obj_name(ds),
+            'check_instance_id': (
+                type(ds).check_instance_id is not
+                sources.DataSource.check_instance_id),
+            'pickle': {'size': pkl_stat.st_size,
+                       'mtime_ns': pkl_stat.st_mtime_ns},
+        }
+        util.write_file(fname, util.json_dumps(header), mode=0o400)
+    except Exception:
+        util.logexc(LOG, "Failed writing datasource cache header to %s",
+                    fname)
+        util.del_file(fname)
+        return False
+    return True
+
+
+def _pkl_header_load(fname, pkl_fname):
+    """Return the header for the pickle at pkl_fname.
+
+    @return: dict of header content, or None when the header is absent,
+        unreadable, of an unknown version or does not describe the current
+        pickle.
+    """
+    try:
+        header = util.load_json(util.load_file(fname))
+        pkl_stat = os.stat(pkl_fname)
+    except Exception as e:
+        if os.path.isfile(fname):
+            LOG.warning("failed loading cache header in %s: %s", fname, e)
+        return None
+    if not isinstance(header, dict):
+        return None
+    if header.get('version') != OBJ_PKL_HEADER_VERSION:
+        LOG.debug("Ignoring cache header %s with version %s", fname,
+                  header.get('version'))
+        return None
+    expected = {'size': pkl_stat.st_size, 'mtime_ns': pkl_stat.st_mtime_ns}
+    if header.get('pickle') != expected:
+        LOG.debug("Ignoring stale cache header %s", fname)
+        return None
+    return header
+
+
 def _pkl_load(fname):
     pickle_contents = None
     try:
@@ -11,6 +11,9 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import collections
+import functools
+import hashlib
+import importlib.util
 import re
 
 
@@ -20,18 +23,13 @@ try:
 except (ImportError, AttributeError):
     CHEETAH_AVAILABLE = False
 
-try:
-    from jinja2 import Template as JTemplate
-    from jinja2 import DebugUndefined as JUndefined
-    JINJA_AVAILABLE = True
-except (ImportError, AttributeError):
-    JINJA_AVAILABLE = False
-    JUndefined = object
-
 from cloudinit import log as logging
 from cloudinit import type_utils as tu
 from cloudinit import util
 
+# jinja2 is imported on first use, it is one of the slowest imports of a
+# cloud-init stage and most stages render no jinja templates.
+JINJA_AVAILABLE = importlib.util.find_spec('jinja2') is not None
 
 LOG = logging.getLogger(__name__)
 TYPE_MATCHER = re.compile(r"##\s*template:(.*)", re.I)
@@ -39,18 +37,82 @@ BASIC_MATCHER = re.compile(r'\$\{([A-Za-z0-9_.]+)\}|\$([A-Za-z0-9_.]+)')
 MISSING_JINJA_PREFIX = u'CI_MISSING_JINJA_VAR/'
 
 
-class UndefinedJinjaVariable(JUndefined):
-    """Class used to represent any undefined jinja template variable."""
+# Number of compiled jinja templates kept per process
+JINJA_CACHE_SIZE = 32
+# Directory sharing compiled jinja templates across processes, if any
+_JINJA_BYTECODE_DIR = None
+
+
+@functools.lru_cache(maxsize=None)
+def _get_jinja():
+    """Import jinja2 and return the environment templates are compiled in."""
+    from jinja2 import DebugUndefined as JUndefined
+    from jinja2 import Environment
+
+    class UndefinedJinjaVariable(JUndefined):
+        """Class used to represent any undefined jinja template variable."""
+
+        def __str__(self):
+            return u'%s%s' % (MISSING_JINJA_PREFIX, self._undefined_name)
+
+        def __sub__(self, other):
+            other = str(other).replace(MISSING_JINJA_PREFIX, '')
+            raise TypeError(
+                'Undefined jinja variable: "{this}-{other}". Jinja tried'
+                ' subtraction. Perhaps you meant "{this}_{other}"?'.format(
+                    this=self._undefined_name, other=other))
 
-    def __str__(self):
-        return u'%s%s' % (MISSING_JINJA_PREFIX, self._undefined_name)
+    return Environment(undefined=UndefinedJinjaVariable, trim_blocks=True)
 
-    def __sub__(self, other):
-        other = str(other).replace(MISSING_JINJA_PREFIX, '')
-        raise TypeError(
-            'Undefined jinja variable: "{this}-{other}". Jinja tried'
-            ' subtraction. Perhaps you meant "{this}_{other}"?'.format(
-                this=self._undefined_name, other=other))
+
+@functools.lru_cache(maxsize=None)
+def _get_jinja_bytecode_cache(directory):
+    """Return the jinja bytecode cache in directory or None if unusable."""
+    from jinja2 import FileSystemBytecodeCache
+    try:
+        # Cached bytecode is executed, only its owner may write it
+        util.ensure_dir(directory, mode=0o700)
+    except OSError as e:
+        LOG.debug('Not caching jinja bytecode in %s: %s', directory, e)
+        return None
+    return FileSystemBytecodeCache(directory)
+
+
+def set_jinja_bytecode_cache(directory):
+    """Share compiled jinja templates with later processes through directory.
+
+    @param directory: Path of a directory only root can write or None to
+        compile templates once per process only.
+    """
+    global _JINJA_BYTECODE_DIR
+    _JINJA_BYTECODE_DIR = directory
+
+
+@functools.lru_cache(maxsize=JINJA_CACHE_SIZE)
+def _compile_jinja(content):
+    """Return the compiled jinja template of content.
+
+    Templates are compiled once per process and, when a bytecode cache is
+    set, once for all processes rendering the same content.
+    """
+    env = _get_jinja()
+    bcc = None
+    if _JINJA_BYTECODE_DIR:
+        bcc = _get_jinja_bytecode_cache(_JINJA_BYTECODE_DIR)
+    if bcc is None:
+        return env.from_string(content)
+    # Buckets are stored per name, name each by its content so templates
+    # do not evict one another.
+    name = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    bucket = bcc.get_bucket(env, name, None, content)
+    if bucket.code is None:
+        bucket.code = env.compile(content)
+        try:
+            bcc.set_bucket(bucket)
+        except OSError as e:
+            LOG.debug('Failed to cache jinja bytecode: %s', e)
+    return env.template_class.from_code(
+        env, bucket.code, env.make_globals(None))
 
 
 def basic_render(content, params):
@@ -99,9 +161,7 @@ def detect_template(text):
     def jinja_render(content, params):
         # keep_trailing_newline is in jinja2 2.7+, not 2.6
         add = "\n" if content.endswith("\n") else ""
-        return JTemplate(content,
-                         undefined=UndefinedJinjaVariable,
-                         trim_blocks=True).render(**params) + add
+        return _compile_jinja(content).render(**params) + add
 
     if text.find("\n") != -1:
         ident, rest = text.split("\n", 1)
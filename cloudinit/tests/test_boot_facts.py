@@ -0,0 +1,106 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.boot_facts"""
+
+import json
+
+from cloudinit import boot_facts
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit.util import load_file, write_file
+
+M_PATH = 'cloudinit.boot_facts.'
+
+
+class TestBootFacts(CiTestCase):
+
+    def setUp(self):
+        super(TestBootFacts, self).setUp()
+        tmp = self.tmp_dir()
+        self.boot_id_file = self.tmp_path('boot_id', tmp)
+        write_file(self.boot_id_file, 'boot-1\n')
+        self.facts_file = self.tmp_path('boot-facts.json', tmp)
+        patcher = mock.patch(M_PATH + 'BOOT_ID_FILE', self.boot_id_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(boot_facts.boot_facts.clear)
+        self.calls = []
+
+        @boot_facts.boot_fact('probe', decode=tuple)
+        def probe(*args, **kwargs):
+            self.calls.append((args, kwargs))
+            return ('value',) + args
+        self.probe = probe
+
+    def _new_stage(self):
+        """Forget in-memory facts as a new cloud-init process would."""
+        boot_facts.boot_facts.clear()
+        return boot_facts.boot_facts.load(self.facts_file)
+
+    def test_disabled_cache_calls_through(self):
+        """Without load() every call runs the probe."""
+        self.probe()
+        self.probe()
+        self.assertEqual(2, len(self.calls))
+
+    def test_facts_shared_with_later_stages(self):
+        """A later stage reads the fact instead of running the probe."""
+        self.assertTrue(self._new_stage())
+        self.assertEqual(('value',), self.probe())
+        self.assertTrue(self._new_stage())
+        self.assertEqual(('value',), self.probe())
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(
+            {'boot_id': 'boot-1', 'facts': {'probe': ['value']}},
+            json.loads(load_file(self.facts_file)))
+
+    def test_positional_arguments_are_part_of_the_key(self):
+        """Each positional argument value is its own fact."""
+        self._new_stage()
+        self.assertEqual(('value', 'a'), self.probe('a'))
+        self.assertEqual(('value', 'b'), self.probe('b'))
+        self._new_stage()
+        self.assertEqual(('value', 'a'), self.probe('a'))
+        self.assertEqual([(('a',), {}), (('b',), {})], self.calls)
+
+    def test_keyword_arguments_are_not_cached(self):
+        """Calls with keyword arguments, such as target, always run."""
+        self._new_stage()
+        self.probe(target='/target')
+        self.probe(target='/target')
+        self.assertEqual(2, len(self.calls))
+
+    def test_facts_from_another_boot_discarded(self):
+        """A boot id change invalidates all facts."""
+        self._new_stage()
+        self.probe()
+        write_file(self.boot_id_file, 'boot-2\n')
+        self._new_stage()
+        self.probe()
+        self.assertEqual(2, len(self.calls))
+        self.assertEqual(
+            'boot-2', json.loads(load_file(self.facts_file))['boot_id'])
+
+    def test_invalid_facts_file_ignored(self):
+        """A corrupt cache file is treated as empty."""
+        write_file(self.facts_file, '{"boot_id": ')
+        self.assertTrue(self._new_stage())
+        self.probe()
+        self.assertEqual(1, len(self.calls))
+
+    def test_no_boot_id_disables_cache(self):
+        """Facts cannot be tied to a boot without a boot id."""
+        with mock.patch(M_PATH + 'BOOT_ID_FILE', self.tmp_path('missing')):
+            self.assertFalse(self._new_stage())
+        self.assertFalse(boot_facts.boot_facts.enabled)
+        self.probe()
+        self.probe()
+        self.assertEqual(2, len(self.calls))
+
+    def test_unwritable_cache_keeps_facts_in_memory(self):
+        """Write failures are not fatal."""
+        boot_facts.boot_facts.load(self.tmp_path('missing-dir/facts.json'))
+        self.probe()
+        self.probe()
+        self.assertEqual(1, len(self.calls))
+
+# vi: ts=4 expandtab
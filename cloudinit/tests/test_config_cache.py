@@ -0,0 +1,158 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.config_cache"""
+
+import os
+import pickle
+import time
+
+from cloudinit import config_cache
+from cloudinit import stages
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit.util import write_file
+
+M_PATH = 'cloudinit.config_cache.'
+
+
+def _write_old(path, content, age=60):
+    """Write path with a modification time age seconds in the past."""
+    write_file(path, content)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+class TestConfigCache(CiTestCase):
+
+    def setUp(self):
+        super(TestConfigCache, self).setUp()
+        self.cache_file = self.tmp_path('config-cache.pkl')
+        self.cfg_file = self.tmp_path('my.cfg')
+        _write_old(self.cfg_file, 'key: value\n')
+        self.reads = []
+
+    def _read(self):
+        self.reads.append(self.cfg_file)
+        return (config_cache.util.read_conf(self.cfg_file), [self.cfg_file])
+
+    def _new_stage(self):
+        """Return a cache loaded as a new cloud-init process would."""
+        cache = config_cache.ConfigCache()
+        cache.load(self.cache_file)
+        return cache
+
+    def test_disabled_cache_reads_through(self):
+        """Without load() every call reads the config."""
+        cache = config_cache.ConfigCache()
+        cache.get('key', self._read)
+        cache.get('key', self._read)
+        self.assertEqual(2, len(self.reads))
+
+    def test_config_shared_with_later_stages(self):
+        """A later stage uses the config parsed by an earlier one."""
+        self.assertEqual(
+            {'key': 'value'}, self._new_stage().get('key', self._read))
+        cache = self._new_stage()
+        config = cache.get('key', self._read)
+        self.assertEqual({'key': 'value'}, config)
+        self.assertEqual(1, len(self.reads))
+        # Callers get copies they may change
+        config['key'] = 'changed'
+        self.assertEqual({'key': 'value'}, cache.get('key', self._read))
+        self.assertEqual(
+            0o600, os.stat(self.cache_file).st_mode & 0o777)
+
+    def test_edited_file_read_again(self):
+        """Edits between stages are seen, even keeping size and mtime age."""
+        self._new_stage().get('key', self._read)
+        _write_old(self.cfg_file, 'key: other\n', age=30)
+        self.assertEqual(
+            {'key': 'other'}, self._new_stage().get('key', self._read))
+        os.unlink(self.cfg_file)
+        self.assertEqual({}, self._new_stage().get('key', self._read))
+        self.assertEqual(3, len(self.reads))
+
+    def test_files_being_changed_not_cached(self):
+        """Config from recently modified files is read again next time."""
+        write_file(self.cfg_file, 'key: new\n')
+        self._new_stage().get('key', self._read)
+        self.assertEqual(
+            {'key': 'new'}, self._new_stage().get('key', self._read))
+        self.assertEqual(2, len(self.reads))
+
+    def test_untrusted_or_invalid_cache_ignored(self):
+        """Cache files others could write, corrupt or old ones are unused."""
+        self._new_stage().get('key', self._read)
+        os.chmod(self.cache_file, 0o644)
+        self.assertEqual({}, self._new_stage().entries)
+        write_file(self.cache_file, b'not a pickle', mode=0o600)
+        self.assertEqual({}, self._new_stage().entries)
+        write_file(self.cache_file,
+                   pickle.dumps({'version': '0', 'entries': {'a': {}}}),
+                   mode=0o600)
+        self.assertEqual({}, self._new_stage().entries)
+
+    def test_unwritable_cache_keeps_config_in_memory(self):
+        """Write failures are not fatal."""
+        cache = config_cache.ConfigCache()
+        cache.load(self.tmp_path('missing-dir/config-cache.pkl'))
+        cache.get('key', self._read)
+        cache.get('key', self._read)
+        self.assertEqual(1, len(self.reads))
+
+
+class TestFetchBaseConfigCache(CiTestCase):
+    """fetch_base_config sees config edits made between stages."""
+
+    def setUp(self):
+        super(TestFetchBaseConfigCache, self).setUp()
+        tmp = self.tmp_dir()
+        self.cloud_cfg = os.path.join(tmp, 'cloud.cfg')
+        self.cloud_cfg_d = self.cloud_cfg + '.d'
+        self.run_cfg = os.path.join(tmp, 'run', 'cloud.cfg')
+        _write_old(self.cloud_cfg, 'a: 1\nb: 1\n')
+        _write_old(os.path.join(self.cloud_cfg_d, '10-b.cfg'), 'b: 2\n')
+        os.utime(self.cloud_cfg_d, (time.time() - 60, time.time() - 60))
+        self.cmdline = ''
+        for (target, value) in (
+                ('cloudinit.stages.CLOUD_CONFIG', self.cloud_cfg),
+                ('cloudinit.stages.RUN_CLOUD_CONFIG', self.run_cfg),
+                ('cloudinit.stages.util.get_cmdline', lambda: self.cmdline),
+                ('cloudinit.stages.util.get_builtin_cfg', dict),
+                (M_PATH + 'config_cache', config_cache.ConfigCache())):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cache_file = self.tmp_path('config-cache.pkl', tmp)
+
+    def _fetch(self):
+        """Return fetch_base_config() as a new cloud-init process would."""
+        config_cache.config_cache.load(self.cache_file)
+        with mock.patch('cloudinit.stages.util.read_conf',
+                        wraps=config_cache.util.read_conf) as m_read:
+            cfg = stages.fetch_base_config()
+        return (cfg, m_read.call_count)
+
+    def test_unchanged_config_not_parsed(self):
+        """Later stages do not parse unchanged config files."""
+        self.assertEqual(({'a': 1, 'b': 2}, 3), self._fetch())
+        self.assertEqual(({'a': 1, 'b': 2}, 0), self._fetch())
+
+    def test_edits_between_stages(self):
+        """Edited, added and removed files and the cmdline are noticed."""
+        self._fetch()
+        _write_old(os.path.join(self.cloud_cfg_d, '10-b.cfg'), 'b: 3\n', 30)
+        self.assertEqual({'a': 1, 'b': 3}, self._fetch()[0])
+        _write_old(os.path.join(self.cloud_cfg_d, '20-a.cfg'), 'a: 4\n', 30)
+        self.assertEqual({'a': 4, 'b': 3}, self._fetch()[0])
+        os.unlink(os.path.join(self.cloud_cfg_d, '20-a.cfg'))
+        self.assertEqual({'a': 1, 'b': 3}, self._fetch()[0])
+        _write_old(self.run_cfg, 'c: 5\n', 30)
+        self.assertEqual({'a': 1, 'b': 3, 'c': 5}, self._fetch()[0])
+        self.cmdline = 'cc: d: 6 end_cc'
+        self.assertEqual({'a': 1, 'b': 3, 'c': 5, 'd': 6}, self._fetch()[0])
+        # Adding and removing files changed the directory just now
+        os.utime(self.cloud_cfg_d, (time.time() - 30, time.time() - 30))
+        self._fetch()
+        self.assertEqual(({'a': 1, 'b': 3, 'c': 5, 'd': 6}, 0), self._fetch())
+
+# vi: ts=4 expandtab
@@ -1,4 +1,5 @@
 from cloudinit.tests import helpers
+from cloudinit import boot_facts
 from cloudinit import dmi
 from cloudinit import util
 from cloudinit import subp
@@ -152,3 +153,110 @@ class TestReadDMIData(helpers.FilesystemMockingTestCase):
         key, val = ("system-product-name", "my_product")
         self._configure_kenv_return(key, val)
         self.assertEqual(dmi.read_dmi_data(key), val)
+
+
+DMIDECODE_DUMP = """\
+# dmidecode 3.2
+BIOS Information
+\tVendor: SeaBIOS
+\tVersion: 1.13.0-1ubuntu1
+\tRelease Date: 04/01/2014
+\tCharacteristics:
+\t\tBIOS characteristics not supported
+
+System Information
+\tManufacturer: QEMU
+\tProduct Name: Standard PC (i440FX + PIIX, 1996)
+\tVersion: .....
+\tUUID: 6f5c2d4e-3e8c-4f63-a0d5-5f6c1a3b2c1d
+
+Chassis Information
+\tManufacturer: QEMU
+\tAsset Tag: tag-1
+
+Chassis Information
+\tManufacturer: QEMU
+\tAsset Tag: tag-2
+"""
+
+
+class TestReadDMISnapshot(helpers.FilesystemMockingTestCase):
+
+    def setUp(self):
+        super(TestReadDMISnapshot, self).setUp()
+        self.new_root = self.tmp_dir()
+        self.reRoot(self.new_root)
+        for (name, kwargs) in (('is_container', {'return_value': False}),
+                               ('is_FreeBSD', {'return_value': False}),
+                               ('os.uname', {}), ('subp.subp', {}),
+                               ('subp.which', {'return_value': 'dmidecode'})):
+            p = mock.patch('cloudinit.dmi.' + name, **kwargs)
+            self.addCleanup(p.stop)
+            setattr(self, 'm_' + name.split('.')[-1], p.start())
+        self.m_uname.return_value = (
+            'x-sysname', 'x-nodename', 'x-release', 'x-version', 'x86_64')
+        self.addCleanup(boot_facts.boot_facts.clear)
+
+    def _enable_boot_facts(self):
+        with mock.patch('cloudinit.boot_facts._read_boot_id',
+                        return_value='boot-1'):
+            boot_facts.boot_facts.load('/boot-facts.json')
+
+    def _create_sysfs_file(self, key, content):
+        util.ensure_dir(os.path.join('sys', 'class', 'dmi', 'id'))
+        util.write_file("/sys/class/dmi/id/{0}".format(key), content)
+
+    def test_snapshot_reads_sysfs_then_one_dmidecode_dump(self):
+        """Keys missing from sysfs come from a single dmidecode call."""
+        self._create_sysfs_file('sys_vendor', 'sysfs-vendor\n')
+        self.m_subp.return_value = (DMIDECODE_DUMP, '')
+        snapshot = dmi.read_dmi_snapshot()
+        self.m_subp.assert_called_once_with(['dmidecode', '-q'])
+        self.assertEqual('sysfs-vendor', snapshot['system-manufacturer'])
+        self.assertEqual(
+            'Standard PC (i440FX + PIIX, 1996)',
+            snapshot['system-product-name'])
+        self.assertEqual('04/01/2014', snapshot['bios-release-date'])
+        self.assertEqual('', snapshot['system-version'])
+        self.assertEqual('tag-1\ntag-2', snapshot['chassis-asset-tag'])
+        self.assertIsNone(snapshot['baseboard-version'])
+        self.assertEqual(sorted(dmi.DMIDECODE_TO_KERNEL), sorted(snapshot))
+
+    def test_snapshot_skips_dmidecode_when_sysfs_complete(self):
+        """dmidecode is not run when sysfs has every value."""
+        for kmap in dmi.DMIDECODE_TO_KERNEL.values():
+            self._create_sysfs_file(kmap.linux, kmap.linux)
+        snapshot = dmi.read_dmi_snapshot()
+        self.assertEqual(0, self.m_subp.call_count)
+        self.assertEqual('product_uuid', snapshot['system-uuid'])
+
+    def test_snapshot_uses_one_kenv_listing_on_freebsd(self):
+        """On FreeBSD all values come from a single kenv call."""
+        self.m_is_FreeBSD.return_value = True
+        self.m_subp.return_value = (
+            'smbios.system.maker="FreeBSD Maker"\n'
+            'smbios.system.uuid="1234"\nkern.hz=100\n', '')
+        snapshot = dmi.read_dmi_snapshot()
+        self.m_subp.assert_called_once_with(['kenv'])
+        self.assertEqual('FreeBSD Maker', snapshot['system-manufacturer'])
+        self.assertEqual('1234', snapshot['system-uuid'])
+        self.assertIsNone(snapshot['system-version'])
+
+    def test_read_dmi_data_served_from_snapshot_with_boot_facts(self):
+        """With boot facts enabled, DMI is read once per boot."""
+        self._enable_boot_facts()
+        self._create_sysfs_file('product_name', 'product')
+        self.m_subp.return_value = ('', '')
+        self.assertEqual('product', dmi.read_dmi_data('system-product-name'))
+        util.del_file('/sys/class/dmi/id/product_name')
+        self.assertEqual('product', dmi.read_dmi_data('system-product-name'))
+        self.assertIsNone(dmi.read_dmi_data('system-uuid'))
+        self.assertEqual(1, self.m_subp.call_count)
+
+    def test_read_dmi_data_reads_directly_without_boot_facts(self):
+        """Without boot facts each call reads the current value."""
+        self._create_sysfs_file('product_name', 'product')
+        self.assertEqual('product', dmi.read_dmi_data('system-product-name'))
+        self._create_sysfs_file('product_name', 'other')
+        self.assertEqual('other', dmi.read_dmi_data('system-product-name'))
+        self.assertEqual(0, self.m_subp.call_count)
@@ -0,0 +1,176 @@
+# This file is part of cloud-init. See LICENSE file for license information.
+
+"""Tests for cloudinit.importer"""
+
+import json
+import os
+
+from cloudinit import importer
+from cloudinit.tests.helpers import CiTestCase, mock
+from cloudinit.util import load_file, write_file
+
+M_PATH = 'cloudinit.importer.'
+
+CC_FOO = """\
+from cloudinit.settings import PER_ALWAYS
+from cloudinit import util as cutil
+
+frequency = PER_ALWAYS
+distros = ['ubuntu', 'debian']
+schema = {'id': 'cc_foo'}
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+def handle(name, cfg, cloud, log, args):
+    pass
+"""
+
+DS_FOO = """\
+from cloudinit import sources
+
+
+class DataSourceFoo(sources.DataSource):
+    dsname = 'Foo'
+
+
+def get_datasource_list(depends):
+    return sources.list_from_depends([], depends)
+"""
+
+
+class TestBuildModuleIndex(CiTestCase):
+
+    def setUp(self):
+        super(TestBuildModuleIndex, self).setUp()
+        self.root = self.tmp_dir()
+        write_file(os.path.join(self.root, 'config', 'cc_foo.py'), CC_FOO)
+        write_file(os.path.join(self.root, 'config', 'schema.py'), '')
+        write_file(
+            os.path.join(self.root, 'sources', 'DataSourceFoo.py'), DS_FOO)
+
+    def test_modules_indexed_without_importing(self):
+        """Module level names are read from the source."""
+        with mock.patch(M_PATH + 'import_module') as m_import:
+            index = importer.build_module_index(self.root)
+        m_import.assert_not_called()
+        self.assertEqual(
+            {'version': importer.MODULE_INDEX_VERSION,
+             'packages': {
+                 'cloudinit.config': {
+                     'cc_foo': {
+                         'attrs': ['PER_ALWAYS', 'cutil', 'distros',
+                                   'frequency', 'handle', 'schema', 'yaml'],
+                         'size': len(CC_FOO)}},
+                 'cloudinit.sources': {
+                     'DataSourceFoo': {
+                         'attrs': ['DataSourceFoo', 'get_datasource_list',
+                                   'sources'],
+                         'size': len(DS_FOO)}}}},
+            index)
+
+    def test_index_of_cloudinit_tree(self):
+        """The shipped modules are indexed with what they define."""
+        index = importer.build_module_index()['packages']
+        self.assertIn('handle', index['cloudinit.config']['cc_ntp']['attrs'])
+        self.assertIn('schema', index['cloudinit.config']['cc_ntp']['attrs'])
+        self.assertIn(
+            'get_datasource_list',
+            index['cloudinit.sources']['DataSourceNone']['attrs'])
+
+    def test_write_module_index(self):
+        """The written index is the json of build_module_index."""
+        path = self.tmp_path('module_index.json')
+        importer.write_module_index(path, self.root)
+        self.assertEqual(importer.build_module_index(self.root),
+                         json.loads(load_file(path)))
+
+
+class TestFindModuleWithIndex(CiTestCase):
+
+    def setUp(self):
+        super(TestFindModuleWithIndex, self).setUp()
+        self.root = self.tmp_dir()
+        write_file(os.path.join(self.root, 'config', 'cc_foo.py'), CC_FOO)
+        write_file(
+            os.path.join(self.root, 'sources', 'DataSourceFoo.py'), DS_FOO)
+        self.index_file = os.path.join(self.root, 'module_index.json')
+        for (name, value) in (('MODULE_INDEX_FILE', self.index_file),
+                              ('_MODULE_INDEX', None)):
+            patcher = mock.patch(M_PATH + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_only_indexed_modules_imported(self):
+        """Only modules the index lists with the required attrs import."""
+        importer.write_module_index(self.index_file, self.root)
+        with mock.patch(M_PATH + 'import_module') as m_import:
+            self.assertEqual(
+                (['cc_foo', 'cloudinit.config.cc_foo'],
+                 ['cc_foo', 'cloudinit.config.cc_foo']),
+                importer.find_module(
+                    'cc_foo', ['', 'cloudinit.config'], ['handle']))
+            self.assertEqual(
+                [mock.call('cc_foo'), mock.call('cloudinit.config.cc_foo')],
+                m_import.call_args_list)
+            m_import.reset_mock()
+            self.assertEqual(
+                [], importer.find_module(
+                    'cc_foo', ['cloudinit.config'], ['get_data'])[0])
+            self.assertEqual(
+                [], importer.find_module('cc_bar', ['cloudinit.config'])[0])
+        m_import.assert_not_called()
+
+    def test_indexed_module_failing_import_not_found(self):
+        """An indexed module which fails to import is not found."""
+        importer.write_module_index(self.index_file, self.root)
+        with mock.patch(M_PATH + 'import_module',
+                        side_effect=ImportError()) as m_import:
+            self.assertEqual(
+                ([], ['cloudinit.sources.DataSourceFoo']),
+                importer.find_module(
+                    'DataSourceFoo', ['cloudinit.sources'],
+                    ['get_datasource_list']))
+        m_import.assert_called_once_with('cloudinit.sources.DataSourceFoo')
+
+    def test_stale_index_ignored(self):
+        """An index not listing the installed modules is not used."""
+        importer.write_module_index(self.index_file, self.root)
+        write_file(os.path.join(self.root, 'config', 'cc_bar.py'), CC_FOO)
+        self.assertEqual({}, importer.get_module_index())
+
+    def test_index_of_edited_module_ignored(self):
+        """An index older than a module or with another size is not used."""
+        importer.write_module_index(self.index_file, self.root)
+        self.assertIn('cloudinit.config', importer.get_module_index())
+        cc_foo = os.path.join(self.root, 'config', 'cc_foo.py')
+        index_mtime = os.stat(self.index_file).st_mtime
+        # Same size, modified after the index was written
+        write_file(cc_foo, CC_FOO.replace('handle', 'handl2'))
+        os.utime(cc_foo, (index_mtime + 10, index_mtime + 10))
+        with mock.patch(M_PATH + '_MODULE_INDEX', None):
+            self.assertEqual({}, importer.get_module_index())
+        # Other size, with the time stamp of the index
+        write_file(cc_foo, CC_FOO + 'handle = None\n')
+        os.utime(cc_foo, (index_mtime, index_mtime))
+        with mock.patch(M_PATH + '_MODULE_INDEX', None):
+            self.assertEqual({}, importer.get_module_index())
+        with mock.patch(M_PATH + '_MODULE_INDEX', None):
+            with mock.patch(M_PATH + 'import_module') as m_import:
+                self.assertEqual(
+                    ['cloudinit.config.cc_foo'], importer.find_module(
+                        'cc_foo', ['cloudinit.config'], ['get_data'])[0])
+        m_import.assert_called_once_with('cloudinit.config.cc_foo')
+
+    def test_invalid_index_ignored(self):
+        """A corrupt or old index is not used."""
+        write_file(self.index_file, '{"version": ')
+        self.assertEqual({}, importer.get_module_index())
+        with mock.patch(M_PATH + '_MODULE_INDEX', None):
+            write_file(self.index_file, json.dumps({'version': 0}))
+            self.assertEqual({}, importer.get_module_index())
+
+# vi: ts=4 expandtab
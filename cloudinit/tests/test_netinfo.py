@@ -3,8 +3,11 @@
 """Tests netinfo module functions and classes."""
 
 from copy import copy
+import socket
 
+from cloudinit import netinfo
 from cloudinit.netinfo import netdev_info, netdev_pformat, route_pformat
+from cloudinit.sources.helpers import netlink
 from cloudinit.tests.helpers import CiTestCase, mock, readResource
 
 
@@ -21,12 +24,83 @@ NETDEV_FORMATTED_OUT = readResource("netinfo/netdev-formatted-output")
 ROUTE_FORMATTED_OUT = readResource("netinfo/route-formatted-output")
 FREEBSD_NETDEV_OUT = readResource("netinfo/freebsd-netdev-formatted-output")
 
+# Netlink equivalents of sample-ipaddrshow-output and sample-iproute-output-*
+NETLINK_LINKS = [
+    netlink.Link(1, 'lo', 772, 0x10049, '00:00:00:00:00:00'),
+    netlink.Link(2, 'enp0s25', 1, 0x11043, '50:7b:9d:2c:af:91'),
+]
+NETLINK_ADDRESSES = [
+    netlink.Address(socket.AF_INET, 8, 254, 1, '127.0.0.1', '127.0.0.1',
+                    None),
+    netlink.Address(socket.AF_INET6, 128, 254, 1, '::1', None, None),
+    netlink.Address(socket.AF_INET, 24, 0, 2, '192.168.2.18',
+                    '192.168.2.18', '192.168.2.255'),
+    netlink.Address(socket.AF_INET6, 64, 0, 2, 'fe80::7777:2222:1111:eeee',
+                    None, None),
+    netlink.Address(socket.AF_INET6, 64, 253, 2, 'fe80::8107:2b92:867e:f8a6',
+                    None, None),
+]
+NETLINK_ROUTE_LINKS = NETLINK_LINKS + [
+    netlink.Link(3, 'wlp3s0', 1, 0x11043, '50:7b:9d:2c:af:92')]
+V6_GW = 'fe80::32ee:54de:cd43:b4e1'
+NETLINK_ROUTES = {
+    socket.AF_INET: [
+        netlink.Route(socket.AF_INET, 0, 254, 1, None, '192.168.2.1', 2, 100,
+                      0),
+        netlink.Route(socket.AF_INET, 0, 254, 1, None, '192.168.2.1', 3, 150,
+                      0),
+        netlink.Route(socket.AF_INET, 24, 254, 1, '192.168.2.0', None, 2, 100,
+                      0),
+        # Only the main table is listed by ip route list
+        netlink.Route(socket.AF_INET, 32, 255, 2, '192.168.2.18', None, 2,
+                      None, 0),
+    ],
+    socket.AF_INET6: [
+        netlink.Route(socket.AF_INET6, 128, 254, 1,
+                      '2a00:abcd:82ae:cd33::657', None, 2, 256, 2334),
+        netlink.Route(socket.AF_INET6, 64, 254, 1, '2a00:abcd:82ae:cd33::',
+                      None, 2, 100, 0),
+        netlink.Route(socket.AF_INET6, 56, 254, 1, '2a00:abcd:82ae:cd33::',
+                      V6_GW, 2, 100, 0),
+        netlink.Route(socket.AF_INET6, 128, 254, 1, 'fd81:123f:654::657',
+                      None, 2, 256, 0),
+        netlink.Route(socket.AF_INET6, 64, 254, 1, 'fd81:123f:654::', None, 2,
+                      100, 0),
+        netlink.Route(socket.AF_INET6, 48, 254, 1, 'fd81:123f:654::', V6_GW,
+                      2, 100, 0),
+        netlink.Route(socket.AF_INET6, 128, 254, 1,
+                      'fe80::abcd:ef12:bc34:da21', None, 2, 100, 0),
+        netlink.Route(socket.AF_INET6, 64, 254, 1, 'fe80::', None, 2, 256, 0),
+        netlink.Route(socket.AF_INET6, 0, 254, 1, None, V6_GW, 2, 100, 0),
+        netlink.Route(socket.AF_INET6, 128, 255, 2, '::1', None, 1, 0, 0),
+        netlink.Route(socket.AF_INET6, 128, 255, 2,
+                      '2600:1f16:b80:ad00:90a:c915:bca6:5ff2', None, 1, 0, 0),
+    ],
+}
+
+
+def subp_iproute_selector(*args, **kwargs):
+    if ['ip', '-o', 'route', 'list'] == args[0]:
+        return (SAMPLE_IPROUTE_OUT_V4, '')
+    v6cmd = ['ip', '--oneline', '-6', 'route', 'list', 'table', 'all']
+    if v6cmd == args[0]:
+        return (SAMPLE_IPROUTE_OUT_V6, '')
+    raise Exception('Unexpected subp call %s' % args[0])
+
 
 class TestNetInfo(CiTestCase):
 
     maxDiff = None
     with_logs = True
 
+    def setUp(self):
+        super(TestNetInfo, self).setUp()
+        # Exercise the ip and net-tools parsers, netlink is only read on Linux
+        patcher = mock.patch('cloudinit.netinfo.util.is_Linux',
+                             return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @mock.patch('cloudinit.netinfo.subp.which')
     @mock.patch('cloudinit.netinfo.subp.subp')
     def test_netdev_old_nettools_pformat(self, m_subp, m_which):
@@ -151,15 +225,6 @@ class TestNetInfo(CiTestCase):
     @mock.patch('cloudinit.netinfo.subp.subp')
     def test_route_iproute_pformat(self, m_subp, m_which):
         """route_pformat properly rendering ip route info."""
-
-        def subp_iproute_selector(*args, **kwargs):
-            if ['ip', '-o', 'route', 'list'] == args[0]:
-                return (SAMPLE_IPROUTE_OUT_V4, '')
-            v6cmd = ['ip', '--oneline', '-6', 'route', 'list', 'table', 'all']
-            if v6cmd == args[0]:
-                return (SAMPLE_IPROUTE_OUT_V6, '')
-            raise Exception('Unexpected subp call %s' % args[0])
-
         m_subp.side_effect = subp_iproute_selector
         m_which.side_effect = lambda x: x if x == 'ip' else None
         content = route_pformat()
@@ -178,4 +243,65 @@ class TestNetInfo(CiTestCase):
             self.logs.getvalue())
         m_subp.assert_not_called()
 
+
+@mock.patch('cloudinit.netinfo.util.is_Linux', return_value=True)
+@mock.patch('cloudinit.netinfo.subp.subp')
+class TestNetInfoNetlink(CiTestCase):
+
+    maxDiff = None
+
+    @mock.patch('cloudinit.netinfo.netlink.read_addresses')
+    @mock.patch('cloudinit.netinfo.netlink.read_links')
+    def test_netdev_info_matches_iproute(self, m_links, m_addrs, m_subp,
+                                         _m_linux):
+        """Devices read over netlink are described as ip addr show does."""
+        m_links.return_value = NETLINK_LINKS
+        m_addrs.return_value = NETLINK_ADDRESSES
+        self.assertEqual(
+            netinfo._netdev_info_iproute(SAMPLE_IPADDRSHOW_OUT),
+            netdev_info())
+        m_subp.assert_not_called()
+
+    @mock.patch('cloudinit.netinfo.netlink.read_addresses')
+    @mock.patch('cloudinit.netinfo.netlink.read_links')
+    def test_netdev_info_down_interfaces(self, m_links, m_addrs, m_subp,
+                                         _m_linux):
+        """Interfaces without IFF_UP and IFF_LOWER_UP are down."""
+        m_links.return_value = [
+            netlink.Link(2, 'eth0', 1, 0x1003, '00:16:3e:de:51:a6')]
+        m_addrs.return_value = []
+        self.assertEqual(
+            {'eth0': {'ipv4': [], 'ipv6': [],
+                      'hwaddr': '00:16:3e:de:51:a6', 'up': False}},
+            netdev_info())
+
+    @mock.patch('cloudinit.netinfo.netlink.read_routes')
+    @mock.patch('cloudinit.netinfo.netlink.read_links')
+    def test_route_info_matches_iproute(self, m_links, m_routes, m_subp,
+                                        _m_linux):
+        """Routes read over netlink are described as ip route list does."""
+        m_links.return_value = NETLINK_ROUTE_LINKS
+        m_routes.side_effect = lambda family: NETLINK_ROUTES[family]
+        self.assertEqual(ROUTE_FORMATTED_OUT, route_pformat())
+        m_subp.assert_not_called()
+        m_subp.side_effect = subp_iproute_selector
+        self.assertEqual(
+            netinfo._netdev_route_info_iproute(SAMPLE_IPROUTE_OUT_V4),
+            netinfo._netdev_route_info_netlink())
+
+    @mock.patch('cloudinit.netinfo.subp.which')
+    @mock.patch('cloudinit.netinfo.netlink.read_links')
+    def test_fallback_to_ip_without_netlink(self, m_links, m_which, m_subp,
+                                            _m_linux):
+        """The ip command is used when netlink cannot be read."""
+        m_links.side_effect = OSError('netlink is unavailable')
+        m_which.side_effect = lambda x: x if x == 'ip' else None
+        m_subp.side_effect = subp_iproute_selector
+        self.assertEqual(ROUTE_FORMATTED_OUT, route_pformat())
+        m_subp.return_value = (SAMPLE_IPADDRSHOW_OUT, '')
+        m_subp.side_effect = None
+        self.assertEqual(
+            netinfo._netdev_info_iproute(SAMPLE_IPADDRSHOW_OUT),
+            netdev_info())
+
 # vi: ts=4 expandtab
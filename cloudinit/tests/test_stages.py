@@ -4,15 +4,20 @@
 
 import os
 import stat
+import threading
 
 import pytest
 
+from cloudinit import config
+from cloudinit import importer
 from cloudinit import stages
 from cloudinit import sources
+from cloudinit import templater
 from cloudinit.sources import NetworkConfigSource
 
 from cloudinit.event import EventType
-from cloudinit.util import write_file
+from cloudinit.util import (
+    ensure_dir, load_file, load_json, load_yaml, write_file)
 
 from cloudinit.tests.helpers import CiTestCase, mock
 
@@ -403,4 +408,288 @@ class TestInit_InitializeFilesystem:
 
         assert mode == stat.S_IMODE(log_file.stat().mode)
 
+
+class FakeCheckingDataSource(FakeDataSource):
+
+    def check_instance_id(self, sys_cfg):
+        return True
+
+
+class TestInitDatasourceCache(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestInitDatasourceCache, self).setUp()
+        self.tmpdir = self.tmp_dir()
+        self.init = stages.Init()
+        self.init._cfg = {'system_info': {
+            'distro': 'ubuntu', 'paths': {'cloud_dir': self.tmpdir,
+                                          'run_dir': self.tmpdir}}}
+        self.init.datasource = FakeDataSource(paths=self.init.paths)
+        ensure_dir(self.init.paths.get_ipath_cur())
+        self.pkl_fn = self.init.paths.get_ipath_cur('obj_pkl')
+        self.header_fn = self.init.paths.get_ipath_cur('obj_pkl_header')
+
+    def _write_run_iid(self, iid):
+        write_file(self.init.paths.get_runpath('instance_id'), iid + '\n')
+
+    def test_write_to_cache_writes_pickle_and_header(self):
+        """_write_to_cache writes obj.pkl and a json header describing it."""
+        self.assertTrue(self.init._write_to_cache())
+        pkl_stat = os.stat(self.pkl_fn)
+        self.assertEqual(
+            {'version': stages.OBJ_PKL_HEADER_VERSION,
+             'instance_id': TEST_INSTANCE_ID,
+             'datasource': 'FakeDataSource',
+             'check_instance_id': False,
+             'pickle': {'size': pkl_stat.st_size,
+                        'mtime_ns': pkl_stat.st_mtime_ns}},
+            load_json(load_file(self.header_fn)))
+
+    def test_header_rejects_other_instance_without_unpickling(self):
+        """A header for another instance-id avoids loading the pickle."""
+        self.init._write_to_cache()
+        self._write_run_iid('i-other')
+        with mock.patch('cloudinit.stages._pkl_load') as m_load:
+            self.assertEqual(
+                (None, 'cache invalid in datasource: FakeDataSource'
+                       ' (i-testing)'),
+                self.init._restore_from_checked_cache('check'))
+        self.assertEqual(0, m_load.call_count)
+
+    def test_header_restores_matching_instance(self):
+        """The pickle is loaded when the header instance-id matches."""
+        self.init._write_to_cache()
+        self._write_run_iid(TEST_INSTANCE_ID)
+        (ds, msg) = self.init._restore_from_checked_cache('check')
+        self.assertIsInstance(ds, FakeDataSource)
+        self.assertIn('restored from cache with run check', msg)
+
+    def test_header_defers_to_datasource_check_instance_id(self):
+        """Datasources with check_instance_id are still unpickled."""
+        self.init.datasource = FakeCheckingDataSource(paths=self.init.paths)
+        self.init._write_to_cache()
+        self.assertTrue(
+            load_json(load_file(self.header_fn))['check_instance_id'])
+        self._write_run_iid('i-other')
+        (ds, msg) = self.init._restore_from_checked_cache('check')
+        self.assertIsInstance(ds, FakeCheckingDataSource)
+        self.assertIn('restored from checked cache', msg)
+
+    def test_trust_ignores_header_instance_id(self):
+        """existing=trust restores the cache whatever the instance-id."""
+        self.init._write_to_cache()
+        self._write_run_iid('i-other')
+        (ds, msg) = self.init._restore_from_checked_cache('trust')
+        self.assertIsInstance(ds, FakeDataSource)
+        self.assertIn('restored from cache:', msg)
+
+    def test_stale_header_is_ignored(self):
+        """A header not matching obj.pkl falls back to the pickle."""
+        self.init._write_to_cache()
+        # Rewrite the pickle alone, as an older cloud-init would
+        self.init.datasource = FakeCheckingDataSource(paths=self.init.paths)
+        stages._pkl_store(self.init.datasource, self.pkl_fn)
+        os.utime(self.pkl_fn, ns=(0, 0))
+        self._write_run_iid('i-other')
+        (ds, msg) = self.init._restore_from_checked_cache('check')
+        self.assertIsInstance(ds, FakeCheckingDataSource)
+        self.assertIn('Ignoring stale cache header', self.logs.getvalue())
+
+    def test_pickle_without_header_is_restored(self):
+        """An obj.pkl from before headers existed is still restored."""
+        stages._pkl_store(self.init.datasource, self.pkl_fn)
+        self._write_run_iid(TEST_INSTANCE_ID)
+        (ds, _msg) = self.init._restore_from_checked_cache('check')
+        self.assertIsInstance(ds, FakeDataSource)
+
+
+class TestModulesRunModules(CiTestCase):
+
+    with_logs = True
+
+    def setUp(self):
+        super(TestModulesRunModules, self).setUp()
+        init = mock.Mock()
+        init.cloudify.return_value.run.side_effect = (
+            lambda name, func, args, freq: (True, func(*args)))
+        self.mods = stages.Modules(init)
+        self.mods._cached_cfg = {
+            'runcmd': [['ls', '/etc']], 'unverified_modules': []}
+        self.seen = []
+
+    def _make_mod(self, handle):
+        return mock.Mock(frequency='always', handle=handle)
+
+    def _record(self, name, cfg, cloud, log, args):
+        self.seen.append(cfg)
+
+    def _mutate(self, name, cfg, cloud, log, args):
+        self.seen.append(cfg)
+        cfg['runcmd'].append(['touch', name])
+
+    def test_config_is_shared_until_a_module_modifies_it(self):
+        """Modules reuse one config copy until a module modifies it."""
+        mostly_mods = [
+            [self._make_mod(self._record), 'one', None, []],
+            [self._make_mod(self._record), 'two', None, []],
+            [self._make_mod(self._mutate), 'three', None, []],
+            [self._make_mod(self._record), 'four', None, []]]
+        (which_ran, failures) = self.mods._run_modules(mostly_mods)
+        self.assertEqual(['one', 'two', 'three', 'four'], which_ran)
+        self.assertEqual([], failures)
+        self.assertIs(self.seen[0], self.seen[1])
+        self.assertIs(self.seen[1], self.seen[2])
+        self.assertIsNot(self.seen[2], self.seen[3])
+        self.assertIsNot(self.mods._cached_cfg, self.seen[0])
+        self.assertEqual([['ls', '/etc']], self.seen[3]['runcmd'])
+        self.assertEqual([['ls', '/etc']], self.mods._cached_cfg['runcmd'])
+        self.assertIn(
+            'Module three modified its config, using a fresh copy',
+            self.logs.getvalue())
+
+    def test_failing_module_changes_do_not_leak(self):
+        """Changes made by a module which raises are not seen by others."""
+        def mutate_and_fail(*args):
+            self._mutate(*args)
+            raise RuntimeError('broken')
+
+        mostly_mods = [
+            [self._make_mod(mutate_and_fail), 'one', None, []],
+            [self._make_mod(self._record), 'two', None, []]]
+        (_which_ran, failures) = self.mods._run_modules(mostly_mods)
+        self.assertEqual(['one'], [name for (name, _e) in failures])
+        self.assertEqual([['ls', '/etc']], self.seen[1]['runcmd'])
+
+    def _make_resource_mod(self, name, resources, started, wait=None,
+                           notify=None):
+        """Return a module recording its start, optionally synchronized."""
+        def handle(*args):
+            started.append(name)
+            if notify is not None:
+                notify.set()
+            if wait is not None:
+                self.assertTrue(wait.wait(5))
+        mod = self._make_mod(handle)
+        mod.resources = resources
+        return [mod, name, None, []]
+
+    def test_module_dependencies(self):
+        """Modules wait for earlier ones sharing resources or undeclared."""
+        mods = [
+            self._make_resource_mod('apt', ['packages'], []),
+            self._make_resource_mod('ssh', ['ssh', 'users'], []),
+            self._make_resource_mod('ntp', ['packages', 'ntp'], []),
+            self._make_resource_mod('runcmd', None, []),
+            self._make_resource_mod('snap', ['snap'], [])]
+        self.assertEqual(
+            [set(), set(), {0}, {0, 1, 2}, {3}],
+            stages.Modules._module_dependencies(mods))
+
+    def _default_modules(self, variant, section):
+        """Return mostly_mods of a module list in the shipped cloud.cfg."""
+        cfg = load_yaml(templater.render_from_file(
+            os.path.join('config', 'cloud.cfg.tmpl'), {'variant': variant}))
+        return [
+            [config.fixup_module(importer.import_module(
+                'cloudinit.config.' + config.form_module_name(name))),
+             name, None, []]
+            for name in cfg[section]]
+
+    def test_default_config_modules_declare_resources(self):
+        """No shipped config stage module forces the stage to run in order."""
+        for variant in ('alpine', 'centos', 'debian', 'fedora', 'freebsd',
+                        'rhel', 'suse', 'ubuntu'):
+            mostly_mods = self._default_modules(
+                variant, 'cloud_config_modules')
+            self.assertEqual(
+                [], [name for (mod, name, _f, _a) in mostly_mods
+                     if mod.resources is None], variant)
+
+    def test_default_config_modules_overlap(self):
+        """The shipped config stage list has modules that run concurrently."""
+        mostly_mods = self._default_modules('ubuntu', 'cloud_config_modules')
+        names = [name for (_m, name, _f, _a) in mostly_mods]
+        deps = dict(
+            (name, set(names[idx] for idx in mod_deps))
+            for (name, mod_deps) in zip(
+                names, stages.Modules._module_dependencies(mostly_mods)))
+        self.assertEqual(set(), deps['ssh-import-id'])
+        self.assertEqual({'ssh-import-id'}, deps['set-passwords'])
+        self.assertEqual({'apt-pipelining', 'grub-dpkg'},
+                         deps['apt-configure'])
+        self.assertEqual({'apt-configure', 'ubuntu-advantage'}, deps['ntp'])
+        self.assertEqual(set(), deps['timezone'])
+        self.assertEqual(set(), deps['runcmd'])
+
+    def test_concurrent_modules_run_while_others_block(self):
+        """Independent modules run while an earlier module still runs."""
+        self.mods._cached_cfg['module_max_workers'] = 4
+        ssh_ran = threading.Event()
+        started = []
+        mostly_mods = [
+            self._make_resource_mod('apt', ['packages'], started, ssh_ran),
+            self._make_resource_mod('ntp', ['packages'], started),
+            self._make_resource_mod('ssh', ['ssh'], started, None, ssh_ran)]
+        (which_ran, failures) = self.mods._run_modules(mostly_mods)
+        self.assertEqual(['apt', 'ntp', 'ssh'], which_ran)
+        self.assertEqual([], failures)
+        self.assertEqual(['apt', 'ssh', 'ntp'], started)
+
+    def test_concurrent_failures_reported_in_list_order(self):
+        """Failures keep the list order and other modules still run."""
+        self.mods._cached_cfg['module_max_workers'] = 2
+
+        def fail(name, *args):
+            raise RuntimeError(name)
+        mostly_mods = []
+        for name in ('one', 'two', 'three'):
+            mod = self._make_mod(fail if name != 'two' else self._record)
+            mod.resources = [name]
+            mostly_mods.append([mod, name, None, []])
+        (which_ran, failures) = self.mods._run_modules(mostly_mods)
+        self.assertEqual(['one', 'two', 'three'], which_ran)
+        self.assertEqual(
+            [('one', 'one'), ('three', 'three')],
+            [(name, str(e)) for (name, e) in failures])
+        self.assertEqual(1, len(self.seen))
+        self.assertIn('Running module three', self.logs.getvalue())
+
+    def test_invalid_module_max_workers_runs_in_order(self):
+        """An invalid module_max_workers falls back to running in order."""
+        self.mods._cached_cfg['module_max_workers'] = 'many'
+        mostly_mods = [
+            [self._make_mod(self._record), 'one', None, []],
+            [self._make_mod(self._record), 'two', None, []]]
+        with mock.patch.object(
+                self.mods, '_run_modules_concurrently') as m_concurrent:
+            (which_ran, _failures) = self.mods._run_modules(mostly_mods)
+        self.assertEqual(['one', 'two'], which_ran)
+        m_concurrent.assert_not_called()
+        self.assertIn(
+            "Config module_max_workers 'many' is not an int",
+            self.logs.getvalue())
+
+    def test_cfg_property_returns_a_copy(self):
+        """Modules.cfg never hands out the cached merged config."""
+        cfg = self.mods.cfg
+        self.assertEqual(self.mods._cached_cfg, cfg)
+        self.assertIsNot(self.mods._cached_cfg, cfg)
+        self.assertIsNot(self.mods._cached_cfg['runcmd'], cfg['runcmd'])
+
+    def test_read_modules_copies_module_args(self):
+        """Module args are copied out of the cached merged config."""
+        self.mods._cached_cfg['cloud_config_modules'] = [
+            ['runcmd', 'always', {'a': 1}], {'name': 'ssh', 'args': [[1]]}]
+        module_list = self.mods._read_modules('cloud_config_modules')
+        self.assertEqual(
+            [{'mod': 'runcmd', 'freq': 'always', 'args': [{'a': 1}]},
+             {'mod': 'ssh', 'args': [[1]]}], module_list)
+        module_list[0]['args'][0]['a'] = 2
+        module_list[1]['args'][0].append(2)
+        self.assertEqual(
+            [['runcmd', 'always', {'a': 1}], {'name': 'ssh', 'args': [[1]]}],
+            self.mods._cached_cfg['cloud_config_modules'])
+
 # vi: ts=4 expandtab
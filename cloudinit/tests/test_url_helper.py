@@ -1,14 +1,17 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 from cloudinit.url_helper import (
-    NOT_FOUND, UrlError, REDACTED, oauth_headers, read_file_or_url,
-    retry_on_url_exc)
+    NOT_FOUND, UrlError, REDACTED, SessionPool, oauth_headers,
+    read_file_or_url, readurl, retry_on_url_exc, wait_for_url)
 from cloudinit.tests.helpers import CiTestCase, mock, skipIf
+from cloudinit import url_helper
 from cloudinit import util
 from cloudinit import version
 
+import http.server
 import httpretty
 import requests
+import threading
 
 
 try:
@@ -153,6 +156,158 @@ class TestReadFileOrUrl(CiTestCase):
         self.assertEqual(m_response, response._response)
 
 
+class _KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'tracker=1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSessionPool(CiTestCase):
+
+    def setUp(self):
+        super(TestSessionPool, self).setUp()
+        self.server = http.server.HTTPServer(
+            ('127.0.0.1', 0), _KeepAliveHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/path' % self.server.server_port
+        self.pool = SessionPool()
+        self.addCleanup(self.pool.clear)
+
+    def test_get_returns_one_session_per_host(self):
+        """Urls on the same scheme and host share a session."""
+        session = self.pool.get('http://169.254.169.254/latest/meta-data')
+        self.assertIs(
+            session, self.pool.get('http://169.254.169.254/latest/user-data'))
+        self.assertIsNot(session, self.pool.get('http://[fd00:ec2::254]/'))
+        self.assertIsNot(session, self.pool.get('https://169.254.169.254/'))
+        self.assertEqual(3, self.pool.stats()['hosts'])
+
+    def test_clear_closes_pooled_sessions(self):
+        """clear drops and closes all sessions."""
+        session = self.pool.get(self.url)
+        with mock.patch.object(session, 'close') as m_close:
+            self.pool.clear()
+        self.assertEqual(1, m_close.call_count)
+        self.assertIsNot(session, self.pool.get(self.url))
+
+    def test_readurl_reuses_keepalive_connection(self):
+        """Sequential reads to one host open a single connection."""
+        with mock.patch.object(url_helper, 'session_pool', self.pool):
+            for _ in range(3):
+                self.assertEqual(b'ok', readurl(self.url).contents)
+        self.assertEqual(
+            {'hosts': 1, 'connections_opened': 1, 'connections_reused': 2},
+            self.pool.stats())
+
+    def test_readurl_pooled_sessions_do_not_store_cookies(self):
+        """Cookies set by a server are not replayed to later callers."""
+        with mock.patch.object(url_helper, 'session_pool', self.pool):
+            readurl(self.url)
+        self.assertEqual(0, len(self.pool.get(self.url).cookies))
+
+    def test_readurl_does_not_pool_when_disabled(self):
+        """A disabled pool falls back to a new session for each read."""
+        self.pool.enabled = False
+        with mock.patch.object(url_helper, 'session_pool', self.pool):
+            with mock.patch.object(self.pool, 'get') as m_get:
+                self.assertEqual(b'ok', readurl(self.url).contents)
+        self.assertEqual(0, m_get.call_count)
+
+    def test_readurl_prefers_explicit_session(self):
+        """An explicit session argument bypasses the pool."""
+        session = requests.Session()
+        with mock.patch.object(url_helper, 'session_pool', self.pool):
+            with mock.patch.object(self.pool, 'get') as m_get:
+                readurl(self.url, session=session)
+        self.assertEqual(0, m_get.call_count)
+
+
+class TestWaitForUrlRace(CiTestCase):
+
+    def setUp(self):
+        super(TestWaitForUrlRace, self).setUp()
+        self.unblock = threading.Event()
+        self.addCleanup(self.unblock.set)
+
+    def _readurl(self, url, **kwargs):
+        """Block on 'blackhole' urls, fail 'broken' ones, else respond."""
+        if 'blackhole' in url:
+            self.unblock.wait()
+            raise UrlError(requests.Timeout('timed out'), url=url)
+        if 'broken' in url:
+            raise UrlError(requests.ConnectionError('refused'), url=url)
+        response = mock.Mock(contents=b'ok', code=200)
+        response.ok.return_value = True
+        return response
+
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_returns_first_healthy_url(self, m_readurl):
+        """A black-holed first url does not block the working one."""
+        m_readurl.side_effect = self._readurl
+        status_msgs = []
+        url, contents = wait_for_url(
+            ['http://blackhole/', 'http://broken/', 'http://working/'],
+            max_wait=10, timeout=10, status_cb=status_msgs.append,
+            race=True)
+        self.assertEqual('http://working/', url)
+        self.assertEqual(b'ok', contents)
+        self.assertFalse(self.unblock.is_set())
+        self.assertEqual(1, len(status_msgs))
+        self.assertIn("Calling 'http://broken/' failed", status_msgs[0])
+
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_calls_callbacks_from_caller_thread(self, m_readurl):
+        """headers_cb and exception_cb run in the calling thread."""
+        m_readurl.side_effect = self._readurl
+        caller = threading.current_thread()
+        threads = []
+
+        def headers_cb(url):
+            threads.append(threading.current_thread())
+            return {'url': url}
+
+        def exception_cb(msg, exception):
+            threads.append(threading.current_thread())
+            raise exception
+
+        with self.assertRaises(UrlError):
+            wait_for_url(
+                ['http://blackhole/', 'http://broken/'], max_wait=10,
+                timeout=10, headers_cb=headers_cb, exception_cb=exception_cb,
+                race=True)
+        self.assertEqual([caller] * 3, threads)
+        self.assertIn(
+            mock.call('http://broken/', headers={'url': 'http://broken/'},
+                      headers_redact=None, timeout=10, check_status=False,
+                      request_method=None),
+            m_readurl.call_args_list)
+
+    @mock.patch(M_PATH + 'time.sleep')
+    @mock.patch(M_PATH + 'readurl')
+    def test_race_gives_up_after_max_wait(self, m_readurl, m_sleep):
+        """Race mode honors max_wait like the sequential mode."""
+        m_readurl.side_effect = self._readurl
+        self.assertEqual(
+            (False, None),
+            wait_for_url(['http://broken/', 'http://broken2/'], max_wait=0,
+                         timeout=1, race=True))
+        self.assertEqual(2, m_readurl.call_count)
+        self.assertEqual(0, m_sleep.call_count)
+
+
 class TestRetryOnUrlExc(CiTestCase):
 
     def test_do_not_retry_non_urlerror(self):
@@ -171,4 +326,19 @@ class TestRetryOnUrlExc(CiTestCase):
         myerror = UrlError(cause=requests.Timeout('something timed out'))
         self.assertTrue(retry_on_url_exc(msg='', exc=myerror))
 
+
+class TestRequestsVersion(CiTestCase):
+
+    def test_version_tuple(self):
+        """Only the leading numeric version components are compared."""
+        self.assertEqual((2, 25, 1), url_helper._version_tuple('2.25.1'))
+        self.assertEqual((1, 0), url_helper._version_tuple('1.0rc1.dev2'))
+        self.assertEqual((), url_helper._version_tuple('unknown'))
+
+    def test_ssl_enabled_for_installed_requests(self):
+        """The installed requests version enables ssl verification."""
+        self.assertEqual(requests.__version__, url_helper._REQ_VER)
+        self.assertTrue(url_helper.SSL_ENABLED)
+        self.assertFalse(url_helper.CONFIG_ENABLED)
+
 # vi: ts=4 expandtab
@@ -851,4 +851,38 @@ class TestEnsureFile:
         assert "ab" == kwargs["omode"]
 
 
+class TestCopyCfg:
+
+    def test_copies_nested_containers(self):
+        """Dicts and lists are copied, scalars are shared."""
+        cfg = {"runcmd": [["echo", "hi"]], "write_files": [{"content": "x"}],
+               "n": 1, "f": 1.5, "b": True, "none": None, "bytes": b"x"}
+        copied = util.copy_cfg(cfg)
+        assert cfg == copied
+        assert cfg is not copied
+        assert cfg["runcmd"] is not copied["runcmd"]
+        assert cfg["runcmd"][0] is not copied["runcmd"][0]
+        assert cfg["write_files"][0] is not copied["write_files"][0]
+        copied["runcmd"][0].append("there")
+        assert ["echo", "hi"] == cfg["runcmd"][0]
+
+    def test_preserves_shared_and_recursive_references(self):
+        """Aliased objects stay aliased like copy.deepcopy."""
+        shared = {"key": "value"}
+        cfg = {"a": shared, "b": shared, "items": []}
+        cfg["items"].append(cfg["items"])
+        copied = util.copy_cfg(cfg)
+        assert copied["a"] is copied["b"]
+        assert copied["a"] is not shared
+        assert copied["items"][0] is copied["items"]
+
+    def test_other_types_fall_back_to_deepcopy(self):
+        """Sets, tuples and objects are deep copied."""
+        cfg = {"set": {1, 2}, "tuple": ([1], 2)}
+        copied = util.copy_cfg(cfg)
+        assert cfg == copied
+        assert cfg["set"] is not copied["set"]
+        assert cfg["tuple"][0] is not copied["tuple"][0]
+
+
 # vi: ts=4 expandtab
@@ -11,8 +11,12 @@
 import copy
 import json
 import os
+import queue
+import re
+import threading
 import time
 from email.utils import parsedate
+from http.cookiejar import DefaultCookiePolicy
 from errno import ENOENT
 from functools import partial
 from http.client import NOT_FOUND
@@ -33,17 +37,28 @@ SSL_ENABLED = False
 CONFIG_ENABLED = False  # This was added in 0.7 (but taken out in >=1.0)
 _REQ_VER = None
 REDACTED = 'REDACTED'
-try:
-    from distutils.version import LooseVersion
-    import pkg_resources
-    _REQ = pkg_resources.get_distribution('requests')
-    _REQ_VER = LooseVersion(_REQ.version)  # pylint: disable=no-member
-    if _REQ_VER >= LooseVersion('0.8.8'):
+
+
+def _version_tuple(version):
+    """Return the leading numeric components of a version string."""
+    parts = []
+    for part in str(version).split('.'):
+        digits = re.match(r'\d+', part)
+        if not digits:
+            break
+        parts.append(int(digits.group(0)))
+    return tuple(parts)
+
+
+# Read the version requests reports about itself rather than importing
+# pkg_resources and distutils, which cost more than the rest of the stage's
+# imports together.
+_REQ_VER = getattr(requests, '__version__', None)
+if _REQ_VER:
+    if _version_tuple(_REQ_VER) >= (0, 8, 8):
         SSL_ENABLED = True
-    if LooseVersion('0.7.0') <= _REQ_VER < LooseVersion('1.0.0'):
+    if (0, 7, 0) <= _version_tuple(_REQ_VER) < (1, 0, 0):
         CONFIG_ENABLED = True
-except ImportError:
-    pass
 
 
 def _cleanurl(url):
@@ -190,6 +205,76 @@ def _get_ssl_args(url, ssl_details):
     return ssl_args
 
 
+class SessionPool(object):
+    """Process-wide pool of keep-alive requests.Sessions, one per host.
+
+    Every readurl call without an explicit session shares the Session for
+    the scheme and host of its url, so metadata reads, retries and
+    wait_for_url probes reuse established TCP/TLS connections instead of
+    performing a new handshake per request. Cookies are never stored so
+    callers cannot observe state left behind by other callers.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url):
+        parsed = urlparse(url)
+        return (parsed.scheme, parsed.netloc)
+
+    def get(self, url):
+        """Return the shared requests.Session for the host of url."""
+        key = self._key(url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                session.cookies.set_policy(
+                    DefaultCookiePolicy(allowed_domains=[]))
+                self._sessions[key] = session
+            return session
+
+    def clear(self):
+        """Close and drop all pooled sessions and their connections."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+        for session in sessions:
+            session.close()
+
+    def stats(self):
+        """Return a dict of connection counters for the pooled sessions.
+
+        connections_opened counts TCP connections established and
+        connections_reused counts requests served on an already established
+        keep-alive connection.
+        """
+        opened = requests_made = 0
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            for adapter in session.adapters.values():
+                poolmanager = getattr(adapter, 'poolmanager', None)
+                if poolmanager is None:
+                    continue
+                for key in poolmanager.pools.keys():
+                    pool = poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    opened += getattr(pool, 'num_connections', 0)
+                    requests_made += getattr(pool, 'num_requests', 0)
+        return {'hosts': len(sessions),
+                'connections_opened': opened,
+                'connections_reused': max(requests_made - opened, 0)}
+
+
+# Shared by every readurl call which does not provide its own session.
+session_pool = SessionPool()
+
+
 def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
             headers=None, headers_cb=None, headers_redact=None,
             ssl_details=None, check_status=True, allow_redirects=True,
@@ -219,6 +304,8 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
     :param exception_cb: Optional callable which accepts the params
         msg and exception and returns a boolean True if retries are permitted.
     :param session: Optional exiting requests.Session instance to reuse.
+        When None, the session_pool's keep-alive Session for the url's host
+        is used, or a new Session when session_pool is disabled.
     :param infinite: Bool, set True to retry indefinitely. Default: False.
     :param log_req_resp: Set False to turn off verbose debug messages.
     :param request_method: String passed as 'method' to Session.request.
@@ -296,11 +383,13 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
                           "infinite" if infinite else manual_tries, url,
                           filtered_req_args)
 
-            if session is None:
-                session = requests.Session()
-
-            with session as sess:
-                r = sess.request(**req_args)
+            if session is None and session_pool.enabled:
+                r = session_pool.get(url).request(**req_args)
+            else:
+                if session is None:
+                    session = requests.Session()
+                with session as sess:
+                    r = sess.request(**req_args)
 
             if check_status:
                 r.raise_for_status()
@@ -343,7 +432,8 @@ def readurl(url, data=None, timeout=None, retries=0, sec_between=1,
 
 def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
                  headers_cb=None, headers_redact=None, sleep_time=1,
-                 exception_cb=None, sleep_time_cb=None, request_method=None):
+                 exception_cb=None, sleep_time_cb=None, request_method=None,
+                 race=False):
     """
     urls:      a list of urls to try
     max_wait:  roughly the maximum time to wait before giving up
@@ -360,6 +450,12 @@ def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
     sleep_time_cb: call method with 2 arguments (response, loop_n) that
                    generates the next sleep time.
     request_method: indicate the type of HTTP request, GET, PUT, or POST
+    race:      when True, all urls are requested concurrently on each pass
+               and the first healthy url is returned without waiting on the
+               others, so an unreachable url listed first does not delay a
+               working one by a full timeout. Requests still in flight are
+               abandoned. headers_cb, status_cb and exception_cb are all
+               called from the calling thread.
     returns: tuple of (url, response contents), on failure, (False, None)
 
     the idea of this routine is to wait for the EC2 metadata service to
@@ -392,6 +488,60 @@ def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
             return False
         return ((max_wait <= 0) or (time.time() - start_time > max_wait))
 
+    def read_url(url, url_headers_cb, timeout):
+        """Return (response, reason, url_exc) for one request to url."""
+        response = None
+        reason = ""
+        url_exc = None
+        try:
+            headers = url_headers_cb(url)
+            response = readurl(
+                url, headers=headers, headers_redact=headers_redact,
+                timeout=timeout, check_status=False,
+                request_method=request_method)
+            if not response.contents:
+                reason = "empty response [%s]" % (response.code)
+                url_exc = UrlError(ValueError(reason), code=response.code,
+                                   headers=response.headers, url=url)
+            elif not response.ok():
+                reason = "bad status code [%s]" % (response.code)
+                url_exc = UrlError(ValueError(reason), code=response.code,
+                                   headers=response.headers, url=url)
+        except UrlError as e:
+            reason = "request error [%s]" % e
+            url_exc = e
+        except Exception as e:
+            reason = "unexpected error [%s]" % e
+            url_exc = e
+        return response, reason, url_exc
+
+    def handle_url_failure(url, reason, url_exc):
+        time_taken = int(time.time() - start_time)
+        max_wait_str = "%ss" % max_wait if max_wait else "unlimited"
+        status_msg = "Calling '%s' failed [%s/%s]: %s" % (url,
+                                                          time_taken,
+                                                          max_wait_str,
+                                                          reason)
+        status_cb(status_msg)
+        if exception_cb:
+            # This can be used to alter the headers that will be sent
+            # in the future, for example this is what the MAAS datasource
+            # does.
+            exception_cb(msg=status_msg, exception=url_exc)
+
+    def get_headers(url):
+        if headers_cb is not None:
+            return headers_cb(url)
+        return {}
+
+    def shorten_timeout(timeout):
+        now = time.time()
+        if (max_wait is not None and
+                timeout and (now + timeout > (start_time + max_wait))):
+            # shorten timeout to not run way over max_time
+            timeout = int((start_time + max_wait) - now)
+        return timeout
+
     loop_n = 0
     response = None
     while True:
@@ -399,57 +549,46 @@ def wait_for_url(urls, max_wait=None, timeout=None, status_cb=None,
             sleep_time = sleep_time_cb(response, loop_n)
         else:
             sleep_time = int(loop_n / 5) + 1
-        for url in urls:
-            now = time.time()
+        if race:
             if loop_n != 0:
                 if timeup(max_wait, start_time):
                     break
-                if (max_wait is not None and
-                        timeout and (now + timeout > (start_time + max_wait))):
-                    # shorten timeout to not run way over max_time
-                    timeout = int((start_time + max_wait) - now)
-
-            reason = ""
-            url_exc = None
-            try:
-                if headers_cb is not None:
-                    headers = headers_cb(url)
-                else:
-                    headers = {}
-
-                response = readurl(
-                    url, headers=headers, headers_redact=headers_redact,
-                    timeout=timeout, check_status=False,
-                    request_method=request_method)
-                if not response.contents:
-                    reason = "empty response [%s]" % (response.code)
-                    url_exc = UrlError(ValueError(reason), code=response.code,
-                                       headers=response.headers, url=url)
-                elif not response.ok():
-                    reason = "bad status code [%s]" % (response.code)
-                    url_exc = UrlError(ValueError(reason), code=response.code,
-                                       headers=response.headers, url=url)
-                else:
+                timeout = shorten_timeout(timeout)
+            results = queue.Queue()
+
+            def race_url(url, headers, timeout):
+                results.put(
+                    (url,) + read_url(url, lambda _url: headers, timeout))
+
+            started = 0
+            for url in urls:
+                try:
+                    headers = get_headers(url)
+                except Exception as e:
+                    handle_url_failure(url, "unexpected error [%s]" % e, e)
+                    continue
+                # Daemon threads so abandoned requests never delay exit
+                thread = threading.Thread(
+                    target=race_url, args=(url, headers, timeout))
+                thread.daemon = True
+                thread.start()
+                started += 1
+            for _ in range(started):
+                (url, response, reason, url_exc) = results.get()
+                if url_exc is None:
+                    return url, response.contents
+                handle_url_failure(url, reason, url_exc)
+        else:
+            for url in urls:
+                if loop_n != 0:
+                    if timeup(max_wait, start_time):
+                        break
+                    timeout = shorten_timeout(timeout)
+                (response, reason, url_exc) = read_url(
+                    url, get_headers, timeout)
+                if url_exc is None:
                     return url, response.contents
-            except UrlError as e:
-                reason = "request error [%s]" % e
-                url_exc = e
-            except Exception as e:
-                reason = "unexpected error [%s]" % e
-                url_exc = e
-
-            time_taken = int(time.time() - start_time)
-            max_wait_str = "%ss" % max_wait if max_wait else "unlimited"
-            status_msg = "Calling '%s' failed [%s/%s]: %s" % (url,
-                                                              time_taken,
-                                                              max_wait_str,
-                                                              reason)
-            status_cb(status_msg)
-            if exception_cb:
-                # This can be used to alter the headers that will be sent
-                # in the future, for example this is what the MAAS datasource
-                # does.
-                exception_cb(msg=status_msg, exception=url_exc)
+                handle_url_failure(url, reason, url_exc)
 
         if timeup(max_wait, start_time):
             break
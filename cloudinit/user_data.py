@@ -9,6 +9,7 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 import os
+from concurrent import futures
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.nonmultipart import MIMENonMultipart
@@ -17,7 +18,7 @@ from email.mime.text import MIMEText
 from cloudinit import handlers
 from cloudinit import log as logging
 from cloudinit import features
-from cloudinit.url_helper import read_file_or_url, UrlError
+from cloudinit.url_helper import read_file_or_url, StringResponse, UrlError
 from cloudinit import util
 
 LOG = logging.getLogger(__name__)
@@ -77,9 +78,21 @@ def _handle_error(error_message, source_exception=None):
 
 
 class UserDataProcessor(object):
-    def __init__(self, paths):
+    # Defaults for processors unpickled from older versions
+    max_workers = 1
+    cache_includes = False
+
+    def __init__(self, paths, max_workers=1, cache_includes=False):
+        """
+        :param max_workers: number of urls of an include part fetched
+            concurrently.
+        :param cache_includes: keep the content of #include urls on disk and
+            revalidate it with the server instead of downloading it again.
+        """
         self.paths = paths
         self.ssl_details = util.fetch_ssl_details(paths)
+        self.max_workers = max_workers
+        self.cache_includes = cache_includes
 
     def process(self, blob):
         accumulating_msg = MIMEMultipart()
@@ -204,11 +217,16 @@ class UserDataProcessor(object):
             _set_filename(msg, PART_FN_TPL % (attached_id))
         self._attach_launch_index(msg)
 
-    def _do_include(self, content, append_msg):
+    def _get_include_cache_dir(self):
+        return os.path.join(self.paths.get_cpath('data'), 'include-cache')
+
+    def _include_urls(self, content):
+        """Return a list of (url, include_once) for include content."""
         # Include a list of urls, one per line
         # also support '#include <url here>'
         # or #include-once '<url here>'
         include_once_on = False
+        urls = []
         for line in content.splitlines():
             lc_line = line.lower()
             if lc_line.startswith("#include-once"):
@@ -227,44 +245,111 @@ class UserDataProcessor(object):
             include_url = line.strip()
             if not include_url:
                 continue
+            urls.append((include_url, include_once_on))
+        return urls
 
-            include_once_fn = None
-            content = None
-            if include_once_on:
-                include_once_fn = self._get_include_once_filename(include_url)
-            if include_once_on and os.path.isfile(include_once_fn):
-                content = util.load_file(include_once_fn)
-            else:
-                try:
-                    resp = read_file_or_url(include_url, timeout=5, retries=10,
-                                            ssl_details=self.ssl_details)
-                    if include_once_on and resp.ok():
-                        util.write_file(include_once_fn, resp.contents,
-                                        mode=0o600)
-                    if resp.ok():
-                        content = resp.contents
-                    else:
-                        error_message = (
-                            "Fetching from {} resulted in"
-                            " a invalid http code of {}".format(
-                                include_url, resp.code))
-                        _handle_error(error_message)
-                except UrlError as urle:
-                    message = str(urle)
-                    # Older versions of requests.exceptions.HTTPError may not
-                    # include the errant url. Append it for clarity in logs.
-                    if include_url not in message:
-                        message += ' for url: {0}'.format(include_url)
-                    _handle_error(message, urle)
-                except IOError as ioe:
-                    error_message = "Fetching from {} resulted in {}".format(
-                        include_url, ioe)
-                    _handle_error(error_message, ioe)
-
+    def _do_include(self, content, append_msg):
+        for content in self._fetch_includes(self._include_urls(content)):
             if content is not None:
                 new_msg = convert_string(content)
                 self._process_msg(new_msg, append_msg)
 
+    def _fetch_includes(self, includes):
+        """Return an iterator over the content of each include, in order.
+
+        With max_workers greater than 1 all urls are fetched concurrently
+        before the first content is returned. Errors are still raised when
+        the iterator reaches the failing include, so the includes before it
+        are processed as they would be when fetching one url at a time.
+        """
+        if self.max_workers <= 1 or len(includes) < 2:
+            return (self._fetch_include(url, include_once)
+                    for (url, include_once) in includes)
+        with futures.ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(includes))) as executor:
+            return executor.map(
+                lambda include: self._fetch_include(*include), includes)
+
+    def _fetch_include(self, include_url, include_once_on):
+        """Return the content of include_url or None when it failed."""
+        include_once_fn = None
+        if include_once_on:
+            include_once_fn = self._get_include_once_filename(include_url)
+        if include_once_on and os.path.isfile(include_once_fn):
+            return util.load_file(include_once_fn)
+        try:
+            if self.cache_includes and not include_once_on:
+                resp = self._read_include_cached(include_url)
+            else:
+                resp = read_file_or_url(include_url, timeout=5, retries=10,
+                                        ssl_details=self.ssl_details)
+            if include_once_on and resp.ok():
+                util.write_file(include_once_fn, resp.contents, mode=0o600)
+            if resp.ok():
+                return resp.contents
+            error_message = (
+                "Fetching from {} resulted in"
+                " a invalid http code of {}".format(include_url, resp.code))
+            _handle_error(error_message)
+        except UrlError as urle:
+            message = str(urle)
+            # Older versions of requests.exceptions.HTTPError may not
+            # include the errant url. Append it for clarity in logs.
+            if include_url not in message:
+                message += ' for url: {0}'.format(include_url)
+            _handle_error(message, urle)
+        except IOError as ioe:
+            error_message = "Fetching from {} resulted in {}".format(
+                include_url, ioe)
+            _handle_error(error_message, ioe)
+        return None
+
+    def _read_include_cached(self, include_url):
+        """Read include_url, revalidating content cached by an earlier read.
+
+        The cache keeps, per url, the ETag and Last-Modified headers the
+        content was served with and the sha256 of the content, which is
+        stored once in objects/ however many urls serve it. A 304 response
+        to a conditional request is answered from the stored content.
+        """
+        if not include_url.lower().startswith(('http://', 'https://')):
+            return read_file_or_url(include_url, timeout=5, retries=10,
+                                    ssl_details=self.ssl_details)
+        cache_dir = self._get_include_cache_dir()
+        index_fn = os.path.join(
+            cache_dir, util.hash_blob(include_url, 'sha256') + '.json')
+        headers = {}
+        object_fn = None
+        try:
+            entry = util.load_json(util.load_file(index_fn, decode=False))
+            object_fn = os.path.join(cache_dir, 'objects', entry['sha256'])
+        except (IOError, KeyError, TypeError, ValueError):
+            entry = {}
+        if object_fn and os.path.isfile(object_fn):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last-modified'):
+                headers['If-Modified-Since'] = entry['last-modified']
+        resp = read_file_or_url(include_url, timeout=5, retries=10,
+                                ssl_details=self.ssl_details, headers=headers)
+        if resp.code == 304 and headers:
+            LOG.debug("Using cached content for include %s", include_url)
+            return StringResponse(util.load_file(object_fn, decode=False))
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        if resp.ok() and (etag or last_modified):
+            digest = util.hash_blob(resp.contents, 'sha256')
+            object_fn = os.path.join(cache_dir, 'objects', digest)
+            try:
+                if not os.path.isfile(object_fn):
+                    util.write_file(object_fn, resp.contents, mode=0o600)
+                util.write_file(index_fn, util.json_dumps(
+                    {'url': include_url, 'sha256': digest, 'etag': etag,
+                     'last-modified': last_modified}), mode=0o600)
+            except (IOError, OSError) as e:
+                LOG.debug("Failed caching include %s: %s", include_url, e)
+        return resp
+
     def _explode_archive(self, archive, append_msg):
         entries = util.load_yaml(archive, default=[], allowed=(list, set))
         for ent in entries:
@@ -36,6 +36,7 @@ from errno import ENOENT
 from functools import lru_cache
 from urllib import parse
 
+from cloudinit import boot_facts
 from cloudinit import importer
 from cloudinit import log as logging
 from cloudinit import subp
@@ -67,6 +68,7 @@ def kernel_version():
 
 
 @lru_cache()
+@boot_facts.boot_fact('dpkg_architecture')
 def get_dpkg_architecture(target=None):
     """Return the sanitized string output by `dpkg --print-architecture`.
 
@@ -429,6 +431,19 @@ def get_cfg_option_int(yobj, key, default=0):
     return int(get_cfg_option_str(yobj, key, default=default))
 
 
+def get_cfg_option_max_workers(yobj, key, default=1):
+    """Return the worker count set by key in yobj, at least 1.
+
+    A value which is not an int is logged and default is returned.
+    """
+    try:
+        return max(1, get_cfg_option_int(yobj, key, default=default))
+    except (TypeError, ValueError):
+        LOG.warning("Config %s '%s' is not an int, using default '%s'",
+                    key, yobj.get(key), default)
+        return default
+
+
 def _parse_redhat_release(release_file=None):
     """Return a dictionary of distro info fields from /etc/redhat-release.
 
@@ -456,6 +471,7 @@ def _parse_redhat_release(release_file=None):
 
 
 @lru_cache()
+@boot_facts.boot_fact('linux_distro', decode=tuple)
 def get_linux_distro():
     distro_name = ''
     distro_version = ''
@@ -506,7 +522,12 @@ def get_linux_distro():
     return (distro_name, distro_version, flavor)
 
 
+def _decode_system_info(info):
+    return dict(info, dist=tuple(info['dist']))
+
+
 @lru_cache()
+@boot_facts.boot_fact('system_info', decode=_decode_system_info)
 def system_info():
     info = {
         'platform': platform.platform(),
@@ -699,6 +720,40 @@ def mergemanydict(srcs, reverse=False):
     return merged_cfg
 
 
+_COPY_CFG_ATOMIC_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def copy_cfg(cfg, memo=None):
+    """Return a deep copy of a config object.
+
+    Config loaded from yaml or json is made of dicts, lists and scalars.
+    Those are copied directly, which is considerably faster than
+    copy.deepcopy, while any other type falls back to copy.deepcopy. Shared
+    and recursive references are preserved like copy.deepcopy does.
+    """
+    if memo is None:
+        memo = {}
+    cfg_type = type(cfg)
+    if cfg_type in _COPY_CFG_ATOMIC_TYPES:
+        return cfg
+    if cfg_type is not dict and cfg_type is not list:
+        return obj_copy.deepcopy(cfg, memo)
+    cfg_id = id(cfg)
+    if cfg_id in memo:
+        return memo[cfg_id]
+    if cfg_type is dict:
+        copied = {}
+        memo[cfg_id] = copied
+        for key, value in cfg.items():
+            copied[key] = copy_cfg(value, memo)
+    else:
+        copied = []
+        memo[cfg_id] = copied
+        for value in cfg:
+            copied.append(copy_cfg(value, memo))
+    return copied
+
+
 @contextlib.contextmanager
 def chdir(ndir):
     curr = os.getcwd()
@@ -848,7 +903,11 @@ def read_seeded(base="", ext="", timeout=5, retries=10, file_retries=0):
     return (md, ud, vd)
 
 
-def read_conf_d(confd):
+def read_conf_d(confd, sources=None):
+    """Return the merged config of the .cfg files in confd.
+
+    @param sources: Optional list the paths read are appended to.
+    """
     # Get reverse sorted list (later trumps newer)
     confs = sorted(os.listdir(confd), reverse=True)
 
@@ -863,12 +922,22 @@ def read_conf_d(confd):
     cfgs = []
     for fn in confs:
         cfgs.append(read_conf(os.path.join(confd, fn)))
+    if sources is not None:
+        sources.append(confd)
+        sources.extend(os.path.join(confd, fn) for fn in confs)
 
     return mergemanydict(cfgs)
 
 
-def read_conf_with_confd(cfgfile):
+def read_conf_with_confd(cfgfile, sources=None):
+    """Return the config of cfgfile merged with that of its conf.d.
+
+    @param sources: Optional list the paths read or looked for are appended
+        to.
+    """
     cfg = read_conf(cfgfile)
+    if sources is not None:
+        sources.append(cfgfile)
 
     confd = False
     if "conf_d" in cfg:
@@ -882,12 +951,16 @@ def read_conf_with_confd(cfgfile):
                 confd = str(confd).strip()
     elif os.path.isdir("%s.d" % cfgfile):
         confd = "%s.d" % cfgfile
+    elif sources is not None:
+        sources.append("%s.d" % cfgfile)
 
     if not confd or not os.path.isdir(confd):
+        if confd and sources is not None:
+            sources.append(confd)
         return cfg
 
     # Conf.d settings override input configuration
-    confd_cfg = read_conf_d(confd)
+    confd_cfg = read_conf_d(confd, sources)
     return mergemanydict([confd_cfg, cfg])
 
 
@@ -1955,6 +2028,7 @@ def _is_container_freebsd():
 
 
 @lru_cache()
+@boot_facts.boot_fact('is_container')
 def is_container():
     """
     Checks to see if this code running in a container of some sort
@@ -157,6 +157,49 @@ def disable_subp_usage(request, fixture_utils):
         yield
 
 
+@pytest.yield_fixture(autouse=True)
+def reset_url_session_pool():
+    """
+    Drop pooled keep-alive HTTP sessions after every test.
+
+    ``url_helper.session_pool`` is process-wide, so connections opened while
+    one test had HTTPretty (or a mocked ``requests.Session``) in place must
+    not be reused by the next test.
+    """
+    yield
+    from cloudinit import url_helper
+
+    url_helper.session_pool.clear()
+
+
+@pytest.yield_fixture(autouse=True)
+def reset_boot_facts():
+    """
+    Disable the cross-stage boot facts cache after every test.
+
+    Tests running cloud-init stages enable it; cached probe results must not
+    leak into tests that mock the probes.
+    """
+    yield
+    from cloudinit import boot_facts
+
+    boot_facts.boot_facts.clear()
+
+
+@pytest.yield_fixture(autouse=True)
+def reset_net_device_snapshot():
+    """
+    Stop using a network device snapshot after every test.
+
+    Tests running cloud-init stages may enable it; snapshotted sysfs state
+    must not leak into tests that mock sysfs reads.
+    """
+    yield
+    from cloudinit import net
+
+    net.clear_device_snapshot()
+
+
 @pytest.fixture(scope="session")
 def fixture_utils():
     """Return a namespace containing fixture utility functions.
@@ -18,6 +18,7 @@ import tempfile
 import platform
 
 import setuptools
+from setuptools.command.build_py import build_py
 from setuptools.command.install import install
 from setuptools.command.egg_info import egg_info
 
@@ -195,6 +196,21 @@ class MyEggInfo(egg_info):
         return ret
 
 
+class MyBuildPy(build_py):
+    """Also write the index of config modules and datasources."""
+
+    def run(self):
+        build_py.run(self)
+        if self.dry_run:
+            return
+        from cloudinit import importer
+        index_file = os.path.join(
+            self.build_lib, 'cloudinit',
+            os.path.basename(importer.MODULE_INDEX_FILE))
+        importer.write_module_index(
+            index_file, os.path.join(self.build_lib, 'cloudinit'))
+
+
 # TODO: Is there a better way to do this??
 class InitsysInstallData(install):
     init_system = None
@@ -269,6 +285,7 @@ if not platform.system().endswith('BSD'):
 # Use a subclass for install that handles
 # adding on the right init system configuration files
 cmdclass = {
+    'build_py': MyBuildPy,
     'install': InitsysInstallData,
     'egg_info': MyEggInfo,
 }
@@ -4,6 +4,7 @@ import os
 import io
 from collections import namedtuple
 
+from cloudinit import helpers
 from cloudinit.cmd import main as cli
 from cloudinit.tests import helpers as test_helpers
 from cloudinit.util import load_file, load_json
@@ -25,7 +26,9 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
         if not sysv_args:
             sysv_args = ['cloud-init']
         try:
-            return cli.main(sysv_args=sysv_args)
+            # Leave the system's config cache alone
+            with mock.patch.object(cli, 'apply_config_cache'):
+                return cli.main(sysv_args=sysv_args)
         except SystemExit as e:
             return e.code
 
@@ -270,4 +273,53 @@ class TestCLI(test_helpers.FilesystemMockingTestCase):
         self.assertFalse(parseargs.debug)
         self.assertFalse(parseargs.force)
 
+    @mock.patch('cloudinit.cmd.main.url_helper.session_pool')
+    def test_apply_url_session_cfg(self, m_pool):
+        """url_session_pool config toggles the shared HTTP session pool."""
+        cli.apply_url_session_cfg({})
+        self.assertTrue(m_pool.enabled)
+        cli.apply_url_session_cfg({'url_session_pool': False})
+        self.assertFalse(m_pool.enabled)
+        cli.apply_url_session_cfg({'url_session_pool': True})
+        self.assertTrue(m_pool.enabled)
+
+    @mock.patch('cloudinit.cmd.main.config_cache.config_cache')
+    def test_apply_config_cache(self, m_cache):
+        """Only root shares parsed config files through the config cache."""
+        with mock.patch('cloudinit.cmd.main.os.getuid', return_value=1000):
+            cli.apply_config_cache()
+        m_cache.clear.assert_called_once_with()
+        with mock.patch('cloudinit.cmd.main.os.getuid', return_value=0):
+            cli.apply_config_cache()
+        m_cache.load.assert_called_once_with(
+            cli.config_cache.CONFIG_CACHE_FILE)
+
+    @mock.patch('cloudinit.cmd.main.boot_facts.boot_facts')
+    def test_apply_boot_facts_cfg(self, m_facts):
+        """boot_facts_cache config toggles the cross-stage facts cache."""
+        paths = helpers.Paths({'run_dir': self.tmp_dir()})
+        cli.apply_boot_facts_cfg({}, paths)
+        m_facts.load.assert_called_once_with(
+            paths.get_runpath('boot_facts'))
+        cli.apply_boot_facts_cfg({'boot_facts_cache': False}, paths)
+        m_facts.clear.assert_called_once_with()
+
+    @mock.patch('cloudinit.cmd.main.net')
+    def test_apply_net_snapshot_cfg(self, m_net):
+        """net_device_snapshot config enables a per-stage device snapshot."""
+        cli.apply_net_snapshot_cfg({})
+        m_net.clear_device_snapshot.assert_called_once_with()
+        cli.apply_net_snapshot_cfg({'net_device_snapshot': True})
+        m_net.refresh_device_snapshot.assert_called_once_with()
+
+    @mock.patch('cloudinit.cmd.main.templater.set_jinja_bytecode_cache')
+    def test_apply_jinja_cache_cfg(self, m_set_cache):
+        """jinja_bytecode_cache config enables the on-disk template cache."""
+        paths = helpers.Paths({'cloud_dir': self.tmp_dir()})
+        cli.apply_jinja_cache_cfg({}, paths)
+        cli.apply_jinja_cache_cfg({'jinja_bytecode_cache': True}, paths)
+        self.assertEqual(
+            [mock.call(None), mock.call(paths.get_cpath('jinja_cache'))],
+            m_set_cache.call_args_list)
+
 # : ts=4 expandtab
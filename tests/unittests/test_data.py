@@ -679,6 +679,65 @@ class TestConsumeUserDataHttp(TestConsumeUserData, helpers.HttprettyTestCase):
         self.assertTrue(cc.get('included'))
 
 
+class TestUDProcessIncludes(helpers.HttprettyTestCase):
+
+    def setUp(self):
+        super(TestUDProcessIncludes, self).setUp()
+        self.paths = c_helpers.Paths({'cloud_dir': self.tmp_dir()})
+        self.urls = ['http://hostname/%d' % idx for idx in range(3)]
+        for (idx, url) in enumerate(self.urls):
+            httpretty.register_uri(
+                httpretty.GET, url, '#cloud-config\nidx: %d\n' % idx)
+
+    def _included_idx(self, message):
+        return [util.load_yaml(part.get_payload(decode=True))['idx']
+                for part in message.walk() if not ud.is_skippable(part)]
+
+    def test_include_with_max_workers_keeps_order(self):
+        """Concurrently fetched includes are attached in order."""
+        ud_proc = ud.UserDataProcessor(self.paths, max_workers=3)
+        message = ud_proc.process('#include\n%s\n' % '\n'.join(self.urls))
+        self.assertEqual([0, 1, 2], self._included_idx(message))
+
+    @mock.patch('cloudinit.url_helper.time.sleep')
+    def test_include_with_max_workers_raises_in_order(self, m_sleep):
+        """A failing include raises after the includes before it."""
+        bad_url = 'http://bad/forbidden'
+        httpretty.register_uri(httpretty.GET, bad_url, 'bad', status=403)
+        ud_proc = ud.UserDataProcessor(self.paths, max_workers=3)
+        with mock.patch.object(ud_proc, '_process_msg',
+                               wraps=ud_proc._process_msg) as m_process:
+            with self.assertRaises(Exception) as context:
+                ud_proc.process('#include\n%s\n%s\n%s\n' % (
+                    self.urls[0], bad_url, self.urls[1]))
+        self.assertIn('403', str(context.exception))
+        # The user-data and the first include were processed
+        self.assertEqual(2, m_process.call_count)
+
+    def test_include_cache_revalidates_content(self):
+        """Cached includes are revalidated and reused on 304."""
+        url = 'http://hostname/cached'
+        httpretty.register_uri(
+            httpretty.GET, url, responses=[
+                httpretty.Response('#cloud-config\nidx: 7\n',
+                                   adding_headers={'ETag': '"v1"'}),
+                httpretty.Response('', status=304)])
+        ud_proc = ud.UserDataProcessor(self.paths, cache_includes=True)
+        blob = '#include\n%s\n' % url
+        self.assertEqual([7], self._included_idx(ud_proc.process(blob)))
+        self.assertIsNone(
+            httpretty.last_request().headers.get('If-None-Match'))
+        self.assertEqual([7], self._included_idx(ud_proc.process(blob)))
+        self.assertEqual(
+            '"v1"', httpretty.last_request().headers.get('If-None-Match'))
+
+    def test_include_cache_disabled_by_default(self):
+        """Without cache_includes nothing is written to the cache."""
+        ud_proc = ud.UserDataProcessor(self.paths)
+        ud_proc.process('#include\n%s\n' % self.urls[0])
+        self.assertFalse(os.path.exists(ud_proc._get_include_cache_dir()))
+
+
 class TestUDProcess(helpers.ResourceUsingTestCase):
 
     def test_bytes_in_userdata(self):
@@ -657,6 +657,33 @@ class TestEc2(test_helpers.HttprettyTestCase):
         ret = ds.get_data()
         self.assertTrue(ret)
 
+    def test_crawl_with_max_workers_matches_sequential_crawl(self):
+        """Configured max_workers crawls IMDS to the same metadata."""
+        ds = self._setup_ds(
+            platform_data=self.valid_platform_data,
+            sys_cfg={'datasource': {'Ec2': {'strict_id': False}}},
+            md={'md': DEFAULT_METADATA})
+        self.assertTrue(ds.get_data())
+        sequential = ds.metadata
+        ds = self._setup_ds(
+            platform_data=self.valid_platform_data,
+            sys_cfg={'datasource': {'Ec2': {'strict_id': False,
+                                            'max_workers': 8}}},
+            md={'md': DEFAULT_METADATA})
+        self.assertEqual(8, ds.get_crawl_max_workers())
+        self.assertTrue(ds.get_data())
+        self.assertEqual(sequential, ds.metadata)
+
+    def test_crawl_max_workers_invalid_uses_default(self):
+        """Invalid max_workers config logs and falls back to default."""
+        ds = self._setup_ds(
+            platform_data=self.valid_platform_data,
+            sys_cfg={'datasource': {'Ec2': {'max_workers': 'many'}}},
+            md=None)
+        self.assertEqual(1, ds.get_crawl_max_workers())
+        self.assertIn(
+            "Config max_workers 'many' is not an int", self.logs.getvalue())
+
     def test_unknown_platform_with_strict_true(self):
         """Unknown platform data with strict_id true should return False."""
         uuid = 'ab439480-72bf-11d3-91fc-b8aded755F9a'
@@ -83,6 +83,18 @@ def _set_mock_metadata(gce_meta=None):
     httpretty.register_uri(httpretty.GET, MD_URL_RE, body=_request_callback)
 
 
+def _recursive_metadata(gce_meta):
+    """Return gce_meta as the trees served for instance/ and project/."""
+    trees = {'instance': {}, 'project': {}}
+    for path, value in gce_meta.items():
+        (tree, key) = path.split('/', 1)
+        if key == 'id':
+            # the recursive listing has the numeric instance id
+            value = int(value)
+        trees[tree][key] = value
+    return trees
+
+
 @httpretty.activate
 class TestDataSourceGCE(test_helpers.HttprettyTestCase):
 
@@ -97,7 +109,7 @@ class TestDataSourceGCE(test_helpers.HttprettyTestCase):
         return distro
 
     def setUp(self):
-        tmp = self.tmp_dir()
+        tmp = self.tmp = self.tmp_dir()
         self.ds = DataSourceGCE.DataSourceGCE(
             settings.CFG_BUILTIN, None,
             helpers.Paths({'run_dir': tmp}))
@@ -297,6 +309,47 @@ class TestDataSourceGCE(test_helpers.HttprettyTestCase):
         self.assertEqual(True, r)
         self.assertEqual('bar', self.ds.availability_zone)
 
+    def _enable_recursive_fetch(self):
+        self.ds.ds_cfg['recursive_fetch'] = True
+
+    def test_recursive_fetch_matches_per_path_metadata(self):
+        """recursive_fetch derives the same metadata from two requests."""
+        _set_mock_metadata(GCE_META_ENCODING)
+        self.ds.get_data()
+        expected = (self.ds.metadata, self.ds.get_userdata_raw())
+        httpretty.reset()
+
+        _set_mock_metadata(_recursive_metadata(GCE_META_ENCODING))
+        self.ds = DataSourceGCE.DataSourceGCE(
+            settings.CFG_BUILTIN, None, helpers.Paths({'run_dir': self.tmp}))
+        self._enable_recursive_fetch()
+        self.assertTrue(self.ds.get_data())
+        self.assertEqual(
+            expected, (self.ds.metadata, self.ds.get_userdata_raw()))
+        self.assertCountEqual(
+            ['/computeMetadata/v1/instance/', '/computeMetadata/v1/project/'],
+            [urlparse(r.path).path for r in httpretty.latest_requests()])
+
+    def test_recursive_fetch_missing_required_keys_return_false(self):
+        """recursive_fetch fails like the per-path fetch without id/zone."""
+        self._enable_recursive_fetch()
+        for required_key in ['instance/id', 'instance/zone',
+                             'instance/hostname']:
+            meta = GCE_META_PARTIAL.copy()
+            del meta[required_key]
+            _set_mock_metadata(_recursive_metadata(meta))
+            self.assertEqual(False, self.ds.get_data())
+            httpretty.reset()
+
+    def test_recursive_fetch_project_ssh_keys(self):
+        """Project attributes are read from the project tree."""
+        self._enable_recursive_fetch()
+        meta = GCE_META.copy()
+        meta['project/attributes'] = {'ssh-keys': 'cloudinit:ssh-rsa AAAA'}
+        _set_mock_metadata(_recursive_metadata(meta))
+        self.assertTrue(self.ds.get_data())
+        self.assertEqual(['ssh-rsa AAAA'], self.ds.get_public_ssh_keys())
+
     @mock.patch("cloudinit.sources.DataSourceGCE.GoogleMetadataFetcher")
     def test_get_data_returns_false_if_not_on_gce(self, m_fetcher):
         self.m_platform_reports_gce.return_value = False
@@ -304,6 +357,12 @@ class TestDataSourceGCE(test_helpers.HttprettyTestCase):
         self.assertEqual(False, ret)
         m_fetcher.assert_not_called()
 
+    def test_is_platform_viable_reports_gce(self):
+        """_is_platform_viable is the dmi platform check."""
+        self.assertTrue(self.ds._is_platform_viable())
+        self.m_platform_reports_gce.return_value = False
+        self.assertFalse(self.ds._is_platform_viable())
+
     def test_has_expired(self):
 
         def _get_timestamp(days):
@@ -125,8 +125,9 @@ def _register_uris(version, ec2_files, ec2_meta, os_files):
                     body=get_request_callback)
 
 
-def _read_metadata_service():
-    return ds.read_metadata_service(BASE_URL, retries=0, timeout=0.1)
+def _read_metadata_service(max_workers=None):
+    return ds.read_metadata_service(BASE_URL, retries=0, timeout=0.1,
+                                    max_workers=max_workers)
 
 
 class TestOpenStackDataSource(test_helpers.HttprettyTestCase):
@@ -159,6 +160,12 @@ class TestOpenStackDataSource(test_helpers.HttprettyTestCase):
         self.assertEqual('b0fa911b-69d4-4476-bbe2-1c92bff6535c',
                          metadata.get('instance-id'))
 
+    def test_successful_with_max_workers(self):
+        """Concurrent reads return the same results as sequential ones."""
+        _register_uris(self.VERSION, EC2_FILES, EC2_META, OS_FILES)
+        self.assertEqual(
+            _read_metadata_service(), _read_metadata_service(max_workers=4))
+
     def test_no_ec2(self):
         _register_uris(self.VERSION, {}, {}, OS_FILES)
         f = _read_metadata_service()
@@ -176,6 +183,8 @@ class TestOpenStackDataSource(test_helpers.HttprettyTestCase):
                 os_files.pop(k, None)
         _register_uris(self.VERSION, {}, {}, os_files)
         self.assertRaises(openstack.NonReadable, _read_metadata_service)
+        self.assertRaises(
+            openstack.NonReadable, _read_metadata_service, max_workers=4)
 
     def test_bad_uuid(self):
         os_files = copy.deepcopy(OS_FILES)
@@ -217,6 +226,8 @@ class TestOpenStackDataSource(test_helpers.HttprettyTestCase):
                 os_files[k] = '{'  # some invalid json
         _register_uris(self.VERSION, {}, {}, os_files)
         self.assertRaises(BrokenMetadata, _read_metadata_service)
+        self.assertRaises(
+            BrokenMetadata, _read_metadata_service, max_workers=4)
 
     def test_metadata_invalid(self):
         os_files = copy.deepcopy(OS_FILES)
@@ -226,6 +237,21 @@ class TestOpenStackDataSource(test_helpers.HttprettyTestCase):
         _register_uris(self.VERSION, {}, {}, os_files)
         self.assertRaises(BrokenMetadata, _read_metadata_service)
 
+    def test_crawl_uses_configured_max_workers(self):
+        """The datasource passes max_workers from ds_cfg to the reader."""
+        _register_uris(self.VERSION, EC2_FILES, EC2_META, OS_FILES)
+        ds_os = ds.DataSourceOpenStack(
+            settings.CFG_BUILTIN, None, helpers.Paths({'run_dir': self.tmp}))
+        ds_os.ds_cfg = {'max_workers': 4}
+        with test_helpers.mock.patch(
+                MOCK_PATH + 'read_metadata_service',
+                wraps=ds.read_metadata_service) as m_read:
+            with test_helpers.mock.patch(MOCK_PATH + 'detect_openstack',
+                                         return_value=True):
+                self.assertTrue(ds_os.get_data())
+        self.assertEqual(4, m_read.call_args[1]['max_workers'])
+        self.assertEqual(EC2_META, ds_os.ec2_metadata)
+
     @test_helpers.mock.patch('cloudinit.net.dhcp.maybe_perform_dhcp_discovery')
     def test_datasource(self, m_dhcp):
         _register_uris(self.VERSION, EC2_FILES, EC2_META, OS_FILES)
@@ -363,6 +389,23 @@ class TestOpenStackDataSource(test_helpers.HttprettyTestCase):
             self.assertEqual(example_cfg, ds_os.network_config)
         m_convert_json.assert_not_called()
 
+    def test_wait_for_metadata_service_races_urls_when_configured(self):
+        """race_metadata_urls config is passed through to wait_for_url."""
+        ds_os = ds.DataSourceOpenStack(
+            settings.CFG_BUILTIN, None, helpers.Paths({'run_dir': self.tmp}))
+        ds_os.ds_cfg = {
+            'metadata_urls': ['http://1.2.3.4', 'http://5.6.7.8'],
+            'race_metadata_urls': True}
+        mock_path = MOCK_PATH + 'url_helper.wait_for_url'
+        with test_helpers.mock.patch(mock_path) as m_wait:
+            m_wait.return_value = ('http://5.6.7.8/openstack', b'ok')
+            self.assertTrue(ds_os.wait_for_metadata_service())
+        self.assertEqual('http://5.6.7.8', ds_os.metadata_address)
+        self.assertTrue(m_wait.call_args[1]['race'])
+        self.assertEqual(
+            ['http://1.2.3.4/openstack', 'http://5.6.7.8/openstack'],
+            m_wait.call_args[1]['urls'])
+
     def test_disabled_datasource(self):
         os_files = copy.deepcopy(OS_FILES)
         os_meta = copy.deepcopy(OSTACK_META)
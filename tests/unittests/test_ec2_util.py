@@ -176,4 +176,97 @@ class TestEc2Util(helpers.HttprettyTestCase):
         self.assertEqual(iam['info']['LastUpdated'], '2016-10-27T17:29:39Z')
         self.assertNotIn('security-credentials', iam)
 
+    def test_metadata_fetch_bdm_with_max_workers(self):
+        """Concurrent crawls return the same tree as sequential crawls."""
+        base_url = 'http://169.254.169.254/%s/meta-data/' % (self.VERSION)
+        hp.register_uri(hp.GET, base_url, status=200,
+                        body="\n".join(['hostname',
+                                        'instance-id',
+                                        'block-device-mapping/']))
+        hp.register_uri(hp.GET, uh.combine_url(base_url, 'hostname'),
+                        status=200, body='ec2.fake.host.name.com')
+        hp.register_uri(hp.GET, uh.combine_url(base_url, 'instance-id'),
+                        status=200, body='123')
+        hp.register_uri(hp.GET,
+                        uh.combine_url(base_url, 'block-device-mapping/'),
+                        status=200,
+                        body="\n".join(['ami', 'ephemeral0']))
+        hp.register_uri(hp.GET,
+                        uh.combine_url(base_url, 'block-device-mapping/ami'),
+                        status=200,
+                        body="sdb")
+        hp.register_uri(hp.GET,
+                        uh.combine_url(base_url,
+                                       'block-device-mapping/ephemeral0'),
+                        status=200,
+                        body="sdc")
+        sequential = eu.get_instance_metadata(
+            self.VERSION, retries=0, timeout=0.1)
+        concurrent = eu.get_instance_metadata(
+            self.VERSION, retries=0, timeout=0.1, max_workers=4)
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual(
+            {'ami': 'sdb', 'ephemeral0': 'sdc'},
+            concurrent['block-device-mapping'])
+
+
+class TestMetadataMaterializer(helpers.CiTestCase):
+
+    with_logs = True
+
+    base_url = 'http://169.254.169.254/latest/meta-data/'
+    tree = {
+        '': 'mac\nnetwork/\npublic-keys/\nfoo/\nfoo',
+        'mac': '06:17:04:d7:26:09',
+        'network/': 'interfaces/',
+        'network/interfaces/': 'macs/',
+        'network/interfaces/macs/': '06:17:04:d7:26:09/\n06:17:04:d7:26:08/',
+        'network/interfaces/macs/06:17:04:d7:26:09/': 'device-number\nvpc-id',
+        'network/interfaces/macs/06:17:04:d7:26:09/device-number': '0',
+        'network/interfaces/macs/06:17:04:d7:26:09/vpc-id': 'vpc-1',
+        'network/interfaces/macs/06:17:04:d7:26:08/': 'device-number',
+        'network/interfaces/macs/06:17:04:d7:26:08/device-number': '1',
+        'public-keys/': '0=my-key',
+        'public-keys/0/openssh-key': 'ssh-rsa AAAA my-key',
+        'foo/': 'bar',
+        'foo/bar': '{"baz": 1}',
+        'foo': 'duplicated leaf',
+    }
+
+    def _caller(self, url):
+        self.assertTrue(url.startswith(self.base_url))
+        return self.tree[url[len(self.base_url):]].encode('utf-8')
+
+    def test_concurrent_materialize_matches_sequential(self):
+        """max_workers produces the same dict shape and key order."""
+        sequential = eu.MetadataMaterializer(
+            self.tree[''], self.base_url, self._caller).materialize()
+        concurrent = eu.MetadataMaterializer(
+            self.tree[''], self.base_url, self._caller,
+            max_workers=3).materialize()
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual(list(sequential.keys()), list(concurrent.keys()))
+        macs = concurrent['network']['interfaces']['macs']
+        self.assertEqual(
+            ['06:17:04:d7:26:09', '06:17:04:d7:26:08'], list(macs.keys()))
+        self.assertEqual({'baz': 1}, concurrent['foo']['bar'])
+        self.assertEqual(
+            {'my-key': 'ssh-rsa AAAA my-key'}, concurrent['public-keys'])
+        self.assertIn(
+            'Duplicate key found in results from %s' % self.base_url,
+            self.logs.getvalue())
+
+    def test_concurrent_materialize_raises_on_fetch_failure(self):
+        """Errors from the caller propagate as in a sequential crawl."""
+
+        def caller(url):
+            if url.endswith('vpc-id'):
+                raise uh.UrlError('broken', code=500, url=url)
+            return self._caller(url)
+
+        materializer = eu.MetadataMaterializer(
+            self.tree[''], self.base_url, caller, max_workers=3)
+        with self.assertRaises(uh.UrlError):
+            materializer.materialize()
+
 # vi: ts=4 expandtab
@@ -1,8 +1,9 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 import cloudinit
 from cloudinit.config.schema import (
-    CLOUD_CONFIG_HEADER, SchemaValidationError, annotated_cloudconfig_file,
-    get_schema_doc, get_schema, validate_cloudconfig_file,
+    CLOUD_CONFIG_HEADER, SchemaValidationError, _get_validator,
+    annotated_cloudconfig_file, get_schema_doc, get_schema,
+    validate_cloudconfig_file, validate_cloudconfig_files,
     validate_cloudconfig_schema, main)
 from cloudinit.util import write_file
 
@@ -116,6 +117,21 @@ class ValidateCloudConfigSchemaTest(CiTestCase):
             "Cloud config schema errors: p1: '-1' is not a 'hostname'",
             str(context_mgr.exception))
 
+    @skipUnlessJsonSchema()
+    def test_validateconfig_schema_reuses_validator_per_schema(self):
+        """A validator is built once for each schema validated against."""
+        schema = {'properties': {'p1': {'type': 'string'}}}
+        validator = _get_validator(schema)
+        self.assertIs(validator, _get_validator(schema))
+        self.assertIsNot(validator, _get_validator(copy(schema)))
+        # The validator reads its schema as it validates
+        schema['properties']['p1']['type'] = 'integer'
+        with self.assertRaises(SchemaValidationError) as context_mgr:
+            validate_cloudconfig_schema({'p1': 'a'}, schema, strict=True)
+        self.assertEqual(
+            "Cloud config schema errors: p1: 'a' is not of type 'integer'",
+            str(context_mgr.exception))
+
 
 class TestCloudConfigExamples:
     schema = get_schema()
@@ -463,6 +479,27 @@ class TestMain:
         out, _err = capsys.readouterr()
         assert 'Valid cloud-config: {0}\n'.format(myyaml) == out
 
+    @pytest.mark.parametrize('jobs', ('1', '2'))
+    def test_main_validates_many_config_files(self, jobs, tmpdir, capsys):
+        """Each file is reported in order, main fails if any is invalid."""
+        paths = []
+        for (idx, content) in enumerate(
+                (b'#cloud-config\nntp:', b'#junk', b'#cloud-config\nntp:')):
+            path = tmpdir.join('my%d.yaml' % idx)
+            path.write(content)
+            paths.append(path.strpath)
+        myargs = ['mycmd', '--jobs', jobs, '--config-file'] + paths
+        with mock.patch('sys.argv', myargs):
+            with pytest.raises(SystemExit) as context_manager:
+                main()
+        assert 1 == context_manager.value.code
+        out, err = capsys.readouterr()
+        assert 'Valid cloud-config: {0}\nValid cloud-config: {1}\n'.format(
+            paths[0], paths[2]) == out
+        assert (
+            '{0}: Cloud config schema errors: format-l1.c1: File {0} needs'
+            ' to begin with "#cloud-config"\n'.format(paths[1])) == err
+
     @mock.patch('cloudinit.config.schema.read_cfg_paths')
     @mock.patch('cloudinit.config.schema.os.getuid', return_value=0)
     def test_main_validates_system_userdata(
@@ -493,6 +530,26 @@ class TestMain:
         assert expected == err
 
 
+class TestValidateCloudConfigFiles:
+
+    def test_annotated_output_returned_in_order(self, tmpdir):
+        """Annotations are returned rather than printed."""
+        valid = tmpdir.join('valid.yaml')
+        valid.write(b'#cloud-config\nntp:')
+        invalid = tmpdir.join('invalid.yaml')
+        invalid.write(b'#junk')
+        results = validate_cloudconfig_files(
+            [invalid.strpath, valid.strpath, tmpdir.join('absent').strpath],
+            annotate=True)
+        assert (True, None, '') == results[1]
+        (valid, message, output) = results[0]
+        assert (False, None) == (valid, message)
+        assert output.startswith('#junk\t\t# E1\n# Errors: -------------')
+        assert (
+            False, 'Configfile {0} does not exist'.format(
+                tmpdir.join('absent')), '') == results[2]
+
+
 class CloudTestsIntegrationTest(CiTestCase):
     """Validate all cloud-config yaml schema provided in integration tests.
 
@@ -2,13 +2,17 @@
 #
 # This file is part of cloud-init. See LICENSE file for license information.
 
+import json
+import os
+import time
 from unittest import mock
 
 from cloudinit import reporting
+from cloudinit import url_helper
 from cloudinit.reporting import events
 from cloudinit.reporting import handlers
 
-from cloudinit.tests.helpers import TestCase
+from cloudinit.tests.helpers import CiTestCase, TestCase
 
 
 def _fake_registry():
@@ -155,6 +159,70 @@ class TestLogHandler(TestCase):
                       getLogger.return_value.log.call_args[0][1])
 
 
+@mock.patch('cloudinit.reporting.handlers.url_helper.readurl')
+class TestWebHookHandler(CiTestCase):
+
+    endpoint = 'http://example.com/events'
+
+    def _posted(self, m_readurl):
+        return [json.loads(call[1]['data'])
+                for call in m_readurl.call_args_list]
+
+    def _event(self, name):
+        return events.ReportingEvent('start', name, 'description',
+                                     timestamp=1.0)
+
+    def test_events_posted_synchronously_by_default(self, m_readurl):
+        handler = handlers.WebHookHandler(self.endpoint)
+        self.assertIsNone(handler.q)
+        handler.publish_event(self._event('name1'))
+        self.assertEqual(self.endpoint, m_readurl.call_args[0][0])
+        self.assertEqual(
+            [self._event('name1').as_dict()], self._posted(m_readurl))
+
+    def test_events_batched_by_background_thread(self, m_readurl):
+        handler = handlers.WebHookHandler(
+            self.endpoint, max_batch_size=2, flush_interval=30)
+        for name in ('name1', 'name2', 'name3'):
+            handler.publish_event(self._event(name))
+        start = time.monotonic()
+        handler.flush()
+        # flush does not wait for the flush interval to expire
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertEqual(
+            [[self._event('name1').as_dict(), self._event('name2').as_dict()],
+             [self._event('name3').as_dict()]],
+            self._posted(m_readurl))
+
+    def test_batch_size_one_posts_single_objects(self, m_readurl):
+        handler = handlers.WebHookHandler(self.endpoint, max_batch_size=1)
+        handler.publish_event(self._event('name1'))
+        handler.flush()
+        self.assertEqual(
+            [self._event('name1').as_dict()], self._posted(m_readurl))
+
+    def test_failed_events_spooled_and_resent_first(self, m_readurl):
+        spool_file = self.tmp_path('webhook.spool')
+        m_readurl.side_effect = url_helper.UrlError('down')
+        handler = handlers.WebHookHandler(
+            self.endpoint, max_batch_size=5, spool_file=spool_file)
+        handler.publish_event(self._event('name1'))
+        handler.flush()
+        self.assertTrue(os.path.exists(spool_file))
+
+        m_readurl.reset_mock()
+        m_readurl.side_effect = None
+        handler = handlers.WebHookHandler(
+            self.endpoint, max_batch_size=5, spool_file=spool_file)
+        handler.publish_event(self._event('name2'))
+        handler.flush()
+        self.assertEqual(
+            [[self._event('name1').as_dict(),
+              self._event('name2').as_dict()]],
+            self._posted(m_readurl))
+        self.assertFalse(os.path.exists(spool_file))
+
+
 class TestDefaultRegisteredHandler(TestCase):
 
     def test_log_handler_registered_by_default(self):
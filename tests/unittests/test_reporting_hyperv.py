@@ -92,6 +92,105 @@ class TextKvpReporter(CiTestCase):
             full_description += msg_slice['msg']
         self.assertEqual(description, full_description)
 
+    def test_batch_interval_coalesces_events(self):
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, batch_interval=30)
+        for i in range(3):
+            reporter.publish_event(
+                events.ReportingEvent('foo', 'name%d' % i, 'description'))
+        start = time.monotonic()
+        reporter.flush()
+        # flush does not wait for the batch interval to expire
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertEqual(3, len(list(reporter._iterate_kvps(0))))
+        stats = reporter.stats()
+        self.assertEqual(1, stats['batches'])
+        self.assertEqual(3, stats['events'])
+        self.assertEqual(0, stats['queue_depth'])
+
+    @mock.patch('cloudinit.reporting.handlers.LOG')
+    def test_flush_logs_stats(self, m_log):
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path)
+        for i in range(2):
+            reporter.publish_event(
+                events.ReportingEvent('foo', 'name%d' % i, 'description'))
+        reporter.flush()
+        args = m_log.debug.call_args[0]
+        self.assertIn('wrote %d events in %d batches', args[0])
+        # events, then records written and reused
+        self.assertEqual(2, args[1])
+        self.assertEqual((2, 0), args[3:5])
+
+    def test_max_pool_records_reuses_own_oldest_slots(self):
+        foreign = {'key': 'other-agent', 'value': 'value1'}
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, max_pool_records=3)
+        util.write_file(
+            self.tmp_file_path,
+            reporter._encode_kvp_item(foreign['key'], foreign['value']),
+            omode='wb')
+        for i in range(5):
+            reporter.publish_event(
+                events.ReportingEvent('foo', 'name%d' % i, 'description'))
+            reporter.q.join()
+        kvps = list(reporter._iterate_kvps(0))
+        self.assertEqual(4, len(kvps))
+        self.assertEqual(foreign, kvps[0])
+        self.assertCountEqual(
+            ['name2', 'name3', 'name4'],
+            [json.loads(kvp['value'])['name'] for kvp in kvps[1:]])
+        stats = reporter.stats()
+        self.assertEqual(5, stats['records_written'])
+        self.assertEqual(2, stats['records_reused'])
+
+    def test_max_pool_records_counts_records_from_earlier_stages(self):
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, max_pool_records=2)
+        for i in range(2):
+            reporter.publish_event(
+                events.ReportingEvent('foo', 'name%d' % i, 'description'))
+        reporter.q.join()
+        reporter2 = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, max_pool_records=2)
+        reporter2.event_key_prefix = reporter.event_key_prefix
+        reporter2.publish_event(
+            events.ReportingEvent('foo', 'name2', 'description'))
+        reporter2.q.join()
+        kvps = list(reporter2._iterate_kvps(0))
+        self.assertEqual(
+            ['name2', 'name1'],
+            [json.loads(kvp['value'])['name'] for kvp in kvps])
+        self.assertEqual(1, reporter2.stats()['records_reused'])
+
+    def test_max_pool_records_reuses_oldest_after_earlier_stage_wrapped(self):
+        reporter = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, max_pool_records=3)
+        # Whole and fractional seconds, isoformat() drops zero microseconds
+        for i in range(5):
+            reporter.publish_event(events.ReportingEvent(
+                'foo', 'name%d' % i, 'description',
+                timestamp=1000.0 + i * 0.5))
+        reporter.q.join()
+        # The earlier stage wrapped, its newest record is not the last one
+        self.assertEqual(
+            ['name3', 'name4', 'name2'],
+            [json.loads(kvp['value'])['name']
+             for kvp in reporter._iterate_kvps(0)])
+        reporter2 = HyperVKvpReportingHandler(
+            kvp_file_path=self.tmp_file_path, max_pool_records=3)
+        reporter2.event_key_prefix = reporter.event_key_prefix
+        for i in range(5, 7):
+            reporter2.publish_event(events.ReportingEvent(
+                'foo', 'name%d' % i, 'description',
+                timestamp=1000.0 + i * 0.5))
+        reporter2.q.join()
+        self.assertEqual(
+            ['name6', 'name4', 'name5'],
+            [json.loads(kvp['value'])['name']
+             for kvp in reporter2._iterate_kvps(0)])
+        self.assertEqual(2, reporter2.stats()['records_reused'])
+
     def test_not_truncate_kvp_file_modified_after_boot(self):
         with open(self.tmp_file_path, "wb+") as f:
             kvp = {'key': 'key1', 'value': 'value1'}
@@ -5,6 +5,8 @@
 # This file is part of cloud-init. See LICENSE file for license information.
 
 from cloudinit.tests import helpers as test_helpers
+import os
+import stat
 import textwrap
 
 from cloudinit import templater
@@ -166,4 +168,69 @@ $a,$b'''
             ' template, reverting to the basic renderer.',
             self.logs.getvalue())
 
+
+@test_helpers.skipUnlessJinja()
+class TestJinjaTemplateCache(test_helpers.CiTestCase):
+
+    content = '## template: jinja\n{{ name }} {{ missing }}\n'
+
+    def setUp(self):
+        super(TestJinjaTemplateCache, self).setUp()
+        templater._compile_jinja.cache_clear()
+        self.addCleanup(templater._compile_jinja.cache_clear)
+        self.addCleanup(templater.set_jinja_bytecode_cache, None)
+        self.env = templater._get_jinja()
+
+    def test_template_compiled_once_per_process(self):
+        """Rendering the same content again reuses the compiled template."""
+        with test_helpers.mock.patch.object(
+                self.env, 'compile', wraps=self.env.compile) as m_compile:
+            self.assertEqual(
+                'a CI_MISSING_JINJA_VAR/missing\n',
+                templater.render_string(self.content, {'name': 'a'}))
+            self.assertEqual(
+                'b CI_MISSING_JINJA_VAR/missing\n',
+                templater.render_string(self.content, {'name': 'b'}))
+        self.assertEqual(1, m_compile.call_count)
+
+    def test_bytecode_shared_across_processes(self):
+        """With a bytecode cache, later processes do not compile again."""
+        cache_dir = self.tmp_path('jinja-cache')
+        templater.set_jinja_bytecode_cache(cache_dir)
+        templater.render_string(self.content, {'name': 'a'})
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(cache_dir).st_mode))
+        self.assertEqual(1, len(os.listdir(cache_dir)))
+        templater._compile_jinja.cache_clear()
+        with test_helpers.mock.patch.object(
+                self.env, 'compile', side_effect=AssertionError('compiled')):
+            self.assertEqual(
+                'b CI_MISSING_JINJA_VAR/missing\n',
+                templater.render_string(self.content, {'name': 'b'}))
+
+    def test_bytecode_cached_per_template(self):
+        """Each template rendered is served from its own cached bytecode."""
+        other = '## template: jinja\n{{ name }}!\n'
+        cache_dir = self.tmp_path('jinja-cache')
+        templater.set_jinja_bytecode_cache(cache_dir)
+        templater.render_string(self.content, {'name': 'a'})
+        templater.render_string(other, {'name': 'a'})
+        self.assertEqual(2, len(os.listdir(cache_dir)))
+        templater._compile_jinja.cache_clear()
+        with test_helpers.mock.patch.object(
+                self.env, 'compile', side_effect=AssertionError('compiled')):
+            self.assertEqual(
+                'b CI_MISSING_JINJA_VAR/missing\n',
+                templater.render_string(self.content, {'name': 'b'}))
+            self.assertEqual(
+                'b!\n', templater.render_string(other, {'name': 'b'}))
+
+    def test_unusable_bytecode_cache_ignored(self):
+        """Templates still render when the cache cannot be created."""
+        not_a_dir = self.tmp_path('file')
+        write_file(not_a_dir, '')
+        templater.set_jinja_bytecode_cache(os.path.join(not_a_dir, 'cache'))
+        self.assertEqual(
+            'a CI_MISSING_JINJA_VAR/missing\n',
+            templater.render_string(self.content, {'name': 'a'}))
+
 # vi: ts=4 expandtab
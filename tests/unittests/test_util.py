@@ -67,6 +67,32 @@ class TestGetCfgOptionListOrStr(helpers.TestCase):
         self.assertEqual([], result)
 
 
+class TestGetCfgOptionMaxWorkers(helpers.CiTestCase):
+
+    with_logs = True
+
+    def test_value_or_default(self):
+        """The configured count, or default when unset, is returned."""
+        self.assertEqual(4, util.get_cfg_option_max_workers(
+            {'workers': '4'}, 'workers'))
+        self.assertEqual(1, util.get_cfg_option_max_workers({}, 'workers'))
+        self.assertEqual(3, util.get_cfg_option_max_workers(
+            {}, 'workers', default=3))
+
+    def test_at_least_one_worker(self):
+        """Counts below 1 mean a single worker."""
+        self.assertEqual(1, util.get_cfg_option_max_workers(
+            {'workers': -2}, 'workers', default=3))
+
+    def test_invalid_value_warns_and_returns_default(self):
+        """A value which is not an int is logged and the default used."""
+        self.assertEqual(3, util.get_cfg_option_max_workers(
+            {'workers': 'many'}, 'workers', default=3))
+        self.assertIn(
+            "Config workers 'many' is not an int, using default '3'",
+            self.logs.getvalue())
+
+
 class TestWriteFile(helpers.TestCase):
     def setUp(self):
         super(TestWriteFile, self).setUp()